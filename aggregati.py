@@ -0,0 +1,354 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from app.dataset import registro
+from app.query import COLONNA_QUALITA, posizioni_indice
+from app.schema import DECIMALI, espandi, valori
+
+
+# Cubo di aggregati costruito una volta per versione del dataset:
+# somme prefisse (somma, somma dei quadrati, conteggio) per giorno e
+# somma/somma dei quadrati/conteggio per (anno, mese) di ogni colonna numerica.
+# I KPI di un periodo si ottengono in O(1) come differenza di prefissi.
+# Le colonne con al più 4 decimali sono accumulate come interi scalati: somme e medie
+# sono quelle esatte, e coincidono bit per bit con l'implementazione pandas più sotto,
+# che riporta le somme float64 alla stessa scala (somme_esatte). La deviazione
+# standard può differire da quella di pandas nelle ultime cifre (ordine dei calcoli).
+# Quando al dataset si accodano giorni successivi all'ultimo (registro.aggiungi)
+# il cubo della nuova versione si ottiene estendendo quello precedente.
+
+COLONNE_ESCLUSE = ['Campo']
+SCALE_DECIMALI = [1, 10, 100, 1000, 10000]
+LIMITE_INT64 = np.iinfo(np.int64).max
+
+
+def _rappresentabile(finiti, scala, massimo, n):
+    # I valori sono interi esatti nella scala e somme dei quadrati su n valori non trabocca
+    if (massimo * scala) ** 2 * n >= LIMITE_INT64:
+        return False
+    return np.array_equal(np.round(finiti * scala) / scala, finiti)
+
+
+def _scala_intera(valori):
+    # Restituisce la scala 10^k che rende interi i valori (senza perdita), oppure None
+    finiti = valori[np.isfinite(valori)]
+    if len(finiti) == 0:
+        return None
+    massimo = np.abs(finiti).max()
+    for scala in SCALE_DECIMALI:
+        if (massimo * scala) ** 2 * len(finiti) >= LIMITE_INT64:
+            return None
+        if _rappresentabile(finiti, scala, massimo, len(finiti)):
+            return scala
+    return None
+
+
+def _inizi_blocchi(chiavi):
+    # Posizioni in cui cambia il valore di una sequenza ordinata
+    return np.flatnonzero(np.r_[True, chiavi[1:] != chiavi[:-1]]) if len(chiavi) else np.array([], int)
+
+
+class _Accumulatore:
+    # Somme prefisse per giorno e aggregati per mese di una singola colonna
+    def __init__(self, valori, inizio_giorni, inizio_mesi):
+        self.scala = _scala_intera(valori)
+        finiti = valori[np.isfinite(valori)]
+        self.n = len(finiti)
+        self.massimo = np.abs(finiti).max() if len(finiti) else 0.0
+        x, conteggi = self._interi(valori)
+        giorno_somma, giorno_quadrati, giorno_conteggi = self._per_blocco(x, conteggi, inizio_giorni)
+        self.prefisso_somma = self._prefisso(giorno_somma)
+        self.prefisso_quadrati = self._prefisso(giorno_quadrati)
+        self.prefisso_conteggi = self._prefisso(giorno_conteggi)
+        self.mese_somma, self.mese_quadrati, self.mese_conteggi = self._per_blocco(x, conteggi, inizio_mesi)
+
+    def _interi(self, valori):
+        validi = np.isfinite(valori)
+        if self.scala is None:
+            return np.where(validi, valori, 0.0), validi.astype(np.int64)
+        return np.where(validi, np.round(valori * self.scala), 0).astype(np.int64), validi.astype(np.int64)
+
+    @staticmethod
+    def _per_blocco(x, conteggi, inizi):
+        return np.add.reduceat(x, inizi), np.add.reduceat(x * x, inizi), np.add.reduceat(conteggi, inizi)
+
+    @staticmethod
+    def _prefisso(valori):
+        return np.concatenate([np.zeros(1, dtype=valori.dtype), np.cumsum(valori)])
+
+    @staticmethod
+    def _accoda_prefisso(prefisso, valori):
+        return np.concatenate([prefisso, prefisso[-1] + np.cumsum(valori)])
+
+    @staticmethod
+    def _accoda_mesi(mesi, nuovi, primo_aperto):
+        # Con primo_aperto il primo mese nuovo completa l'ultimo mese esistente
+        if not primo_aperto:
+            return np.concatenate([mesi, nuovi])
+        return np.concatenate([mesi[:-1], mesi[-1:] + nuovi[:1], nuovi[1:]])
+
+    def estendi(self, valori, inizio_giorni, inizio_mesi, primo_aperto):
+        # Accumulatore con i valori dei giorni accodati; None se il risultato non sarebbe
+        # identico a una ricostruzione completa (scala intera diversa)
+        finiti = valori[np.isfinite(valori)]
+        if self.n == 0:
+            return None
+        massimo = max(self.massimo, np.abs(finiti).max() if len(finiti) else 0.0)
+        if self.scala is not None and not _rappresentabile(finiti, self.scala, massimo, self.n + len(finiti)):
+            return None
+        x, conteggi = self._interi(valori)
+        giorno_somma, giorno_quadrati, giorno_conteggi = self._per_blocco(x, conteggi, inizio_giorni)
+        mese_somma, mese_quadrati, mese_conteggi = self._per_blocco(x, conteggi, inizio_mesi)
+        esteso = copy.copy(self)
+        esteso.n, esteso.massimo = self.n + len(finiti), massimo
+        esteso.prefisso_somma = self._accoda_prefisso(self.prefisso_somma, giorno_somma)
+        esteso.prefisso_quadrati = self._accoda_prefisso(self.prefisso_quadrati, giorno_quadrati)
+        esteso.prefisso_conteggi = self._accoda_prefisso(self.prefisso_conteggi, giorno_conteggi)
+        esteso.mese_somma = self._accoda_mesi(self.mese_somma, mese_somma, primo_aperto)
+        esteso.mese_quadrati = self._accoda_mesi(self.mese_quadrati, mese_quadrati, primo_aperto)
+        esteso.mese_conteggi = self._accoda_mesi(self.mese_conteggi, mese_conteggi, primo_aperto)
+        return esteso
+
+    def intervallo(self, i, j):
+        # (somma, somma dei quadrati, conteggio) sui giorni [i, j), nella scala interna
+        return (self.prefisso_somma[j] - self.prefisso_somma[i],
+                self.prefisso_quadrati[j] - self.prefisso_quadrati[i],
+                self.prefisso_conteggi[j] - self.prefisso_conteggi[i])
+
+    def somma(self, s):
+        return s / self.scala if self.scala else float(s)
+
+    def media(self, s, n):
+        if n == 0:
+            return np.nan
+        return s / self.scala / n if self.scala else s / n
+
+    def deviazione_standard(self, s, q, n):
+        # Varianza campionaria (ddof=1) come in pandas
+        if n < 2:
+            return np.nan
+        if self.scala:
+            numeratore = int(n) * int(q) - int(s) * int(s)
+            return float(np.sqrt(max(numeratore, 0) / (int(n) * (int(n) - 1)))) / self.scala
+        return float(np.sqrt(max((q - s * s / n) / (n - 1), 0.0)))
+
+
+class CuboAggregati:
+    def __init__(self, df):
+        colonne = [c for c in df.select_dtypes('number').columns if c not in COLONNE_ESCLUSE]
+        giorni = df.index.normalize().asi8
+        self.giorni = pd.DatetimeIndex(np.unique(giorni))
+        inizio_giorni = _inizi_blocchi(giorni)
+        # Mesi di calendario come blocchi contigui di giorni
+        primo_giorno_mese = _inizi_blocchi(_chiave_mese(self.giorni))
+        self.confini_mesi = np.r_[primo_giorno_mese, len(self.giorni)]
+        self.mese_num = np.asarray(self.giorni.month[primo_giorno_mese])
+        inizio_mesi = inizio_giorni[primo_giorno_mese]
+        self.colonne = {
+            colonna: _Accumulatore(valori(df[colonna]), inizio_giorni, inizio_mesi)
+            for colonna in colonne
+        } if len(giorni) else {}
+        qualita = espandi(df, [COLONNA_QUALITA])[COLONNA_QUALITA] if COLONNA_QUALITA in df.columns \
+            else pd.Series(dtype=float)
+        self.qualita_min = qualita.min()
+        self.qualita_max = qualita.max()
+
+    def estendi(self, df, nuove):
+        # Cubo della versione con le righe `nuove` accodate (tutte in giorni successivi
+        # all'ultimo del cubo): solo le nuove righe vengono aggregate. None se serve
+        # una ricostruzione completa.
+        colonne = [c for c in nuove.select_dtypes('number').columns if c not in COLONNE_ESCLUSE]
+        if not self.colonne or not len(nuove) or set(colonne) != set(self.colonne):
+            return None
+        giorni = nuove.index.normalize().asi8
+        nuovi_giorni = pd.DatetimeIndex(np.unique(giorni))
+        if nuovi_giorni[0] <= self.giorni[-1]:
+            return None
+        inizio_giorni = _inizi_blocchi(giorni)
+        chiave_mese = _chiave_mese(nuovi_giorni)
+        primo_giorno_mese = _inizi_blocchi(chiave_mese)
+        primo_aperto = chiave_mese[0] == _chiave_mese(self.giorni[-1:])[0]
+        colonne_estese = {}
+        for colonna, accumulatore in self.colonne.items():
+            esteso = accumulatore.estendi(valori(nuove[colonna]), inizio_giorni,
+                                          inizio_giorni[primo_giorno_mese], primo_aperto)
+            if esteso is None:
+                return None
+            colonne_estese[colonna] = esteso
+        cubo = copy.copy(self)
+        cubo.colonne = colonne_estese
+        cubo.giorni = self.giorni.append(nuovi_giorni)
+        nuovi_mesi = slice(1, None) if primo_aperto else slice(None)
+        cubo.confini_mesi = np.r_[self.confini_mesi[:-1], primo_giorno_mese[nuovi_mesi] + len(self.giorni),
+                                  len(cubo.giorni)]
+        cubo.mese_num = np.r_[self.mese_num, np.asarray(nuovi_giorni.month[primo_giorno_mese])[nuovi_mesi]]
+        qualita = espandi(nuove, [COLONNA_QUALITA])[COLONNA_QUALITA] if COLONNA_QUALITA in nuove.columns \
+            else pd.Series(dtype=float)
+        cubo.qualita_min = pd.Series([self.qualita_min, qualita.min()]).min()
+        cubo.qualita_max = pd.Series([self.qualita_max, qualita.max()]).max()
+        return cubo
+
+    def supporta(self, inizio=None, fine=None, qualita=None):
+        # Il cubo lavora a giornate intere e senza filtro sulla qualità del suolo
+        for limite in (inizio, fine):
+            if limite is not None and pd.Timestamp(limite) != pd.Timestamp(limite).normalize():
+                return False
+        if qualita is not None:
+            q_min, q_max = qualita
+            if q_min > self.qualita_min or q_max < self.qualita_max:
+                return False
+        return bool(self.colonne)
+
+    def _posizioni(self, inizio, fine):
+        return posizioni_indice(self.giorni, inizio, fine)
+
+    def somma(self, colonna, inizio=None, fine=None):
+        accumulatore = self.colonne[colonna]
+        s, _, _ = accumulatore.intervallo(*self._posizioni(inizio, fine))
+        return accumulatore.somma(s)
+
+    def media(self, colonna, inizio=None, fine=None):
+        accumulatore = self.colonne[colonna]
+        s, _, n = accumulatore.intervallo(*self._posizioni(inizio, fine))
+        return accumulatore.media(s, n)
+
+    def deviazione_standard(self, colonna, inizio=None, fine=None):
+        accumulatore = self.colonne[colonna]
+        return accumulatore.deviazione_standard(*accumulatore.intervallo(*self._posizioni(inizio, fine)))
+
+    def kpi(self, inizio=None, fine=None):
+        somme = {c: self.somma(c, inizio, fine) if c in self.colonne else 0
+                 for c in ['Quantità raccolto (kg)', 'Profitto stimato (€)',
+                           'Costo produzione (€)', 'Costo irrigazione (€)']}
+        medie = {c: self.media(c, inizio, fine)
+                 for c in ['Temperatura (°C)', 'Precipitazioni (mm)', 'Qualità suolo (%)']}
+        return completa_kpi(somme, medie)
+
+    def _aggregati_mensili(self, colonna, inizio, fine):
+        # (MeseNum, somma, quadrati, conteggio) per i mesi del periodo:
+        # mesi interi dal cubo, mesi di bordo dalle somme prefisse
+        accumulatore = self.colonne[colonna]
+        i, j = self._posizioni(inizio, fine)
+        righe = []
+        for k in range(len(self.mese_num)):
+            a, b = max(self.confini_mesi[k], i), min(self.confini_mesi[k + 1], j)
+            if a >= b:
+                continue
+            if a == self.confini_mesi[k] and b == self.confini_mesi[k + 1]:
+                valori = (accumulatore.mese_somma[k], accumulatore.mese_quadrati[k], accumulatore.mese_conteggi[k])
+            else:
+                valori = accumulatore.intervallo(a, b)
+            righe.append((int(self.mese_num[k]),) + tuple(int(v) if accumulatore.scala else float(v) for v in valori))
+        mesi = {}
+        for mese, s, q, n in righe:
+            precedente = mesi.get(mese, (0, 0, 0))
+            mesi[mese] = (precedente[0] + s, precedente[1] + q, precedente[2] + n)
+        return accumulatore, {mese: valori for mese, valori in sorted(mesi.items()) if valori[2] > 0}
+
+    def statistiche_mensili(self, colonna, inizio=None, fine=None):
+        accumulatore, mesi = self._aggregati_mensili(colonna, inizio, fine)
+        return pd.DataFrame({
+            'MeseNum': np.array(list(mesi), dtype=np.int32),
+            'mean': [accumulatore.media(s, n) for s, q, n in mesi.values()],
+            'std': [accumulatore.deviazione_standard(s, q, n) for s, q, n in mesi.values()],
+        })
+
+    def medie_mensili(self, colonne, inizio=None, fine=None):
+        risultato = None
+        for colonna in colonne:
+            accumulatore, mesi = self._aggregati_mensili(colonna, inizio, fine)
+            medie = pd.DataFrame({
+                'MeseNum': np.array(list(mesi), dtype=np.int32),
+                colonna: [accumulatore.media(s, n) for s, q, n in mesi.values()],
+            })
+            risultato = medie if risultato is None else risultato.merge(medie, on='MeseNum', how='outer')
+        return risultato
+
+
+def _chiave_mese(giorni):
+    return np.asarray(giorni.year * 12 + giorni.month - 1)
+
+
+def cubo_aggregati(riferimento):
+    # Un cubo per versione del dataset, conservato dal registro insieme al DataFrame
+    return registro.derivato(riferimento, 'cubo_aggregati', CuboAggregati)
+
+
+def completa_kpi(somme, medie):
+    # KPI derivati comuni al percorso pandas e al cubo
+    produzione_totale = somme['Quantità raccolto (kg)']
+    profitto_totale = somme['Profitto stimato (€)']
+    costo_totale = somme['Costo produzione (€)'] + somme['Costo irrigazione (€)']
+    # Costo medio per kg
+    costo_medio_kg = costo_totale / produzione_totale if produzione_totale > 0 else 0
+    # Ricavi totali = Profitto + Costi
+    ricavi_totali = profitto_totale + costo_totale
+    margine_netto = (profitto_totale / ricavi_totali) * 100 if ricavi_totali != 0 else 0
+    return {
+        'produzione_totale': produzione_totale,
+        'profitto_totale': profitto_totale,
+        'temperatura_media': medie['Temperatura (°C)'],
+        'precipitazioni_medie': medie['Precipitazioni (mm)'],
+        'qualita_media': medie['Qualità suolo (%)'],
+        'costo_totale': costo_totale,
+        'costo_medio_kg': costo_medio_kg,
+        'margine_netto': margine_netto,
+    }
+
+
+# ---- Implementazione di riferimento con pandas (usata con il filtro qualità attivo) ----
+
+def _scala_somme(serie):
+    # Scala 10^k in cui i valori sono interi: prima quella dei decimali dello schema (un solo
+    # controllo per le colonne note), altrimenti la più piccola come nel cubo; None se non c'è
+    numeri = serie.to_numpy(dtype=np.float64)
+    if serie.name in DECIMALI:
+        finiti = numeri[np.isfinite(numeri)]
+        scala = 10 ** DECIMALI[serie.name]
+        if np.array_equal(np.round(finiti * scala) / scala, finiti):
+            return scala
+    return _scala_intera(numeri)
+
+
+def somme_esatte(somme, serie):
+    # Somme float64 di valori di `serie` riportate alla somma esatta (arrotondata una sola
+    # volta a float64) quando i valori sono interi in una scala 10^k, come nel cubo
+    scala = _scala_somme(serie)
+    return np.round(somme * scala) / scala if scala else somme
+
+
+def _media_esatta(serie):
+    n = serie.count()
+    return somme_esatte(serie.sum(), serie) / n if n else np.nan
+
+
+def _medie_per_mese(df_filtrato, colonna, mese):
+    gruppi = df_filtrato.groupby(mese)[colonna]
+    return somme_esatte(gruppi.sum(), df_filtrato[colonna]) / gruppi.count()
+
+
+def kpi_dataframe(df_filtrato):
+    # Somme e medie sui valori float64 esatti anche se il DataFrame usa lo schema compatto
+    df_filtrato = espandi(df_filtrato)
+    somme = {c: somme_esatte(df_filtrato[c].sum(), df_filtrato[c]) if c in df_filtrato.columns else 0
+             for c in ['Quantità raccolto (kg)', 'Profitto stimato (€)',
+                       'Costo produzione (€)', 'Costo irrigazione (€)']}
+    medie = {c: _media_esatta(df_filtrato[c])
+             for c in ['Temperatura (°C)', 'Precipitazioni (mm)', 'Qualità suolo (%)']}
+    return completa_kpi(somme, medie)
+
+
+def statistiche_mensili_dataframe(df_filtrato, colonna):
+    df_filtrato = espandi(df_filtrato, [colonna])
+    mese = df_filtrato['Data'].dt.month.rename('MeseNum')
+    statistiche = df_filtrato.groupby(mese)[colonna].agg(['mean', 'std'])
+    statistiche['mean'] = _medie_per_mese(df_filtrato, colonna, mese)
+    return statistiche.reset_index()
+
+
+def medie_mensili_dataframe(df_filtrato, colonne):
+    df_filtrato = espandi(df_filtrato, colonne)
+    mese = df_filtrato['Data'].dt.month.rename('MeseNum')
+    return pd.DataFrame({colonna: _medie_per_mese(df_filtrato, colonna, mese) for colonna in colonne}).reset_index()
@@ -0,0 +1,119 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from app.dataset import registro
+from app.query import COLONNA_QUALITA
+from app.schema import espandi, valori
+
+
+# Regole degli alert condivise dal generatore dei dati e dalla dashboard:
+# le stesse maschere producono la colonna 'Alert' e i conteggi per categoria.
+ALERT_PER_PAGINA = 50
+ATTENZIONE = 'Attenzione'
+OK = 'OK'
+
+COLONNE_ALERT = {
+    'temperatura': 'Temperatura (°C)',
+    'umidita': 'Umidità suolo (%)',
+    'qualita': 'Qualità suolo (%)',
+    'ph': 'pH suolo',
+    'vento': 'Velocità vento (m/s)',
+}
+
+CATEGORIE_ALERT = {
+    'temperatura': 'Temperatura',
+    'ph': 'pH',
+    'vento': 'Vento',
+    'umidita': 'Umidità',
+    'suolo': 'Suolo',
+}
+
+RiepilogoAlert = namedtuple('RiepilogoAlert', ['testi', 'conteggi'])
+
+
+def maschere_alert(temperatura, umidita, qualita, ph, vento):
+    # Una maschera per categoria; l'alert scatta se almeno una è vera.
+    # Gli eventi estremi (< 2°C o > 35°C, pH fuori range, vento > 8 m/s)
+    # ricadono nelle categorie temperatura, pH e vento.
+    return {
+        'temperatura': (temperatura < 10) | (temperatura > 35),
+        'ph': (ph < 5.8) | (ph > 7.8),
+        'vento': vento > 8,
+        'umidita': umidita < 45,
+        'suolo': qualita < 70,
+    }
+
+
+def alert_da_maschere(maschere):
+    return np.where(np.logical_or.reduce(list(maschere.values())), ATTENZIONE, OK)
+
+
+def maschere_dataframe(df):
+    return maschere_alert(**{nome: valori(df[colonna]) for nome, colonna in COLONNE_ALERT.items()})
+
+
+def testi_alert(df_alert):
+    # Formattazione vettoriale (per colonna) delle righe di alert, con i valori float64
+    df_alert = espandi(df_alert, ['Alert', 'Temperatura (°C)', 'Precipitazioni (mm)', 'Qualità suolo (%)'])
+    testi = (df_alert['Data'].dt.strftime('%Y-%m-%d') + ': ' + df_alert['Alert'].astype(str) +
+             ' (Temp: ' + df_alert['Temperatura (°C)'].astype(str) +
+             '°C, Prec: ' + df_alert['Precipitazioni (mm)'].astype(str) +
+             ' mm, Qualità: ' + df_alert['Qualità suolo (%)'].astype(str) + '%)')
+    return testi.to_numpy()
+
+
+def riepilogo_alert(df_filtrato):
+    maschere = maschere_dataframe(df_filtrato)
+    conteggi = {categoria: int(maschera.sum()) for categoria, maschera in maschere.items()}
+    return RiepilogoAlert(testi_alert(df_filtrato[df_filtrato['Alert'] != OK]), conteggi)
+
+
+class ContatoreAlert:
+    # Conteggi cumulativi per riga di ogni categoria: i conteggi di un periodo sono
+    # differenze di prefissi; una versione con righe accodate estende i prefissi
+    def __init__(self, df):
+        self.prefissi = {categoria: self._prefisso(maschera)
+                         for categoria, maschera in maschere_dataframe(df).items()}
+        qualita = valori(df[COLONNA_QUALITA])
+        self.qualita_min = np.nanmin(qualita) if len(qualita) else np.nan
+        self.qualita_max = np.nanmax(qualita) if len(qualita) else np.nan
+
+    @staticmethod
+    def _prefisso(maschera, base=0):
+        return np.concatenate([[base], base + np.cumsum(maschera, dtype=np.int64)])
+
+    def supporta(self, qualita=None):
+        # Senza filtro qualità che escluda righe, come il cubo di aggregati
+        if qualita is None:
+            return True
+        q_min, q_max = qualita
+        return q_min <= self.qualita_min and q_max >= self.qualita_max
+
+    def conteggi(self, i, j):
+        return {categoria: int(prefisso[j] - prefisso[i]) for categoria, prefisso in self.prefissi.items()}
+
+    def estendi(self, df, nuove):
+        esteso = ContatoreAlert.__new__(ContatoreAlert)
+        esteso.prefissi = {categoria: np.concatenate([self.prefissi[categoria],
+                                                      self._prefisso(maschera, self.prefissi[categoria][-1])[1:]])
+                           for categoria, maschera in maschere_dataframe(nuove).items()}
+        qualita = valori(nuove[COLONNA_QUALITA])
+        esteso.qualita_min = pd.Series([self.qualita_min, *qualita]).min()
+        esteso.qualita_max = pd.Series([self.qualita_max, *qualita]).max()
+        return esteso
+
+
+def contatore_alert(riferimento):
+    return registro.derivato(riferimento, 'contatore_alert', ContatoreAlert)
+
+
+def numero_pagine(testi, per_pagina=ALERT_PER_PAGINA):
+    return max(1, -(-len(testi) // per_pagina))
+
+
+def pagina_alert(testi, pagina, per_pagina=ALERT_PER_PAGINA):
+    # Solo la finestra visibile; pagina numerata da 1
+    pagina = min(max(pagina or 1, 1), numero_pagine(testi, per_pagina))
+    return testi[(pagina - 1) * per_pagina:pagina * per_pagina]
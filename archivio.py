@@ -0,0 +1,235 @@
+import argparse
+import os
+import re
+import uuid
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from app.config import MAX_GIORNI_FINESTRA
+from app.dataset import registro
+from app.query import COLONNA_DATA, _limite_fine
+from app.schema import compatta
+from app.utils import genera_dati_a_blocchi
+
+
+# Archivio storico su disco: un file Arrow IPC (Feather v2, non compresso) con le stesse
+# colonne del generatore, ordinato per data e scritto a record batch. Viene aperto in
+# memory-map: all'avvio si legge solo il footer, le pagine sono condivise tra i worker
+# tramite la cache del sistema operativo e un periodo si estrae con searchsorted sulla
+# colonna 'Data' mappata, materializzando soltanto le righe richieste.
+# Nel registro l'archivio compare come finestre di giorni (id 'archivio-AAAAMMGG-AAAAMMGG'):
+# ogni worker le legge dal file alla prima richiesta, senza copie nella cartella condivisa.
+_ID_FINESTRA = re.compile(r"archivio-(\d{8})-(\d{8})")
+
+class Archivio:
+    def __init__(self, percorso):
+        import pyarrow as pa
+
+        self.percorso = percorso
+        self._tabella = pa.ipc.open_file(pa.memory_map(percorso)).read_all()
+        # Viste datetime64 (senza copia) sulle date di ogni record batch non vuoto
+        blocchi = [(inizio, blocco) for inizio, blocco in self._blocchi_date() if len(blocco)]
+        self._inizi = np.array([inizio for inizio, _ in blocchi], dtype=np.int64)
+        self._date = [blocco for _, blocco in blocchi]
+        self._ultime = np.array([blocco[-1] for blocco in self._date], dtype='datetime64[ns]')
+
+    def _blocchi_date(self):
+        inizio = 0
+        for blocco in self._tabella.column(COLONNA_DATA).chunks:
+            yield inizio, blocco.to_numpy()
+            inizio += len(blocco)
+
+    def __len__(self):
+        return self._tabella.num_rows
+
+    @property
+    def colonne(self):
+        return self._tabella.column_names
+
+    def periodo(self):
+        if not self._date:
+            return None, None
+        return pd.Timestamp(self._date[0][0]), pd.Timestamp(self._date[-1][-1])
+
+    def _posizione(self, istante, lato):
+        # Prima riga con data >= istante (lato 'left') o > istante (lato 'right')
+        k = self._ultime.searchsorted(istante, side=lato)
+        if k == len(self._date):
+            return len(self)
+        return int(self._inizi[k] + self._date[k].searchsorted(istante, side=lato))
+
+    def posizioni(self, inizio=None, fine=None):
+        i = 0 if inizio is None else self._posizione(np.datetime64(pd.Timestamp(inizio)), 'left')
+        j = len(self) if fine is None else self._posizione(np.datetime64(_limite_fine(fine)), 'right')
+        return i, max(i, j)
+
+    def leggi(self, inizio=None, fine=None):
+        # DataFrame del periodo, indicizzato per data come quelli del registro
+        i, j = self.posizioni(inizio, fine)
+        df = self._tabella.slice(i, j - i).to_pandas(split_blocks=True)
+        df.index = pd.DatetimeIndex(df[COLONNA_DATA])
+        df.index.name = None
+        return df
+
+
+@lru_cache(maxsize=4)
+def apri_archivio(percorso):
+    return Archivio(percorso)
+
+
+def carica_archivio(percorso, giorni=None):
+    # Ultimi `giorni` giorni dell'archivio (tutto lo storico se giorni è None o 0)
+    archivio = apri_archivio(percorso)
+    _, ultimo = archivio.periodo()
+    if not giorni or ultimo is None:
+        return archivio.leggi()
+    return archivio.leggi(inizio=ultimo.normalize() - pd.Timedelta(days=giorni - 1))
+
+
+def riferimento_finestra(inizio, fine):
+    return {"id": f"archivio-{pd.Timestamp(inizio):%Y%m%d}-{pd.Timestamp(fine):%Y%m%d}", "versione": 1}
+
+
+def giorni_finestra(riferimento):
+    # (primo, ultimo giorno) di una finestra dell'archivio, None per gli altri dataset
+    corrispondenza = _ID_FINESTRA.fullmatch(str(riferimento["id"]))
+    if corrispondenza is None:
+        return None
+    try:
+        return tuple(pd.Timestamp(giorno) for giorno in corrispondenza.groups())
+    except ValueError:
+        return None
+
+
+def finestra_consentita(giorni):
+    # Finestra con date valide, in ordine e non più lunga di MAX_GIORNI_FINESTRA giorni
+    return giorni is not None and giorni[0] <= giorni[1] and (giorni[1] - giorni[0]).days < MAX_GIORNI_FINESTRA
+
+
+def _primo_giorno(inizio, fine):
+    # Inizio del periodo limitato agli ultimi MAX_GIORNI_FINESTRA giorni fino a `fine`
+    return max(inizio, fine - pd.Timedelta(days=MAX_GIORNI_FINESTRA - 1))
+
+
+class FinestreArchivio:
+    # Sorgente del registro: la prima versione di una finestra si ricostruisce dall'id
+    def __init__(self, percorso):
+        self.percorso = percorso
+
+    def __eq__(self, altro):
+        return isinstance(altro, FinestreArchivio) and altro.percorso == self.percorso
+
+    def __call__(self, riferimento):
+        giorni = giorni_finestra(riferimento)
+        if not finestra_consentita(giorni) or riferimento["versione"] != 1:
+            return None
+        return apri_archivio(self.percorso).leggi(*giorni)
+
+
+def collega_archivio(percorso):
+    # Le finestre dell'archivio diventano dataset del registro (in ogni worker)
+    registro.registra_sorgente(FinestreArchivio(percorso))
+
+
+def finestra_iniziale(percorso, giorni=None):
+    # Riferimento agli ultimi `giorni` giorni dell'archivio (tutto lo storico se giorni è
+    # None o 0, entro MAX_GIORNI_FINESTRA), letti dal registro solo quando vengono richiesti
+    primo, ultimo = apri_archivio(percorso).periodo()
+    if giorni:
+        primo = max(primo, ultimo.normalize() - pd.Timedelta(days=giorni - 1))
+    return riferimento_finestra(_primo_giorno(primo.normalize(), ultimo.normalize()), ultimo)
+
+
+def riferimento_periodo(riferimento, percorso, inizio=None, fine=None):
+    # Finestra dell'archivio con il periodo richiesto, se esce dai giorni della finestra
+    # caricata; altrimenti il riferimento invariato (stesse cache)
+    giorni = giorni_finestra(riferimento) if riferimento else None
+    if giorni is None or inizio is None or fine is None:
+        return riferimento
+    primo, ultimo = apri_archivio(percorso).periodo()
+    fine = min(pd.Timestamp(fine).normalize(), ultimo.normalize())
+    inizio = _primo_giorno(max(pd.Timestamp(inizio).normalize(), primo.normalize()), fine)
+    if inizio >= giorni[0] and (fine <= giorni[1] or riferimento["versione"] != 1):
+        return riferimento
+    if inizio > fine:
+        return riferimento
+    return riferimento_finestra(inizio, fine)
+
+
+def riferimento_storico(riferimento, percorso, fine, giorni=None):
+    # Finestra con lo storico della previsione: i `giorni` giorni fino a `fine` (tutto
+    # l'archivio fino a `fine` se giorni è None o 0), o il riferimento se già li contiene
+    if fine is None:
+        return riferimento
+    primo, _ = apri_archivio(percorso).periodo()
+    inizio = pd.Timestamp(fine).normalize() - pd.Timedelta(days=giorni - 1) if giorni else primo
+    return riferimento_periodo(riferimento, percorso, max(inizio, primo.normalize()), fine)
+
+
+def scrivi_archivio(percorso, blocchi):
+    # Scrive i DataFrame di `blocchi` (in ordine di data) come record batch di un unico
+    # file, nello schema compatto del primo blocco; scrittura atomica con rename
+    import pyarrow as pa
+
+    cartella = os.path.dirname(percorso)
+    if cartella:
+        os.makedirs(cartella, exist_ok=True)
+    temporaneo = f"{percorso}.{uuid.uuid4().hex}.tmp"
+    schema = scrittore = ultima = None
+    righe = 0
+    try:
+        for blocco in blocchi:
+            blocco = compatta(blocco.sort_values(COLONNA_DATA, kind='mergesort').reset_index(drop=True))
+            if not len(blocco):
+                continue
+            if ultima is not None and blocco[COLONNA_DATA].iloc[0] < ultima:
+                raise ValueError("i blocchi dell'archivio devono essere in ordine di data")
+            tabella = pa.Table.from_pandas(blocco, preserve_index=False)
+            if scrittore is None:
+                schema = tabella.schema
+                scrittore = pa.ipc.new_file(temporaneo, schema)
+            elif not tabella.schema.equals(schema):
+                raise ValueError("blocco non rappresentabile nello schema dell'archivio")
+            scrittore.write_table(tabella)
+            ultima = blocco[COLONNA_DATA].iloc[-1]
+            righe += len(blocco)
+        if scrittore is None:
+            raise ValueError("nessuna riga da scrivere nell'archivio")
+        scrittore.close()
+        os.replace(temporaneo, percorso)
+    finally:
+        if os.path.exists(temporaneo):
+            os.remove(temporaneo)
+    apri_archivio.cache_clear()
+    return righe
+
+
+def _blocchi_per_periodo(**parametri):
+    # I chunk della simulazione relativi allo stesso intervallo di date riuniti in un blocco
+    corrente = []
+    for chunk in genera_dati_a_blocchi(**parametri):
+        if corrente and chunk[COLONNA_DATA].iloc[0] != corrente[0][COLONNA_DATA].iloc[0]:
+            yield pd.concat(corrente, ignore_index=True)
+            corrente = []
+        corrente.append(chunk)
+    if corrente:
+        yield pd.concat(corrente, ignore_index=True)
+
+
+def crea_archivio(percorso, **parametri):
+    # Archivio simulato (parametri di genera_dati) scritto chunk per chunk
+    return scrivi_archivio(percorso, _blocchi_per_periodo(**parametri))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Crea un archivio storico simulato (Arrow IPC)")
+    parser.add_argument("percorso", help="file di destinazione (.arrow)")
+    parser.add_argument("--inizio", default="2015-01-01")
+    parser.add_argument("--fine", default="2024-12-31")
+    parser.add_argument("--campi", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    righe = crea_archivio(args.percorso, inizio=args.inizio, fine=args.fine, n_campi=args.campi, seed=args.seed)
+    print(f"{righe} righe scritte in {args.percorso}")
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from app.config import CACHE_ARTEFATTI_MB, CARTELLA_CONDIVISA
+from app.dataset import scrivi_atomico, pota_cartella
+
+
+# Cache indirizzata per contenuto degli artefatti generati (immagini dei grafici, PDF):
+# la chiave è l'impronta SHA-256 dei dati e dei parametri da cui l'artefatto dipende,
+# quindi lo stesso contenuto viene riusato anche tra versioni diverse del dataset.
+
+def impronta(*parti):
+    h = hashlib.sha256()
+    for parte in parti:
+        if isinstance(parte, pd.DataFrame):
+            h.update(repr(list(zip(parte.columns, map(str, parte.dtypes)))).encode())
+            h.update(pd.util.hash_pandas_object(parte, index=False).to_numpy().tobytes())
+        elif isinstance(parte, dict):
+            h.update(repr(sorted((k, repr(v)) for k, v in parte.items())).encode())
+        else:
+            h.update(repr(parte).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _cartella_artefatti(cartella_condivisa):
+    return os.path.join(cartella_condivisa, "artefatti") if cartella_condivisa else None
+
+
+class CacheArtefatti:
+    # LRU limitata dalla dimensione totale in byte; con una cartella condivisa gli
+    # artefatti sono scritti anche su disco e visibili a tutti i worker WSGI
+    def __init__(self, max_byte=CACHE_ARTEFATTI_MB * 1024 * 1024,
+                 cartella=_cartella_artefatti(CARTELLA_CONDIVISA)):
+        self.max_byte = max_byte
+        self.byte_occupati = 0
+        self.cartella = cartella
+        self._artefatti = OrderedDict()
+        self._lock = threading.Lock()
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+
+    def __contains__(self, chiave):
+        with self._lock:
+            if chiave in self._artefatti:
+                return True
+        return self.cartella is not None and os.path.exists(os.path.join(self.cartella, chiave))
+
+    def get(self, chiave):
+        with self._lock:
+            contenuto = self._artefatti.get(chiave)
+            if contenuto is not None:
+                self._artefatti.move_to_end(chiave)
+                return contenuto
+        contenuto = self._leggi_disco(chiave)
+        if contenuto is not None:
+            self._inserisci(chiave, contenuto)
+        return contenuto
+
+    def put(self, chiave, contenuto):
+        if len(contenuto) > self.max_byte:
+            return
+        if self.cartella:
+            self._scrivi_disco(chiave, contenuto)
+        self._inserisci(chiave, contenuto)
+
+    def _inserisci(self, chiave, contenuto):
+        with self._lock:
+            precedente = self._artefatti.pop(chiave, None)
+            if precedente is not None:
+                self.byte_occupati -= len(precedente)
+            self._artefatti[chiave] = contenuto
+            self.byte_occupati += len(contenuto)
+            while self.byte_occupati > self.max_byte:
+                _, espulso = self._artefatti.popitem(last=False)
+                self.byte_occupati -= len(espulso)
+
+    def _leggi_disco(self, chiave):
+        if not self.cartella:
+            return None
+        try:
+            with open(os.path.join(self.cartella, chiave), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _scrivi_disco(self, chiave, contenuto):
+        scrivi_atomico(os.path.join(self.cartella, chiave), contenuto)
+        # Stesso limite in byte anche su disco: si eliminano i file meno recenti
+        pota_cartella(self.cartella, self.max_byte)
+
+
+artefatti = CacheArtefatti()
@@ -0,0 +1,182 @@
+import os
+import threading
+import uuid
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from app.aggregati import (completa_kpi, kpi_dataframe, statistiche_mensili_dataframe,
+                           medie_mensili_dataframe)
+from app.config import BACKEND_QUERY, CARTELLA_SQL, CACHE_SQL_MB
+from app.dataset import registro, pota_cartella
+from app.metriche import misura_fase, FILTRO
+from app.query import COLONNA_DATA, COLONNA_QUALITA, filtra_periodo, indicizza
+from app.schema import espandi
+
+
+# Backend intercambiabili per i filtri e le aggregazioni dei grafici (scelti con
+# DASHBOARD_BACKEND_QUERY). Stessa interfaccia e stessi DataFrame restituiti:
+#  - pandas: implementazione di riferimento sul DataFrame del registro;
+#  - duckdb: SQL su un file Parquet per versione del dataset (predicate pushdown sui
+#    row group, scansioni parallele, dati anche più grandi della memoria).
+COLONNE_SOMMA = ['Quantità raccolto (kg)', 'Profitto stimato (€)', 'Costo produzione (€)', 'Costo irrigazione (€)']
+COLONNE_MEDIA = ['Temperatura (°C)', 'Precipitazioni (mm)', 'Qualità suolo (%)']
+DIMENSIONE_CACHE = 32
+
+
+def _riferimento(id_dataset, versione):
+    return {"id": id_dataset, "versione": versione}
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+def _filtrati(id_dataset, versione, inizio, fine, qualita):
+    return filtra_periodo(registro.carica(_riferimento(id_dataset, versione)), inizio, fine, qualita)
+
+
+class BackendPandas:
+    nome = "pandas"
+
+    def filtra(self, id_dataset, versione, inizio=None, fine=None, qualita=None):
+        return _filtrati(id_dataset, versione, inizio, fine, qualita)
+
+    def kpi(self, id_dataset, versione, inizio=None, fine=None, qualita=None):
+        return kpi_dataframe(_filtrati(id_dataset, versione, inizio, fine, qualita))
+
+    def statistiche_mensili(self, id_dataset, versione, colonna, inizio=None, fine=None, qualita=None):
+        return statistiche_mensili_dataframe(_filtrati(id_dataset, versione, inizio, fine, qualita), colonna)
+
+    def medie_mensili(self, id_dataset, versione, colonne, inizio=None, fine=None, qualita=None):
+        return medie_mensili_dataframe(_filtrati(id_dataset, versione, inizio, fine, qualita), list(colonne))
+
+
+def _identificatore(colonna):
+    return '"' + colonna.replace('"', '""') + '"'
+
+
+def _condizioni(inizio, fine, qualita):
+    # Clausola WHERE con parametri: stesse regole di filtra_periodo (una data finale
+    # senza orario include l'intera giornata, estremi della qualità inclusi)
+    condizioni, parametri = [], []
+    data = _identificatore(COLONNA_DATA)
+    if inizio is not None:
+        condizioni.append(f"{data} >= ?")
+        parametri.append(pd.Timestamp(inizio).to_pydatetime())
+    if fine is not None:
+        fine = pd.Timestamp(fine)
+        if fine == fine.normalize():
+            condizioni.append(f"{data} < ?")
+            parametri.append((fine + pd.Timedelta(days=1)).to_pydatetime())
+        else:
+            condizioni.append(f"{data} <= ?")
+            parametri.append(fine.to_pydatetime())
+    if qualita is not None:
+        condizioni.append(f"{_identificatore(COLONNA_QUALITA)} BETWEEN ? AND ?")
+        parametri += [float(qualita[0]), float(qualita[1])]
+    return (" WHERE " + " AND ".join(condizioni)) if condizioni else "", parametri
+
+
+class BackendDuckDB:
+    nome = "duckdb"
+    # Righe per row group del Parquet: le statistiche min/max di 'Data' permettono
+    # di saltare i gruppi fuori dal periodo
+    RIGHE_PER_GRUPPO = 64 * 1024
+
+    def __init__(self, cartella=CARTELLA_SQL, max_byte=CACHE_SQL_MB * 1024 * 1024):
+        self.cartella = cartella
+        self.max_byte = max_byte
+        self._connessione = None
+        self._lock = threading.Lock()
+
+    def _cursore(self):
+        # Una connessione al database in memoria; un cursore (connessione duplicata) per query,
+        # così le richieste concorrenti non condividono lo stato
+        with self._lock:
+            if self._connessione is None:
+                import duckdb
+
+                self._connessione = duckdb.connect()
+            return self._connessione.cursor()
+
+    def _scrivi_parquet(self, riferimento, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.cartella, exist_ok=True)
+        percorso = os.path.join(self.cartella, f"{riferimento['id']}-{riferimento['versione']}.parquet")
+        if not os.path.exists(percorso):
+            # Valori float64 esatti (schema espanso), nell'ordine del registro
+            tabella = pa.Table.from_pandas(espandi(df), preserve_index=False)
+            temporaneo = f"{percorso}.{uuid.uuid4().hex}.tmp"
+            pq.write_table(tabella, temporaneo, row_group_size=self.RIGHE_PER_GRUPPO)
+            os.replace(temporaneo, percorso)
+            # File di tutte le versioni entro max_byte: si eliminano i meno usati
+            pota_cartella(self.cartella, self.max_byte, lambda nome: nome.endswith(".parquet"), {percorso})
+        return percorso
+
+    def _sorgente(self, id_dataset, versione):
+        # File Parquet della versione, scritto una volta e ricordato dal registro; se la pulizia
+        # lo ha eliminato viene riscritto
+        riferimento = _riferimento(id_dataset, versione)
+        percorso = registro.derivato(riferimento, 'parquet_sql', lambda df: self._scrivi_parquet(riferimento, df))
+        try:
+            # Data di modifica aggiornata: il file è tra gli ultimi usati per la pulizia
+            os.utime(percorso)
+        except FileNotFoundError:
+            percorso = self._scrivi_parquet(riferimento, registro.carica(riferimento))
+        return percorso
+
+    def _esegui(self, id_dataset, versione, select, inizio, fine, qualita, coda=""):
+        where, parametri = _condizioni(inizio, fine, qualita)
+        sql = f"SELECT {select} FROM read_parquet(?){where}{coda}"
+        with self._cursore() as cursore:
+            return cursore.execute(sql, [self._sorgente(id_dataset, versione)] + parametri).df()
+
+    @misura_fase(FILTRO)
+    def filtra(self, id_dataset, versione, inizio=None, fine=None, qualita=None):
+        # L'ordine di inserimento è conservato da DuckDB (preserve_insertion_order)
+        return indicizza(self._esegui(id_dataset, versione, "*", inizio, fine, qualita))
+
+    def kpi(self, id_dataset, versione, inizio=None, fine=None, qualita=None):
+        select = ", ".join([f"coalesce(sum({_identificatore(c)}), 0)" for c in COLONNE_SOMMA] +
+                           [f"avg({_identificatore(c)})" for c in COLONNE_MEDIA])
+        riga = self._esegui(id_dataset, versione, select, inizio, fine, qualita).iloc[0].tolist()
+        somme = dict(zip(COLONNE_SOMMA, riga[:len(COLONNE_SOMMA)]))
+        # Media di un periodo vuoto: NULL in SQL, NaN come in pandas
+        medie = {c: np.nan if pd.isna(v) else v for c, v in zip(COLONNE_MEDIA, riga[len(COLONNE_SOMMA):])}
+        return completa_kpi(somme, medie)
+
+    def _per_mese(self, id_dataset, versione, aggregati, inizio, fine, qualita):
+        select = f"month({_identificatore(COLONNA_DATA)}) AS MeseNum, " + ", ".join(aggregati)
+        df = self._esegui(id_dataset, versione, select, inizio, fine, qualita, " GROUP BY MeseNum ORDER BY MeseNum")
+        return df.astype({'MeseNum': np.int32})
+
+    def statistiche_mensili(self, id_dataset, versione, colonna, inizio=None, fine=None, qualita=None):
+        c = _identificatore(colonna)
+        return self._per_mese(id_dataset, versione, [f'avg({c}) AS "mean"', f'stddev_samp({c}) AS "std"'],
+                              inizio, fine, qualita)
+
+    def medie_mensili(self, id_dataset, versione, colonne, inizio=None, fine=None, qualita=None):
+        aggregati = [f"avg({_identificatore(c)}) AS {_identificatore(c)}" for c in colonne]
+        return self._per_mese(id_dataset, versione, aggregati, inizio, fine, qualita)
+
+
+BACKEND = {}
+
+
+def registra_backend(backend):
+    BACKEND[backend.nome] = backend
+    return backend
+
+
+def get_backend(nome):
+    try:
+        return BACKEND[nome]
+    except KeyError:
+        raise ValueError(f"Backend delle interrogazioni non supportato: {nome}")
+
+
+registra_backend(BackendPandas())
+registra_backend(BackendDuckDB())
+
+backend_query = get_backend(BACKEND_QUERY)
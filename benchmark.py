@@ -0,0 +1,453 @@
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.aggregati import CuboAggregati, kpi_dataframe
+from app.archivio import Archivio, crea_archivio
+from app.query import filtra_periodo, indicizza
+from app.schema import compatta, espandi, report_memoria
+from app.serializzazione import CODEC
+from app.utils import genera_dati, genera_dati_simulati
+
+
+# Benchmark eseguibile con: python -m app.benchmark
+
+def cronometra(funzione, ripetizioni=5, preparazione=None, durata_minima=0.0, max_ripetizioni=200):
+    # Tempo minimo su più ripetizioni (meno sensibile al rumore);
+    # preparazione viene eseguita prima di ogni ripetizione, fuori dalla misura.
+    # Con durata_minima (s) i casi rapidi sono ripetuti finché la somma dei tempi la raggiunge
+    tempi = []
+    risultato = None
+    while len(tempi) < ripetizioni or (sum(tempi) < durata_minima and len(tempi) < max_ripetizioni):
+        if preparazione is not None:
+            preparazione()
+        inizio = time.perf_counter()
+        risultato = funzione()
+        tempi.append(time.perf_counter() - inizio)
+    return min(tempi), risultato
+
+
+def dataset_di_prova(moltiplicatore=1, seed=0):
+    # Replica il dataset simulato per ottenere dimensioni maggiori,
+    # con una colonna float32 e una categorica per verificare i dtype
+    df = pd.concat([genera_dati_simulati(seed + i) for i in range(moltiplicatore)], ignore_index=True)
+    df['Qualità suolo (%)'] = df['Qualità suolo (%)'].astype(np.float32)
+    df['Alert'] = df['Alert'].astype('category')
+    return df
+
+
+def benchmark_serializzazione(moltiplicatore=10, ripetizioni=5):
+    df = dataset_di_prova(moltiplicatore)
+    print(f"Serializzazione di {len(df)} righe ({ripetizioni} ripetizioni, tempo minimo)")
+    print(f"{'codec':<10}{'dimensione (KB)':>18}{'scrittura (ms)':>18}{'lettura (ms)':>16}  dtype conservati")
+    for nome, codec in CODEC.items():
+        t_scrittura, payload = cronometra(lambda: codec.serializza(df), ripetizioni)
+        t_lettura, df_letto = cronometra(lambda: codec.deserializza(payload), ripetizioni)
+        dtype_ok = df_letto.dtypes.equals(df.dtypes)
+        print(f"{nome:<10}{len(payload) / 1024:>18.1f}{t_scrittura * 1000:>18.2f}{t_lettura * 1000:>16.2f}  {dtype_ok}")
+
+
+def benchmark_generazione(ripetizioni=5):
+    print(f"Generazione dati simulati ({ripetizioni} ripetizioni, tempo minimo)")
+    scenari = [
+        ("1 campo x 1 anno (D)", dict(inizio='2024-01-01', periodi=365)),
+        ("100 campi x 10 anni (D)", dict(inizio='2015-01-01', fine='2024-12-31', n_campi=100)),
+        ("10 campi x 1 anno (h)", dict(inizio='2024-01-01', fine='2024-12-31 23:00', frequenza='h', n_campi=10)),
+    ]
+    for nome, parametri in scenari:
+        tempo, df = cronometra(lambda: genera_dati(seed=0, **parametri), ripetizioni)
+        print(f"{nome:<28}{len(df):>12} righe{tempo * 1000:>12.1f} ms")
+
+
+def benchmark_aggregati(ripetizioni=5):
+    print(f"KPI di periodo: pandas vs cubo di aggregati ({ripetizioni} ripetizioni, tempo minimo)")
+    df = indicizza(genera_dati('2015-01-01', '2024-12-31', n_campi=100, seed=0))
+    tempo_cubo, cubo = cronometra(lambda: CuboAggregati(df), 1)
+    inizio, fine = '2017-03-15', '2023-09-30'
+    tempo_pandas, _ = cronometra(lambda: kpi_dataframe(filtra_periodo(df, inizio, fine)), ripetizioni)
+    tempo_query, _ = cronometra(lambda: cubo.kpi(inizio, fine), ripetizioni)
+    print(f"{len(df)} righe: costruzione cubo {tempo_cubo * 1000:.1f} ms, "
+          f"KPI pandas {tempo_pandas * 1000:.2f} ms, KPI cubo {tempo_query * 1000:.3f} ms")
+
+
+def benchmark_memoria(scala=100):
+    # Memoria per colonna dello schema compatto e verifica che KPI e statistiche
+    # mensili coincidano con quelli calcolati sul dataset in float64
+    df = indicizza(dataset_scalato(scala))
+    compatto = compatta(df)
+    print(f"Memoria del dataset ({len(df)} righe): schema compatto vs float64/testo")
+    report = report_memoria(compatto)
+    print(f"{'colonna':<26}{'dtype':>16}{'KB':>10}{'KB originali':>14}{'rapporto':>10}")
+    for colonna, riga in report.iterrows():
+        print(f"{colonna:<26}{riga['dtype']:>16}{riga['byte'] / 1024:>10.1f}"
+              f"{riga['byte originali'] / 1024:>14.1f}{riga['rapporto']:>10.3f}")
+    inizio, fine, qualita = '2024-03-15', '2024-09-30', (40, 90)
+    identici = all([
+        kpi_dataframe(filtra_periodo(df, inizio, fine, qualita))
+        == kpi_dataframe(filtra_periodo(compatto, inizio, fine, qualita)),
+        CuboAggregati(df).kpi(inizio, fine) == CuboAggregati(compatto).kpi(inizio, fine),
+        filtra_periodo(df, inizio, fine).equals(espandi(filtra_periodo(compatto, inizio, fine))),
+        # Il filtro del solo periodo resta una vista sul dataset compatto
+        np.shares_memory(filtra_periodo(compatto, inizio, fine)['Temperatura (°C)'].to_numpy(),
+                         compatto['Temperatura (°C)'].to_numpy()),
+    ])
+    if not identici:
+        print("ERRORE: risultati diversi con lo schema compatto")
+    return identici
+
+
+def benchmark_archivio(n_campi=20, ripetizioni=5):
+    # Archivio storico (10 anni) in memory-map: apertura ed estrazione dell'ultimo anno
+    # rispetto alla lettura completa del Parquet equivalente seguita dal filtro per data
+    print(f"Archivio storico 10 anni x {n_campi} campi ({ripetizioni} ripetizioni, tempo minimo)")
+    with tempfile.TemporaryDirectory() as cartella:
+        percorso = os.path.join(cartella, "archivio.arrow")
+        righe = crea_archivio(percorso, inizio='2015-01-01', fine='2024-12-31', n_campi=n_campi, seed=0)
+        percorso_parquet = os.path.join(cartella, "archivio.parquet")
+        Archivio(percorso).leggi().to_parquet(percorso_parquet)
+        t_apertura, archivio = cronometra(lambda: Archivio(percorso), ripetizioni)
+        t_anno, anno = cronometra(lambda: archivio.leggi('2024-01-01'), ripetizioni)
+        t_parquet, _ = cronometra(lambda: filtra_periodo(indicizza(pd.read_parquet(percorso_parquet)), '2024-01-01'),
+                                  ripetizioni)
+    print(f"{righe} righe: apertura {t_apertura * 1000:.2f} ms, ultimo anno ({len(anno)} righe) "
+          f"{t_anno * 1000:.2f} ms, Parquet completo + filtro {t_parquet * 1000:.1f} ms")
+
+
+def benchmark_backend(scala=100, ripetizioni=5):
+    # Backend DuckDB confrontato con l'implementazione di riferimento pandas: stesse righe
+    # filtrate, KPI e aggregati mensili uguali a meno dell'ordine delle somme in virgola mobile
+    from app.backend import get_backend
+    from app.dataset import registro
+
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        print("Backend DuckDB: duckdb non installato, confronto saltato")
+        return None
+    r = registro.registra(dataset_scalato(scala))
+    pandas_, duckdb_ = get_backend("pandas"), get_backend("duckdb")
+    colonna, colonne = 'Quantità raccolto (kg)', ('Costo produzione (€)', 'Profitto stimato (€)')
+    filtri = [('2024-02-01', '2024-11-30', (75, 95)), (None, None, None), ('2024-03-05', '2024-03-05', None),
+              ('2030-01-01', None, (0, 100))]
+    print(f"Backend pandas vs DuckDB su {scala * 365} righe ({ripetizioni} ripetizioni, tempo minimo, cache svuotate)")
+    equivalenti = True
+    for filtro in filtri:
+        argomenti = (r["id"], r["versione"]) + filtro
+        a, b = pandas_.filtra(*argomenti), duckdb_.filtra(*argomenti)
+        kpi_a, kpi_b = pandas_.kpi(*argomenti), duckdb_.kpi(*argomenti)
+        try:
+            pd.testing.assert_frame_equal(espandi(a), b)
+            pd.testing.assert_frame_equal(pandas_.statistiche_mensili(r["id"], r["versione"], colonna, *filtro),
+                                          duckdb_.statistiche_mensili(r["id"], r["versione"], colonna, *filtro),
+                                          check_exact=False, rtol=1e-9)
+            pd.testing.assert_frame_equal(pandas_.medie_mensili(r["id"], r["versione"], colonne, *filtro),
+                                          duckdb_.medie_mensili(r["id"], r["versione"], colonne, *filtro),
+                                          check_exact=False, rtol=1e-9)
+            assert all(np.isclose(kpi_a[k], kpi_b[k], rtol=1e-9, equal_nan=True) for k in kpi_a)
+        except AssertionError as errore:
+            print(f"ERRORE: risultati diversi per il filtro {filtro}: {errore}")
+            equivalenti = False
+    argomenti = (r["id"], r["versione"]) + filtri[0]
+    casi = [("filtro", lambda b: b.filtra(*argomenti)), ("KPI", lambda b: b.kpi(*argomenti)),
+            ("statistiche mensili", lambda b: b.statistiche_mensili(r["id"], r["versione"], colonna, *filtri[0]))]
+    print(f"{'operazione':<24}{'pandas (ms)':>14}{'duckdb (ms)':>14}")
+    for nome, funzione in casi:
+        tempi = [cronometra(lambda b=b: funzione(b), ripetizioni, _svuota_cache)[0] for b in (pandas_, duckdb_)]
+        print(f"{nome:<24}{tempi[0] * 1000:>14.2f}{tempi[1] * 1000:>14.2f}")
+    return equivalenti
+
+
+def benchmark_esportazione(scala=100):
+    # Picco di memoria (tracemalloc) dell'export CSV: DataFrame filtrato e CSV completi in
+    # memoria (export precedente) contro la rotta in streaming, che tiene un blocco alla volta
+    import hashlib
+    import tracemalloc
+
+    import app.main
+    from app.dataset import registro
+    from app.esportazione import url_download
+
+    r = registro.registra(dataset_scalato(scala))
+    client = app.main.app.server.test_client()
+
+    # Entrambe restituiscono (byte, sha256) senza conservare il file scaricato
+    def completo():
+        contenuto = espandi(filtra_periodo(registro.carica(r))).to_csv(index=False, sep=';').encode('utf-8-sig')
+        return len(contenuto), hashlib.sha256(contenuto).hexdigest()
+
+    def streaming():
+        impronta, dimensione = hashlib.sha256(), 0
+        with client.get(url_download(r), buffered=False) as risposta:
+            for parte in risposta.iter_encoded():
+                impronta.update(parte)
+                dimensione += len(parte)
+        return dimensione, impronta.hexdigest()
+
+    print(f"Export CSV di {scala * 365} righe: picco di memoria e tempo")
+    risultati = []
+    for nome, funzione in [("completo", completo), ("streaming", streaming)]:
+        tracemalloc.start()
+        inizio = time.perf_counter()
+        dimensione, impronta = funzione()
+        durata = time.perf_counter() - inizio
+        _, picco = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        risultati.append(impronta)
+        print(f"{nome:<12}{dimensione / 1024:>10.0f} KB{picco / 1024 / 1024:>10.1f} MB di picco{durata * 1000:>10.1f} ms")
+    if risultati[0] != risultati[1]:
+        print("ERRORE: il CSV in streaming è diverso dall'export completo")
+        return False
+    return True
+
+
+# Moduli opzionali che non devono essere importati all'avvio (caricati al primo uso)
+MODULI_DIFFERITI = ("statsmodels", "pdfkit", "kaleido", "duckdb")
+BUDGET_AVVIO = 3.0
+
+_SCRIPT_AVVIO = f"""
+import sys, time
+inizio = time.perf_counter()
+import app.main
+importazione = time.perf_counter() - inizio
+caricati = [m for m in {MODULI_DIFFERITI!r} if m in sys.modules]
+print("AVVIO", importazione, *caricati)
+"""
+
+
+def benchmark_avvio(budget=BUDGET_AVVIO, ripetizioni=3):
+    # Import a freddo in un processo separato (include la validazione del layout, che
+    # costruisce il dataset iniziale): tempo minimo contro il budget e verifica che
+    # le dipendenze opzionali pesanti restino differite
+    print(f"Avvio dell'applicazione ({ripetizioni} processi, tempo minimo, budget {budget:.1f} s)")
+    tempi = []
+    for _ in range(ripetizioni):
+        uscita = subprocess.run([sys.executable, "-c", _SCRIPT_AVVIO], capture_output=True, text=True, check=True)
+        riga = next(r for r in uscita.stdout.splitlines() if r.startswith("AVVIO "))
+        _, importazione, *caricati = riga.split()
+        tempi.append(float(importazione))
+    importazione = min(tempi)
+    print(f"import app.main {importazione * 1000:.0f} ms")
+    esito = importazione <= budget and not caricati
+    if caricati:
+        print(f"ERRORE: moduli importati all'avvio: {', '.join(caricati)}")
+    if importazione > budget:
+        print(f"ERRORE: import oltre il budget di {budget:.1f} s")
+    return esito
+
+
+# Suite dei percorsi critici a più scale del dataset (1 scala = 365 righe giornaliere,
+# le scale maggiori aggiungono campi) con baseline salvata su file JSON. Ogni caso è espresso in
+# unità del caso di calibrazione misurato subito prima, così né una macchina più lenta o più veloce
+# di quella della baseline né il carico che cambia durante l'esecuzione spostano i rapporti.
+# Ogni ripetizione è una coppia calibrazione + caso e vale la mediana dei rapporti: un picco di carico
+# durante una singola ripetizione non sposta il risultato
+SCALE_SUITE = (1, 10, 100)
+BASELINE_SUITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+RIPETIZIONI_SUITE = 9
+TOLLERANZA_SUITE = 1.5
+# I casi brevi (sotto CASO_BREVE_SUITE unità in baseline) oscillano di più: tolleranza più larga
+CASO_BREVE_SUITE = 5.0
+TOLLERANZA_BREVI = 3.0
+# Sotto questa differenza (in unità di calibrazione) uno scostamento dalla baseline è considerato rumore
+RUMORE_SUITE = 0.25
+# Tempo minimo (s) accumulato per ogni caso della suite
+DURATA_MINIMA_SUITE = 0.5
+
+
+_rng_calibrazione = np.random.default_rng(0)
+DATI_CALIBRAZIONE = pd.DataFrame({
+    'gruppo': _rng_calibrazione.integers(0, 50, 20_000),
+    'valore': _rng_calibrazione.random(20_000),
+})
+
+
+def calibrazione():
+    # Carico fisso numpy + pandas (ordinamento, groupby, maschera) indipendente dal codice della
+    # dashboard: stesso tipo di lavoro dei casi, quindi rallenta con loro quando la macchina è carica
+    df = DATI_CALIBRAZIONE
+    np.sort(df['valore'].to_numpy())
+    return df[df['valore'] > 0.5].groupby('gruppo')['valore'].agg(['mean', 'std'])
+
+
+def _relativo(funzione, ripetizioni, preparazione=None, max_ripetizioni=200):
+    # (tempo, tempo in unità di calibrazione) mediani di un caso: ogni ripetizione misura la
+    # calibrazione subito prima del caso. Una prima esecuzione non misurata assorbe import e
+    # inizializzazioni pigre, che altrimenti gonfiano solo la prima scala
+    if preparazione is not None:
+        preparazione()
+    funzione()
+    tempi, rapporti = [], []
+    risultato = None
+    while len(tempi) < ripetizioni or (sum(tempi) < DURATA_MINIMA_SUITE and len(tempi) < max_ripetizioni):
+        unita, _ = cronometra(calibrazione, 3)
+        tempo, risultato = cronometra(funzione, 1, preparazione)
+        tempi.append(tempo)
+        rapporti.append(tempo / unita)
+    return float(np.median(tempi)), float(np.median(rapporti)), risultato
+
+
+def dataset_scalato(scala, seed=0):
+    # Stesso schema di genera_dati_simulati, con `scala` campi sullo stesso anno
+    return genera_dati(inizio='2024-01-01', periodi=365, n_campi=scala, seed=seed).drop(columns='Campo')
+
+
+def _contesto_callback():
+    # Le callback chiamate fuori da una richiesta leggono ctx.triggered_id / triggered_prop_ids:
+    # contesto senza input scatenanti, come al caricamento della pagina
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    context_value.set(AttributeDict(triggered_inputs=[], args_grouping=[], outputs_list=[]))
+
+
+def _svuota_cache():
+    # Cache per filtri e stati dei modelli svuotate prima di ogni ripetizione:
+    # si misura il calcolo, non il lookup memoizzato (cubo e indici per versione restano)
+    from app import backend, grafici, previsione, tabella
+
+    for modulo in (backend, grafici, previsione, tabella):
+        for oggetto in list(vars(modulo).values()):
+            if hasattr(oggetto, "cache_clear"):
+                oggetto.cache_clear()
+    previsione._stati.clear()
+
+
+def casi_suite(df):
+    # (nome, funzione) misurati su un dataset registrato
+    import app.main  # noqa: F401  (registra le callback)
+    from app import callbacks
+    from app.dataset import registro
+    from app.esportazione import url_download
+    from app.previsione import MODELLI
+    from app.report import costruisci_html_report
+
+    r = registro.registra(df)
+    client = app.main.app.server.test_client()
+    inizio, fine, qualita = '2024-02-01', '2024-11-30', [75, 95]
+    x, y, colore = 'Temperatura (°C)', 'Quantità raccolto (kg)', 'Ore sole (h)'
+    storico = espandi(filtra_periodo(registro.carica(r), fine=fine))
+    kpi = kpi_dataframe(filtra_periodo(registro.carica(r), inizio, fine))
+    anteprima = storico.head(10)
+    immagine = base64.b64encode(bytes(64 * 1024)).decode('utf-8')
+    casi = [
+        ("filtro periodo/qualità", lambda: filtra_periodo(registro.carica(r), inizio, fine, qualita)),
+        ("linee", lambda: callbacks.aggiorna_grafico_linee(r, inizio, fine, qualita, [y, 'pH suolo'])),
+        ("scatter + OLS", lambda: callbacks.aggiorna_grafico_scatter(r, inizio, fine, qualita, x, y, colore, 'ols')),
+        ("istogramma", lambda: callbacks.aggiorna_istogramma(r, inizio, fine, qualita)),
+        ("KPI", lambda: callbacks.aggiorna_kpi(r, inizio, fine, qualita)),
+        ("KPI (cubo)", lambda: callbacks.aggiorna_kpi(r, inizio, fine, [70, 100])),
+        ("alert", lambda: callbacks.aggiorna_alert(r, inizio, fine, qualita, 1)),
+        ("conteggi alert", lambda: callbacks.aggiorna_conteggi_alert(r, inizio, fine, qualita)),
+        ("media mensile", lambda: callbacks.aggiorna_media_mensile(r, inizio, fine, qualita)),
+        ("costi/profitto", lambda: callbacks.aggiorna_costi_profitto(r, inizio, fine, qualita)),
+        ("comparazione", lambda: callbacks.aggiorna_comparazione('2024-01-01', '2024-05-31',
+                                                                 '2024-06-01', '2024-12-31', r)),
+        ("tabella (filtro+ordina)", lambda: callbacks.aggiorna_tabella(
+            r, 0, 10, [{"column_id": x, "direction": "desc"}], "{pH suolo} > 6.5")),
+        ("download CSV", lambda: client.get(url_download(r, inizio, fine, qualita)).get_data()),
+        ("forecast (callback)", lambda: callbacks.aggiorna_forecast(fine, r, 'lineare')),
+        ("download forecast", lambda: callbacks.download_forecast_data(1, fine, r, 'lineare')),
+    ]
+    casi += [(f"stima {nome}", lambda m=modello: m.adatta(storico)) for nome, modello in MODELLI.items()]
+    casi.append(("HTML report PDF", lambda: costruisci_html_report(inizio, fine, kpi, immagine, anteprima)))
+    return casi
+
+
+def benchmark_suite(scale=SCALE_SUITE, ripetizioni=RIPETIZIONI_SUITE, baseline=BASELINE_SUITE, salva=False,
+                    tolleranza=TOLLERANZA_SUITE, tolleranza_brevi=TOLLERANZA_BREVI):
+    print(f"Suite dei percorsi critici (almeno {ripetizioni} ripetizioni e {DURATA_MINIMA_SUITE:.2f} s per caso, "
+          "mediana, cache svuotate)")
+    _contesto_callback()
+    tempi, risultati = {}, {}
+    for scala in scale:
+        chiave = f"generazione@{scala}x"
+        tempi[chiave], risultati[chiave], df = _relativo(lambda: dataset_scalato(scala), ripetizioni)
+        for nome, funzione in casi_suite(df):
+            chiave = f"{nome}@{scala}x"
+            tempi[chiave], risultati[chiave], _ = _relativo(funzione, ripetizioni, _svuota_cache)
+
+    riferimento = {}
+    if baseline and os.path.exists(baseline) and not salva:
+        with open(baseline, encoding="utf-8") as f:
+            riferimento = json.load(f).get("casi", {})
+    print(f"{'caso':<36}{'tempo (ms)':>14}{'unità':>10}{'baseline':>10}{'rapporto':>10}")
+    regressioni = []
+    for chiave, relativo in risultati.items():
+        tempo = tempi[chiave]
+        precedente = riferimento.get(chiave)
+        if precedente is None:
+            print(f"{chiave:<36}{tempo * 1000:>14.2f}{relativo:>10.3f}")
+            continue
+        rapporto = relativo / precedente if precedente else float("inf")
+        limite = tolleranza_brevi if precedente < CASO_BREVE_SUITE else tolleranza
+        segnale = ""
+        if rapporto > limite and relativo - precedente > RUMORE_SUITE:
+            regressioni.append(chiave)
+            segnale = "  REGRESSIONE"
+        print(f"{chiave:<36}{tempo * 1000:>14.2f}{relativo:>10.3f}{precedente:>10.3f}{rapporto:>10.2f}{segnale}")
+    if salva:
+        with open(baseline, "w", encoding="utf-8") as f:
+            # Tempi in unità di calibrazione; i millisecondi restano come riferimento leggibile
+            json.dump({
+                "casi": {chiave: round(relativo, 4) for chiave, relativo in risultati.items()},
+                "tempi_ms": {chiave: round(tempo * 1000, 3) for chiave, tempo in tempi.items()},
+            }, f, indent=2, sort_keys=True)
+        print(f"baseline salvata in {baseline}")
+    if regressioni:
+        print(f"ERRORE: {len(regressioni)} casi oltre {tolleranza:.2f}x la baseline "
+              f"({tolleranza_brevi:.2f}x sotto {CASO_BREVE_SUITE:g} unità)")
+    return not regressioni
+
+
+BENCHMARK = {
+    "serializzazione": lambda args: benchmark_serializzazione(args.moltiplicatore, args.ripetizioni),
+    "generazione": lambda args: benchmark_generazione(args.ripetizioni),
+    "aggregati": lambda args: benchmark_aggregati(args.ripetizioni),
+    "avvio": lambda args: benchmark_avvio(args.budget_avvio),
+    "archivio": lambda args: benchmark_archivio(ripetizioni=args.ripetizioni),
+    "backend": lambda args: benchmark_backend(max(args.scale), args.ripetizioni),
+    "esportazione": lambda args: benchmark_esportazione(max(args.scale)),
+    "memoria": lambda args: benchmark_memoria(max(args.scale)),
+    "suite": lambda args: benchmark_suite(args.scale, max(args.ripetizioni, RIPETIZIONI_SUITE), args.baseline,
+                                          args.salva_baseline, args.tolleranza, args.tolleranza_brevi),
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark della dashboard")
+    parser.add_argument("benchmark", nargs="*",
+                        help=f"benchmark da eseguire tra {', '.join(BENCHMARK)} (default: tutti)")
+    parser.add_argument("--moltiplicatore", type=int, default=10,
+                        help="numero di anni simulati concatenati (365 righe ciascuno)")
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    parser.add_argument("--budget-avvio", type=float, default=BUDGET_AVVIO,
+                        help="secondi massimi per import app.main (benchmark avvio)")
+    parser.add_argument("--scale", type=int, nargs="+", default=list(SCALE_SUITE),
+                        help="multipli delle 365 righe di default (benchmark suite)")
+    parser.add_argument("--baseline", default=BASELINE_SUITE, help="file JSON della baseline (benchmark suite)")
+    parser.add_argument("--salva-baseline", action="store_true",
+                        help="sovrascrive la baseline con i tempi misurati (benchmark suite)")
+    parser.add_argument("--tolleranza", type=float, default=TOLLERANZA_SUITE,
+                        help="rapporto massimo rispetto alla baseline prima di segnalare una regressione")
+    parser.add_argument("--tolleranza-brevi", type=float, default=TOLLERANZA_BREVI,
+                        help=f"rapporto massimo per i casi sotto {CASO_BREVE_SUITE:g} unità di calibrazione")
+    args = parser.parse_args()
+    sconosciuti = set(args.benchmark) - set(BENCHMARK)
+    if sconosciuti:
+        parser.error(f"benchmark sconosciuti: {', '.join(sorted(sconosciuti))}")
+    falliti = []
+    for nome in args.benchmark or BENCHMARK:
+        # I controlli restituiscono False se il vincolo non è rispettato
+        if BENCHMARK[nome](args) is False:
+            falliti.append(nome)
+        print()
+    if falliti:
+        sys.exit(f"controlli non superati: {', '.join(falliti)}")
@@ -1,458 +1,394 @@
-import numpy as np
 import pandas as pd
-import datetime
-from datetime import timedelta
-import pdfkit
-from dash import dcc, html, Input, Output, State
+from dash import dcc, Input, Output, State, ctx, no_update, set_props
+from dash.exceptions import PreventUpdate
 import plotly.express as px
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 from app.main import app
 from app.utils import create_kpi_card, PALETTE_COLORI, genera_dati_simulati
-import plotly.express as px
-import pdfkit
-import plotly.express as px
-import base64
-from io import BytesIO
-import pandas as pd
-
-
-# 1) Rigenerazione dati
+from app.dataset import registro, DatasetNonTrovato
+from app.query import filtra_periodo
+from app.schema import espandi
+from app.aggregati import cubo_aggregati, kpi_dataframe
+from app import grafici
+from app.previsione import calcola_previsione, COLONNA_INFERIORE, COLONNA_SUPERIORE, LIVELLO_CONFIDENZA
+from app.decimazione import intervallo_x, posizioni_visibili
+from app.tabella import pagina_tabella, RIGHE_PER_PAGINA
+from app.report import coda_report, IN_CODA, COMPLETATO, ERRORE, NOME_FILE_REPORT
+from app.metriche import fase, FIGURA
+from app.ingestione import ingerisci
+from app.esportazione import url_download, PERCORSO_DOWNLOAD
+from app.components import riferimento_iniziale, stile_kpi_campi
+from app.campi import campi_dataset, riferimento_campo
+from app.archivio import riferimento_periodo, riferimento_storico
+from app.config import ARCHIVIO_STORICO, GIORNI_ARCHIVIO
+
+
+def dataset_scaduto():
+    # Il dataset del riferimento non è più nel registro (né in memoria né su disco): la pagina
+    # passa all'ultima versione del dataset iniziale con un avviso, invece di restare ferma
+    set_props("store-data", {"data": riferimento_iniziale()})
+    set_props("avviso-dataset", {"children": dbc.Alert(
+        "I dati selezionati non sono più disponibili sul server: è stato ricaricato il dataset iniziale.",
+        color="warning", dismissable=True)})
+    raise PreventUpdate
+
+
+def carica_dati(riferimento):
+    # Recupera il DataFrame dal registro lato server (nessun round-trip JSON)
+    if not riferimento:
+        raise PreventUpdate
+    try:
+        return registro.carica(riferimento)
+    except DatasetNonTrovato:
+        dataset_scaduto()
+
+
+# 1) Rigenerazione dati e nuovi dati dalla cartella di ingestione
 @app.callback(
     Output("store-data", "data"),
     Input("btn-genera-dati", "n_clicks"),
+    Input("intervallo-ingestione", "n_intervals"),
+    State("store-data", "data"),
     prevent_initial_call=True
 )
-def aggiorna_dati(n_clicks):
+def aggiorna_dati(n_clicks, n_intervals, riferimento):
+    if ctx.triggered_id == "intervallo-ingestione":
+        # I dati in arrivo alimentano il dataset iniziale condiviso: nuova versione
+        # con le sole righe accodate (cubo, alert e previsione aggiornati in modo incrementale)
+        iniziale = riferimento_iniziale()
+        if not riferimento or riferimento["id"] != iniziale["id"]:
+            raise PreventUpdate
+        nuovo = ingerisci(iniziale)
+        if nuovo == riferimento:
+            raise PreventUpdate
+        return nuovo
     new_df = genera_dati_simulati()
-    return new_df.to_json(date_format="iso", orient="split")
+    return registro.registra(new_df)
 
 
-# 2) Aggiornamento dashboard (grafici, KPI, alert)
-@app.callback(
-    Output('grafico-line', 'figure'),
-    Output('grafico-scatter', 'figure'),
-    Output('grafico-hist', 'figure'),
-    Output('kpi-cards', 'children'),
-    Output('lista-alert', 'children'),
-    Output('grafico-box', 'figure'),
-    Output('grafico-line-cp', 'figure'),  # <-- il nuovo Output
+# 2) Aggiornamento dashboard: una callback per elemento, ciascuna dipendente
+#    solo dai propri input e servita da un costruttore memoizzato (grafici.py)
+def da_cache(costruttore, riferimento, *parametri):
+    if not riferimento:
+        raise PreventUpdate
+    try:
+        return costruttore(riferimento["id"], riferimento["versione"], *parametri)
+    except DatasetNonTrovato:
+        dataset_scaduto()
+
+
+def da_cache_periodo(costruttore, riferimento, start_date, end_date, *parametri):
+    # Come da_cache, con il riferimento della finestra che contiene il periodo (vista_periodo)
+    return da_cache(costruttore, vista_periodo(riferimento, start_date, end_date), start_date, end_date, *parametri)
+
+
+def intervallo_zoom(id_grafico, relayout_data):
+    # Range x visibile se la callback è scatenata dallo zoom del grafico; gli altri
+    # eventi di relayout (asse y, autosize) non richiedono di ridisegnare i dati
+    if ctx.triggered_id != id_grafico:
+        return None
+    modificato, intervallo = intervallo_x(relayout_data)
+    if not modificato:
+        raise PreventUpdate
+    return intervallo
+
+
+FILTRI_DASHBOARD = [
+    Input("store-data", "data"),
     Input('date-range', 'start_date'),
     Input('date-range', 'end_date'),
-    Input('variabili-dropdown', 'value'),
     Input('slider-quality', 'value'),
-    Input("store-data", "data"),
+]
+# Campo selezionato (drill-down dalla tabella dei KPI per campo): filtra linee, scatter e istogramma
+FILTRO_CAMPO = Input('selettore-campo', 'value')
+
+
+def vista_periodo(riferimento, start_date, end_date):
+    # Con l'archivio storico, un periodo fuori dalla finestra caricata è letto dall'archivio
+    # come nuova finestra (Archivio.leggi); altrimenti il riferimento resta invariato
+    if not ARCHIVIO_STORICO:
+        return riferimento
+    return riferimento_periodo(riferimento, ARCHIVIO_STORICO, start_date, end_date)
+
+
+def vista_storico(riferimento, end_date):
+    # Storico della previsione: con l'archivio storico, gli ultimi GIORNI_ARCHIVIO giorni fino
+    # alla data finale (anche fuori dalla finestra caricata); altrimenti tutto il dataset
+    if not ARCHIVIO_STORICO or not riferimento:
+        return riferimento
+    return riferimento_storico(riferimento, ARCHIVIO_STORICO, end_date, GIORNI_ARCHIVIO)
+
+
+def vista_campo(riferimento, campo):
+    try:
+        return riferimento_campo(riferimento, campo)
+    except DatasetNonTrovato:
+        dataset_scaduto()
+
+
+@app.callback(
+    Output('grafico-line', 'figure'),
+    *FILTRI_DASHBOARD,
+    Input('variabili-dropdown', 'value'),
+    Input('grafico-line', 'relayoutData'),
+    FILTRO_CAMPO,
+)
+def aggiorna_grafico_linee(riferimento, start_date, end_date, quality_range, variabili, relayout_data=None,
+                           campo=None):
+    intervallo = intervallo_zoom('grafico-line', relayout_data)
+    riferimento = vista_periodo(riferimento, start_date, end_date)
+    return da_cache(grafici.figura_linee, vista_campo(riferimento, campo), start_date, end_date, tuple(quality_range),
+                    tuple(variabili or []), intervallo)
+
+
+@app.callback(
+    Output('grafico-scatter', 'figure'),
+    *FILTRI_DASHBOARD,
     Input('scatter-x-dropdown', 'value'),
     Input('scatter-y-dropdown', 'value'),
     Input('scatter-color-dropdown', 'value'),
+    Input('scatter-trendline-dropdown', 'value'),
+    FILTRO_CAMPO,
 )
-def aggiorna_dashboard(start_date, end_date, variabili, quality_range, data_json, scatter_x, scatter_y, scatter_color):
-    df = pd.read_json(data_json, orient="split")
-    df['Data'] = pd.to_datetime(df['Data'], errors='coerce')
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
-
-    # Filtro per le date
-    mask = (df['Data'] >= start_date) & (df['Data'] <= end_date)
-    df_filtrato = df.loc[mask]
-    # Filtro per la qualità del suolo
-    q_min, q_max = quality_range
-    df_filtrato = df_filtrato[
-        (df_filtrato['Qualità suolo (%)'] >= q_min) &
-        (df_filtrato['Qualità suolo (%)'] <= q_max)
-    ]
-    # GRAFICO LINE
-    fig_line = go.Figure()
-    colori = list(PALETTE_COLORI.values())
-    for idx, var in enumerate(variabili):
-        fig_line.add_trace(go.Scatter(
-            x=df_filtrato['Data'],
-            y=df_filtrato[var],
-            mode='lines+markers',
-            name=var,
-            marker=dict(size=6),
-            line=dict(width=2, color=colori[idx % len(colori)])
-        ))
-    fig_line.update_layout(
-        title='Andamento delle variabili selezionate',
-        template='plotly_white',
-        xaxis=dict(title='Data'),
-        yaxis=dict(title='Valore'),
-        legend=dict(orientation='h', y=-0.2, x=0.5, xanchor='center')
-    )
-    # GRAFICO SCATTER
-    fig_scatter = px.scatter(
-        df_filtrato,
-        x=scatter_x,
-        y=scatter_y,
-        color=scatter_color,
-        trendline="ols",
-        template="plotly_white",
-        title=f"Correlazione tra {scatter_x} e {scatter_y}"
-    )
-    # GRAFICO HISTOGRAMMA
-    df_filtrato['Mese'] = df_filtrato['Data'].dt.strftime('%b')
-    fig_hist = px.histogram(
-        df_filtrato,
-        x='Quantità raccolto (kg)',
-        color='Mese',
-        nbins=15,
-        barmode='group',
-        histnorm='percent',
-        template='plotly_white',
-        title='Distribuzione della Quantità raccolto (kg) per Mese'
-    )
-    fig_hist.update_layout(
-        xaxis_title='Quantità raccolto (kg)',
-        yaxis_title='Frequenza (%)',
-        legend_title_text='Mese'
-    )
-
-    produzione_totale = df_filtrato['Quantità raccolto (kg)'].sum()
-    profitto_totale = df_filtrato['Profitto stimato (€)'].sum()
-    temperatura_media = df_filtrato['Temperatura (°C)'].mean()
-    precipitazioni_medie = df_filtrato['Precipitazioni (mm)'].mean()
-    qualita_media = df_filtrato['Qualità suolo (%)'].mean()
-
-    kpi_cards_base = dbc.Row([
-        dbc.Col(create_kpi_card("Produzione Totale", "fas fa-tractor", f"{produzione_totale:,.1f} kg",
-                                PALETTE_COLORI["raccolto"],
-                                tooltip_text="Somma totale della produzione nel periodo."), md=2),
-        dbc.Col(create_kpi_card("Profitto Totale", "fas fa-euro-sign", f"{profitto_totale:,.2f} €",
-                                PALETTE_COLORI["profitto"],
-                                tooltip_text="Profitto totale stimato nel periodo."), md=2),
-        dbc.Col(create_kpi_card("Temp. Media", "fas fa-thermometer-half", f"{temperatura_media:.1f} °C",
-                                PALETTE_COLORI["temperatura"],
-                                tooltip_text="Temperatura media nel periodo."), md=2),
-        dbc.Col(create_kpi_card("Prec. Media", "fas fa-cloud-rain", f"{precipitazioni_medie:.1f} mm",
-                                PALETTE_COLORI["precipitazioni"],
-                                tooltip_text="Precipitazioni medie nel periodo."), md=2),
-        dbc.Col(create_kpi_card("Qualità suolo Media", "fas fa-seedling", f"{qualita_media:.1f} %",
-                                PALETTE_COLORI["qualita_suolo"],
-                                tooltip_text="Qualità media del suolo nel periodo."), md=2)
-    ], justify="center")
+def aggiorna_grafico_scatter(riferimento, start_date, end_date, quality_range, scatter_x, scatter_y, scatter_color,
+                             trendline='ols', campo=None):
+    riferimento = vista_periodo(riferimento, start_date, end_date)
+    return da_cache(grafici.figura_scatter, vista_campo(riferimento, campo), start_date, end_date, tuple(quality_range),
+                    scatter_x, scatter_y, scatter_color, trendline)
 
-    # Calcolo costi e ricavi per margine netto
-    if 'Costo produzione (€)' in df_filtrato.columns:
-        costo_produzione_tot = df_filtrato['Costo produzione (€)'].sum()
-    else:
-        costo_produzione_tot = 0
 
-    if 'Costo irrigazione (€)' in df_filtrato.columns:
-        costo_irrigazione_tot = df_filtrato['Costo irrigazione (€)'].sum()
-    else:
-        costo_irrigazione_tot = 0
+@app.callback(
+    Output('grafico-hist', 'figure'),
+    *FILTRI_DASHBOARD,
+    FILTRO_CAMPO,
+)
+def aggiorna_istogramma(riferimento, start_date, end_date, quality_range, campo=None):
+    riferimento = vista_periodo(riferimento, start_date, end_date)
+    return da_cache(grafici.figura_istogramma, vista_campo(riferimento, campo), start_date, end_date,
+                    tuple(quality_range))
 
-    costo_totale = costo_produzione_tot + costo_irrigazione_tot
 
-    # Costo medio per kg
-    if produzione_totale > 0:
-        costo_medio_kg = costo_totale / produzione_totale
-    else:
-        costo_medio_kg = 0
+@app.callback(
+    Output('tabella-kpi-campi', 'data'),
+    *FILTRI_DASHBOARD,
+)
+def aggiorna_kpi_campi(riferimento, start_date, end_date, quality_range):
+    return da_cache_periodo(grafici.kpi_campi, riferimento, start_date, end_date, tuple(quality_range))
 
-    # Ricavi totali = Profitto + Costi
-    ricavi_totali = profitto_totale + costo_totale
-    if ricavi_totali != 0:
-        margine_netto = (profitto_totale / ricavi_totali) * 100
-    else:
-        margine_netto = 0
 
-    # Crea un secondo blocco di card
-    kpi_cards_extra = dbc.Row([
-        dbc.Col(
-            create_kpi_card(
-                "Margine Netto",
-                "fas fa-percentage",
-                f"{margine_netto:.1f} %",
-                PALETTE_COLORI["margine_netto"],
-                tooltip_text="Percentuale di profitto sui ricavi totali."
-            ), md=2
-        ),
-        dbc.Col(
-            create_kpi_card(
-                "Costo Medio/kg",
-                "fas fa-coins",
-                f"{costo_medio_kg:.2f} €/kg",
-                PALETTE_COLORI["costo_medio"],
-                tooltip_text="Costo totale diviso per la quantità prodotta."
-            ), md=2
-        ),
-    ], justify="center")
+@app.callback(
+    Output('selettore-campo', 'options'),
+    Output('selettore-campo', 'value'),
+    Output('riga-kpi-campi', 'style'),
+    Input("store-data", "data"),
+    Input('tabella-kpi-campi', 'active_cell'),
+    State('selettore-campo', 'value'),
+    prevent_initial_call=True
+)
+def aggiorna_selettore_campo(riferimento, cella, campo):
+    # Clic su una riga della tabella: drill-down sul campo; nuovo dataset: campi disponibili
+    if ctx.triggered_id == 'tabella-kpi-campi':
+        if not cella or cella.get('row_id') is None:
+            raise PreventUpdate
+        return no_update, cella['row_id'], no_update
+    campi = campi_dataset(carica_dati(riferimento))
+    return ([{'label': f"Campo {c}", 'value': c} for c in campi],
+            campo if campo in campi else None, stile_kpi_campi(campi))
+
 
-    # Unisci i due blocchi di card
-    kpi_cards_final = html.Div([
-        kpi_cards_base,
-        html.Br(),
-        kpi_cards_extra
-    ])
-
-    # Alert
-    alert_df = df_filtrato[df_filtrato['Alert'] != "OK"]
-    alert_items = [
-        html.Li(
-            f"{row['Data']:%Y-%m-%d}: {row['Alert']} (Temp: {row['Temperatura (°C)']}°C, "
-            f"Prec: {row['Precipitazioni (mm)']} mm, Qualità: {row['Qualità suolo (%)']}%)",
-            style={"color": "#e74c3c"}
-        )
-        for _, row in alert_df.iterrows()
-    ]
-
-    #  Distribuzione mensile con deviazione standard
-    df_filtrato['MeseNum'] = df_filtrato['Data'].dt.month
-    df_monthly = df_filtrato.groupby('MeseNum')['Quantità raccolto (kg)'].agg(['mean', 'std']).reset_index()
-
-    fig_box = px.bar(
-        df_monthly,
-        x='MeseNum',
-        y='mean',
-        error_y='std',
-        template='plotly_white',
-        title='Media Mensile della Produzione con Barre di Errore (dev. standard)'
-    )
-    fig_box.update_layout(
-        xaxis_title='Mese',
-        yaxis_title='Produzione Media (kg)'
-    )
-
-    df_monthly_cp = df_filtrato.groupby('MeseNum')[
-        ['Costo produzione (€)', 'Profitto stimato (€)']].mean().reset_index()
-    df_melted = df_monthly_cp.melt(
-        id_vars='MeseNum',
-        value_vars=['Costo produzione (€)', 'Profitto stimato (€)'],
-        var_name='Variabile',
-        value_name='Valore'
-    )
-    fig_line_cp = px.line(
-        df_melted,
-        x='MeseNum',
-        y='Valore',
-        color='Variabile',
-        markers=True,
-        template='plotly_white',
-        title='Andamento Mensile di Costi e Profitto (media mensile)'
-    )
-    fig_line_cp.update_layout(
-        xaxis_title='Mese',
-        yaxis_title='Valore (€)',
-        legend_title_text='Variabile'
-    )
-
-    return (
-        fig_line,
-        fig_scatter,
-        fig_hist,
-        kpi_cards_final,
-        alert_items,
-        fig_box,
-        fig_line_cp
-    )
-
-
-# 3) Download dati filtrati in CSV
 @app.callback(
-    Output("download-dataframe-csv", "data"),
-    Input("btn-download", "n_clicks"),
-    State('date-range', 'start_date'),
-    State('date-range', 'end_date'),
-    State("store-data", "data"),
-    prevent_initial_call=True,
+    Output('kpi-cards', 'children'),
+    *FILTRI_DASHBOARD,
+)
+def aggiorna_kpi(riferimento, start_date, end_date, quality_range):
+    return da_cache_periodo(grafici.kpi_cards, riferimento, start_date, end_date, tuple(quality_range))
+
+
+@app.callback(
+    Output('lista-alert', 'children'),
+    Output('paginazione-alert', 'max_value'),
+    Output('paginazione-alert', 'active_page'),
+    *FILTRI_DASHBOARD,
+    Input('paginazione-alert', 'active_page'),
+)
+def aggiorna_alert(riferimento, start_date, end_date, quality_range, pagina):
+    # Un cambio dei filtri riporta la lista alla prima pagina
+    if ctx.triggered_id != 'paginazione-alert':
+        pagina = 1
+    voci, pagine = da_cache_periodo(grafici.lista_alert, riferimento, start_date, end_date, tuple(quality_range),
+                                    pagina)
+    return voci, pagine, min(pagina or 1, pagine)
+
+
+@app.callback(
+    Output('conteggi-alert', 'children'),
+    *FILTRI_DASHBOARD,
+)
+def aggiorna_conteggi_alert(riferimento, start_date, end_date, quality_range):
+    return da_cache_periodo(grafici.conteggi_alert, riferimento, start_date, end_date, tuple(quality_range))
+
+
+@app.callback(
+    Output('grafico-box', 'figure'),
+    *FILTRI_DASHBOARD,
 )
-def download_filtered_data(n_clicks, start_date, end_date, data_json):
-    df = pd.read_json(data_json, orient="split")
-    mask = (df['Data'] >= start_date) & (df['Data'] <= end_date)
-    df_filtrato = df.loc[mask]
-    return dcc.send_data_frame(df_filtrato.to_csv, "dati_filtrati.csv", index=False, sep=';', encoding='utf-8-sig')
+def aggiorna_media_mensile(riferimento, start_date, end_date, quality_range):
+    return da_cache_periodo(grafici.figura_media_mensile, riferimento, start_date, end_date, tuple(quality_range))
+
+
+@app.callback(
+    Output('grafico-line-cp', 'figure'),
+    *FILTRI_DASHBOARD,
+)
+def aggiorna_costi_profitto(riferimento, start_date, end_date, quality_range):
+    return da_cache_periodo(grafici.figura_costi_profitto, riferimento, start_date, end_date, tuple(quality_range))
+
+
+# 3) Download dati filtrati: il pulsante è un link alla rotta di esportazione.py, che
+#    serve in streaming CSV (;), Parquet o Arrow IPC (gzip opzionale) con periodo e qualità
+@app.callback(
+    Output("btn-download", "href"),
+    *FILTRI_DASHBOARD,
+    Input("formato-download", "value"),
+    Input("compressione-download", "value"),
+)
+def aggiorna_link_download(riferimento, start_date, end_date, quality_range, formato="csv", gzip=False):
+    if not riferimento:
+        raise PreventUpdate
+    riferimento = vista_periodo(riferimento, start_date, end_date)
+    return url_download(riferimento, start_date, end_date, quality_range, formato or "csv", gzip,
+                        percorso=app.get_relative_path(PERCORSO_DOWNLOAD))
 
 
 # 4) Forecast: Previsione produzione per i prossimi 30 giorni
 @app.callback(
     Output('grafico-forecast', 'figure'),
     Input('date-range', 'end_date'),
-    Input("store-data", "data")
+    Input("store-data", "data"),
+    Input('modello-forecast', 'value'),
+    Input('grafico-forecast', 'relayoutData'),
 )
-def aggiorna_forecast(end_date, data_json):
-    df = pd.read_json(data_json, orient="split")
-    df_forecast = df[df['Data'] <= end_date].copy()
-    if len(df_forecast) < 2:
+def aggiorna_forecast(end_date, riferimento, modello='lineare', relayout_data=None):
+    intervallo = intervallo_zoom('grafico-forecast', relayout_data)
+    risultato = da_cache(calcola_previsione, vista_storico(riferimento, end_date), end_date, modello)
+    if risultato is None:
         return go.Figure()
-
-    df_forecast['Data'] = pd.to_datetime(df_forecast['Data'], errors='coerce')
-    df_forecast['Data_ord'] = df_forecast['Data'].map(datetime.datetime.toordinal)
-
-    x = df_forecast['Data_ord'].values
-    y = df_forecast['Quantità raccolto (kg)'].values
-
-    coeffs = np.polyfit(x, y, 1)
-    poly = np.poly1d(coeffs)
-
-    last_date = pd.to_datetime(end_date)
-    future_dates = [last_date + timedelta(days=i) for i in range(1, 31)]
-    future_ord = [d.toordinal() for d in future_dates]
-    forecast_values = poly(future_ord)
-
-    df_forecast_pred = pd.DataFrame({
-        'Data': future_dates,
-        'Quantità raccolto (kg)': forecast_values
-    })
-
-    fig_forecast = go.Figure()
-    fig_forecast.add_trace(go.Scatter(
-        x=df_forecast['Data'],
-        y=df_forecast['Quantità raccolto (kg)'],
-        mode='markers',
-        name='Storico',
-        marker=dict(color=PALETTE_COLORI["raccolto"])
-    ))
-    fig_forecast.add_trace(go.Scatter(
-        x=df_forecast_pred['Data'],
-        y=df_forecast_pred['Quantità raccolto (kg)'],
-        mode='lines+markers',
-        name='Forecast',
-        line=dict(dash='dash', color=PALETTE_COLORI["temperatura"])
-    ))
-    fig_forecast.update_layout(
-        title="Previsione Produzione (30 giorni)",
-        xaxis=dict(title="Data"),
-        yaxis=dict(title="Quantità raccolto (kg)"),
-        template="plotly_white"
-    )
+    df_forecast, df_forecast_pred = risultato
+    # Storico decimato sul range visibile (eventuale zoom)
+    i, j = posizioni_visibili(df_forecast, intervallo)
+    df_forecast = df_forecast.iloc[i:j]
+
+    with fase(FIGURA):
+        fig_forecast = go.Figure()
+        fig_forecast.add_trace(grafici.traccia_serie(
+            df_forecast['Data'],
+            df_forecast['Quantità raccolto (kg)'],
+            mode='markers',
+            name='Storico',
+            marker=dict(color=PALETTE_COLORI["raccolto"])
+        ))
+        # Intervallo di previsione come banda tra limite inferiore e superiore
+        fig_forecast.add_trace(go.Scatter(
+            x=df_forecast_pred['Data'],
+            y=df_forecast_pred[COLONNA_SUPERIORE],
+            mode='lines',
+            line=dict(width=0),
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+        fig_forecast.add_trace(go.Scatter(
+            x=df_forecast_pred['Data'],
+            y=df_forecast_pred[COLONNA_INFERIORE],
+            mode='lines',
+            line=dict(width=0),
+            fill='tonexty',
+            fillcolor='rgba(231, 76, 60, 0.15)',
+            name=f'Intervallo {LIVELLO_CONFIDENZA:.0%}',
+            hoverinfo='skip'
+        ))
+        fig_forecast.add_trace(go.Scatter(
+            x=df_forecast_pred['Data'],
+            y=df_forecast_pred['Quantità raccolto (kg)'],
+            mode='lines+markers',
+            name='Forecast',
+            line=dict(dash='dash', color=PALETTE_COLORI["temperatura"])
+        ))
+        fig_forecast.update_layout(
+            title="Previsione Produzione (30 giorni)",
+            xaxis=dict(title="Data"),
+            yaxis=dict(title="Quantità raccolto (kg)"),
+            template="plotly_white",
+            uirevision=f"{riferimento['id']}-{riferimento['versione']}-{end_date}-{modello}"
+        )
     return fig_forecast
 
 
-# 5) Download forecast in CSV
+# 5) Download forecast in CSV (stessa previsione in cache usata dal grafico)
 @app.callback(
     Output("download-forecast-csv", "data"),
     Input("btn-download-forecast", "n_clicks"),
     State('date-range', 'end_date'),
     State("store-data", "data"),
+    State('modello-forecast', 'value'),
     prevent_initial_call=True,
 )
-def download_forecast_data(n_clicks, end_date, data_json):
-    df = pd.read_json(data_json, orient="split")
-    df_forecast = df[df['Data'] <= end_date].copy()
-    if len(df_forecast) < 2:
+def download_forecast_data(n_clicks, end_date, riferimento, modello='lineare'):
+    risultato = da_cache(calcola_previsione, vista_storico(riferimento, end_date), end_date, modello)
+    if risultato is None:
         return
 
-    df_forecast['Data'] = pd.to_datetime(df_forecast['Data'], errors='coerce')
-    df_forecast['Data_ord'] = df_forecast['Data'].map(datetime.datetime.toordinal)
+    return dcc.send_data_frame(risultato.previsione.to_csv, "forecast_dati.csv", index=False)
 
-    x = df_forecast['Data_ord'].values
-    y = df_forecast['Quantità raccolto (kg)'].values
-    coeffs = np.polyfit(x, y, 1)
-    poly = np.poly1d(coeffs)
 
-    last_date = pd.to_datetime(end_date)
-    future_dates = [last_date + timedelta(days=i) for i in range(1, 31)]
-    future_ord = [d.toordinal() for d in future_dates]
-    forecast_values = poly(future_ord)
+# 6) Generazione Report PDF in background: il bottone accoda il job,
+#    l'intervallo ne interroga lo stato e al termine scarica il PDF dalla cache
+def indicatore_report(stato):
+    etichetta = "Report in coda..." if stato == IN_CODA else "Generazione del report in corso..."
+    return dbc.Progress(value=100, label=etichetta, striped=True, animated=True, style={"height": "24px"})
 
-    df_forecast_pred = pd.DataFrame({
-        'Data': future_dates,
-        'Quantità raccolto (kg)': forecast_values
-    })
 
-    return dcc.send_data_frame(df_forecast_pred.to_csv, "forecast_dati.csv", index=False)
-
-
-# 6) Generazione e download Report PDF
 @app.callback(
     Output("download-pdf", "data"),
+    Output("store-job-report", "data"),
+    Output("intervallo-report", "disabled"),
+    Output("stato-report", "children"),
     Input("btn-download-pdf", "n_clicks"),
+    Input("intervallo-report", "n_intervals"),
     State('date-range', 'start_date'),
     State('date-range', 'end_date'),
     State("store-data", "data"),
+    State("store-job-report", "data"),
     prevent_initial_call=True,
 )
-def genera_report_pdf(n_clicks, start_date, end_date, data_json):
-
-    # Converte i dati dal JSON in DataFrame
-    df = pd.read_json(data_json, orient="split")
-    mask = (df['Data'] >= start_date) & (df['Data'] <= end_date)
-    df_filtrato = df.loc[mask]
-
-    # Calcolo dei KPI principali
-    produzione_totale = df_filtrato['Quantità raccolto (kg)'].sum()
-    profitto_totale = df_filtrato['Profitto stimato (€)'].sum()
-    temperatura_media = df_filtrato['Temperatura (°C)'].mean()
-    prec_media = df_filtrato['Precipitazioni (mm)'].mean()
-
-    # Generazione di un grafico esempio: Andamento della produzione nel tempo
-    fig = px.line(df_filtrato, x='Data', y='Quantità raccolto (kg)',
-                  title="Andamento della Produzione nel Tempo",
-                  template="plotly_white")
-    # Converti il grafico in immagine PNG usando Kaleido
-    img_bytes = fig.to_image(format="png")
-    img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-
-    # Costruzione del report HTML con sezioni e grafico incluso
-    html_report = f"""
-    <html>
-    <head>
-      <meta charset="utf-8">
-      <title>Report Dashboard</title>
-      <style>
-        body {{ font-family: Arial, sans-serif; margin: 20px; }}
-        h1, h2, h3 {{ color: #2c3e50; }}
-        table {{ width: 100%; border-collapse: collapse; margin-bottom: 20px; }}
-        th, td {{ padding: 8px 12px; border: 1px solid #ccc; }}
-        th {{ background-color: #ecf0f1; }}
-        .section {{ margin-bottom: 40px; }}
-        ul {{ list-style-type: none; padding: 0; }}
-        li {{ margin-bottom: 5px; }}
-        .grafico {{ text-align: center; margin-top: 20px; }}
-      </style>
-    </head>
-    <body>
-      <h1>Report Dashboard</h1>
-      <div class="section">
-        <h2>Periodo di Analisi</h2>
-        <p><strong>Inizio:</strong> {start_date}</p>
-        <p><strong>Fine:</strong> {end_date}</p>
-      </div>
-      <div class="section">
-        <h2>Riepilogo KPI</h2>
-        <ul>
-          <li><strong>Produzione Totale:</strong> {produzione_totale:,.1f} kg</li>
-          <li><strong>Profitto Totale:</strong> {profitto_totale:,.2f} €</li>
-          <li><strong>Temperatura Media:</strong> {temperatura_media:.1f} °C</li>
-          <li><strong>Precipitazioni Medie:</strong> {prec_media:.1f} mm</li>
-        </ul>
-      </div>
-      <div class="section">
-        <h2>Grafico: Andamento della Produzione</h2>
-        <div class="grafico">
-          <img src="data:image/png;base64,{img_base64}" alt="Grafico Produzione" style="max-width:100%; height:auto;">
-        </div>
-      </div>
-      <div class="section">
-        <h2>Anteprima Dati</h2>
-        {df_filtrato.head(10).to_html(index=False)}
-      </div>
-      <div class="section">
-        <h2>Analisi e Commenti</h2>
-        <p>
-          Il report evidenzia un andamento stagionale coerente con le attese per il settore primario.
-          Si osservano variazioni significative nei KPI che potrebbero suggerire opportunità di miglioramento
-          nella gestione delle risorse e nella pianificazione della produzione.
-        </p>
-      </div>
-      <div class="section">
-        <h2>Metodologia</h2>
-        <p>
-          I dati sono stati simulati considerando variabili ambientali e produttive quali temperatura, umidità, 
-          precipitazioni, ore di sole, qualità del suolo, pH, velocità del vento e irrigazione. Il modello applica 
-          fattori correttivi basati su condizioni ideali, introducendo variabilità tramite un fattore casuale, 
-          per stimare la quantità di raccolto e il profitto. Questo approccio consente di analizzare scenari e supportare 
-          le decisioni strategiche.
-        </p>
-      </div>
-    </body>
-    </html>
-    """
-    pdf = pdfkit.from_string(html_report, False)
-    return dcc.send_bytes(pdf, "report_dashboard.pdf")
-
+def genera_report_pdf(n_clicks, n_intervals, start_date, end_date, riferimento, job_id):
+    if ctx.triggered_id == "btn-download-pdf":
+        # Recupera i dati dal registro
+        riferimento = vista_periodo(riferimento, start_date, end_date)
+        df = carica_dati(riferimento)
+        df_filtrato = filtra_periodo(df, start_date, end_date)
+
+        # Calcolo dei KPI principali
+        cubo = cubo_aggregati(riferimento)
+        kpi = cubo.kpi(start_date, end_date) if cubo.supporta(start_date, end_date) else kpi_dataframe(df_filtrato)
+
+        # Al worker vanno solo la serie del grafico e l'anteprima della tabella
+        chiave = (riferimento["id"], riferimento["versione"], start_date, end_date)
+        job_id = coda_report.accoda(chiave, espandi(df_filtrato[['Data', 'Quantità raccolto (kg)']]),
+                                    espandi(df_filtrato.head(10)), start_date, end_date, kpi)
+    if not job_id:
+        raise PreventUpdate
+
+    stato = coda_report.stato(job_id)
+    if stato == COMPLETATO:
+        return dcc.send_bytes(coda_report.risultato(job_id), NOME_FILE_REPORT), None, True, None
+    if stato == ERRORE:
+        messaggio = dbc.Alert(f"Errore nella generazione del report: {coda_report.errore(job_id)}",
+                              color="danger", dismissable=True)
+        return no_update, None, True, messaggio
+    if stato is None:
+        return no_update, None, True, None
+    return no_update, job_id, False, indicatore_report(stato)
 
 
 # 7) Comparazione periodica: confronto tra due periodi
@@ -465,18 +401,21 @@ def genera_report_pdf(n_clicks, start_date, end_date, data_json):
     Input('date-range-2', 'end_date'),
     Input("store-data", "data")
 )
-def aggiorna_comparazione(start1, end1, start2, end2, data_json):
-    df = pd.read_json(data_json, orient="split")
-
-    # Filtro per i due periodi
-    mask1 = (df['Data'] >= start1) & (df['Data'] <= end1)
-    mask2 = (df['Data'] >= start2) & (df['Data'] <= end2)
-    df1 = df.loc[mask1]
-    df2 = df.loc[mask2]
-
-    # Calcolo KPI per i due periodi
-    produzione1 = df1['Quantità raccolto (kg)'].sum()
-    produzione2 = df2['Quantità raccolto (kg)'].sum()
+def aggiorna_comparazione(start1, end1, start2, end2, riferimento):
+    # Filtro per i due periodi (ciascuno dalla propria finestra dell'archivio storico, se serve)
+    riferimento1 = vista_periodo(riferimento, start1, end1)
+    riferimento2 = vista_periodo(riferimento, start2, end2)
+    df1 = espandi(filtra_periodo(carica_dati(riferimento1), start1, end1), ['Quantità raccolto (kg)'])
+    df2 = espandi(filtra_periodo(carica_dati(riferimento2), start2, end2), ['Quantità raccolto (kg)'])
+
+    # Calcolo KPI per i due periodi (dal cubo di aggregati, se applicabile)
+    cubo1, cubo2 = cubo_aggregati(riferimento1), cubo_aggregati(riferimento2)
+    if cubo1.supporta(start1, end1) and cubo2.supporta(start2, end2):
+        produzione1 = cubo1.somma('Quantità raccolto (kg)', start1, end1)
+        produzione2 = cubo2.somma('Quantità raccolto (kg)', start2, end2)
+    else:
+        produzione1 = df1['Quantità raccolto (kg)'].sum()
+        produzione2 = df2['Quantità raccolto (kg)'].sum()
     variazione = ((produzione2 - produzione1) / produzione1 * 100) if produzione1 != 0 else 0
 
     # KPI comparazione
@@ -492,22 +431,29 @@ def aggiorna_comparazione(start1, end1, start2, end2, data_json):
     ], justify="center")
 
     # Grafico comparativo (es. trend della produzione nei due periodi)
-    df1['Periodo'] = 'Periodo 1'
-    df2['Periodo'] = 'Periodo 2'
-    df_comp = pd.concat([df1, df2])
-    fig_comp = px.line(df_comp, x='Data', y='Quantità raccolto (kg)', color='Periodo',
-                       template="plotly_white",
-                       title="Confronto Produzione tra i due Periodi Scelti ")
+    df_comp = pd.concat([df1.assign(Periodo='Periodo 1'), df2.assign(Periodo='Periodo 2')])
+    with fase(FIGURA):
+        fig_comp = px.line(df_comp, x='Data', y='Quantità raccolto (kg)', color='Periodo',
+                           template="plotly_white",
+                           title="Confronto Produzione tra i due Periodi Scelti ")
 
     return fig_comp, kpi_comparazione
+# 8) Tabella dati: paginazione, ordinamento e filtri eseguiti lato server
 @app.callback(
-    Output("table-dati", "data"),      # la proprietà "data" della dash_table
-    Input("store-data", "data")        # quando cambia il contenuto di store-data
+    Output("table-dati", "data"),
+    Output("table-dati", "page_count"),
+    Output("table-dati", "page_current"),
+    Input("store-data", "data"),
+    Input("table-dati", "page_current"),
+    Input("table-dati", "page_size"),
+    Input("table-dati", "sort_by"),
+    Input("table-dati", "filter_query"),
 )
-def aggiorna_tabella(data_json):
-    # Leggi il DataFrame dal JSON
-    df = pd.read_json(data_json, orient="split")
-    # Convertilo in records e ritornalo
-    return df.to_dict("records")
-
-#controllare arima per evitare una semplixe regressione lineare e inserire arima per calcolare regressione lineare particolare con previsione dati accurata
\ No newline at end of file
+def aggiorna_tabella(riferimento, page_current, page_size, sort_by, filter_query):
+    # Nuovi dati, ordinamento o filtro riportano la tabella alla prima pagina
+    if "table-dati.page_current" not in ctx.triggered_prop_ids:
+        page_current = 0
+    carica_dati(riferimento)
+    righe, pagine, page_current = pagina_tabella(riferimento, page_current or 0, page_size or RIGHE_PER_PAGINA,
+                                                 sort_by, filter_query)
+    return righe, pagine, page_current
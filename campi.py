@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from app.dataset import registro, DatasetNonTrovato
+from app.schema import espandi
+
+
+# Dataset con più campi (colonna 'Campo', ad esempio dall'archivio storico):
+# KPI per campo calcolati con un solo groupby, viste di un singolo campo per il drill-down
+# e serie con una riga per data (media tra i campi) per i grafici temporali.
+COLONNA_CAMPO = 'Campo'
+COLONNE_KPI_CAMPO = ['Quantità raccolto (kg)', 'Profitto stimato (€)',
+                     'Costo produzione (€)', 'Costo irrigazione (€)']
+
+
+def campi_dataset(df):
+    if COLONNA_CAMPO not in df.columns:
+        return []
+    return [int(campo) for campo in np.unique(df[COLONNA_CAMPO].to_numpy())]
+
+
+def _rapporto(numeratore, denominatore):
+    # Come completa_kpi: 0 quando il denominatore è nullo
+    risultato = np.zeros(len(numeratore))
+    np.divide(numeratore, denominatore, out=risultato, where=denominatore != 0)
+    return risultato
+
+
+def kpi_per_campo(df_filtrato):
+    # KPI di completa_kpi per ogni campo del periodo, in un solo passaggio raggruppato
+    if COLONNA_CAMPO not in df_filtrato.columns:
+        return pd.DataFrame(columns=[COLONNA_CAMPO])
+    df_filtrato = espandi(df_filtrato, COLONNE_KPI_CAMPO)
+    somme = df_filtrato.groupby(COLONNA_CAMPO, sort=True)[COLONNE_KPI_CAMPO].sum()
+    produzione = somme['Quantità raccolto (kg)'].to_numpy()
+    profitto = somme['Profitto stimato (€)'].to_numpy()
+    costo = (somme['Costo produzione (€)'] + somme['Costo irrigazione (€)']).to_numpy()
+    return pd.DataFrame({
+        COLONNA_CAMPO: somme.index.to_numpy(),
+        'Produzione (kg)': produzione,
+        'Profitto (€)': profitto,
+        'Margine netto (%)': _rapporto(profitto, profitto + costo) * 100,
+        'Costo medio (€/kg)': _rapporto(costo, np.where(produzione > 0, produzione, 0)),
+    })
+
+
+def media_per_data(df, colonne):
+    # Con più campi, una riga per data con la media dei campi (colonna e indice 'Data' come
+    # nel registro), così le serie temporali non saltano da un campo all'altro
+    if COLONNA_CAMPO not in df.columns:
+        return df
+    colonne = list(dict.fromkeys(colonne))
+    medie = espandi(df, colonne).groupby(level=0, sort=True)[colonne].mean()
+    medie.insert(0, 'Data', medie.index)
+    medie.index.name = None
+    return medie
+
+
+def riferimento_campo(riferimento, campo):
+    # Righe di un solo campo registrate come dataset a sé (id derivato, stessa versione):
+    # i grafici memoizzati le trattano come qualsiasi altro dataset
+    if not riferimento or campo is None:
+        return riferimento
+    vista = {"id": f"{riferimento['id']}-campo-{int(campo)}", "versione": riferimento["versione"]}
+    try:
+        registro.carica(vista)
+    except DatasetNonTrovato:
+        df = registro.carica(riferimento)
+        if COLONNA_CAMPO not in df.columns:
+            return riferimento
+        registro.registra(df[df[COLONNA_CAMPO].to_numpy() == int(campo)], vista)
+    return vista
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+
+# Test di carico locale delle callback: python -m app.carico --worker 1 2 4
+# avvia gunicorn con ciascun numero di worker e misura throughput e latenza
+# delle callback eseguite al caricamento della pagina; con --url interroga un
+# server già in esecuzione (ad esempio il server di sviluppo di main.py).
+
+# Callback attivate da pulsanti o dal polling dei report: escluse dal carico
+INPUT_ESCLUSI = ("btn-", "intervallo-")
+
+
+def _richiesta(url, payload=None, timeout=60):
+    dati = None if payload is None else json.dumps(payload).encode("utf-8")
+    richiesta = urllib.request.Request(url, data=dati, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(richiesta, timeout=timeout) as risposta:
+        return risposta.read()
+
+
+def valori_layout(nodo, valori=None):
+    # Proprietà dei componenti del layout serializzato, per id
+    valori = {} if valori is None else valori
+    if isinstance(nodo, list):
+        for figlio in nodo:
+            valori_layout(figlio, valori)
+    elif isinstance(nodo, dict):
+        props = nodo.get("props", {})
+        if "id" in props:
+            valori[props["id"]] = props
+        for valore in props.values():
+            if isinstance(valore, (list, dict)):
+                valori_layout(valore, valori)
+    return valori
+
+
+def _dipendenze(output):
+    # "..a.x...b.y.." -> [{"id": "a", "property": "x"}, ...]
+    parti = output.strip(".").split("...") if output.startswith("..") else [output]
+    dipendenze = [dict(zip(("id", "property"), parte.rsplit(".", 1))) for parte in parti]
+    return dipendenze if output.startswith("..") else dipendenze[0]
+
+
+def richieste_callback(base_url):
+    # Payload di /_dash-update-component per le callback della pagina, con i valori iniziali del layout
+    valori = valori_layout(json.loads(_richiesta(f"{base_url}/_dash-layout")))
+    payload = []
+    for dipendenza in json.loads(_richiesta(f"{base_url}/_dash-dependencies")):
+        if any(i["id"].startswith(INPUT_ESCLUSI) for i in dipendenza["inputs"]):
+            continue
+
+        def valore(d):
+            return {"id": d["id"], "property": d["property"], "value": valori.get(d["id"], {}).get(d["property"])}
+
+        payload.append({
+            "output": dipendenza["output"],
+            "outputs": _dipendenze(dipendenza["output"]),
+            "inputs": [valore(d) for d in dipendenza["inputs"]],
+            "state": [valore(d) for d in dipendenza["state"]],
+            "changedPropIds": [],
+        })
+    return payload
+
+
+def varia_periodo(payload, rng):
+    # Data finale casuale nel periodo iniziale: evita che ogni richiesta colpisca le cache memoizzate
+    payload = json.loads(json.dumps(payload))
+    for voce in payload["inputs"]:
+        if voce["id"] == "date-range" and voce["property"] == "end_date" and voce["value"]:
+            fine = pd.Timestamp(voce["value"]) - pd.Timedelta(days=int(rng.integers(0, 180)))
+            voce["value"] = fine.strftime("%Y-%m-%d")
+    return payload
+
+
+def esegui_carico(base_url, richieste=200, concorrenza=8, varia=False, seed=0):
+    payload = richieste_callback(base_url)
+    url = f"{base_url}/_dash-update-component"
+    # Riscaldamento: una chiamata per callback
+    for voce in payload:
+        _richiesta(url, voce)
+    rng = np.random.default_rng(seed)
+    sequenza = [payload[i % len(payload)] for i in range(richieste)]
+    if varia:
+        sequenza = [varia_periodo(voce, rng) for voce in sequenza]
+    random.Random(seed).shuffle(sequenza)
+
+    latenze = []
+    errori = []
+    indice = iter(range(len(sequenza)))
+    lock = threading.Lock()
+
+    def lavora():
+        while True:
+            with lock:
+                i = next(indice, None)
+            if i is None:
+                return
+            inizio = time.perf_counter()
+            try:
+                _richiesta(url, sequenza[i])
+            except Exception as errore:
+                with lock:
+                    errori.append(errore)
+                continue
+            with lock:
+                latenze.append(time.perf_counter() - inizio)
+
+    inizio = time.perf_counter()
+    thread = [threading.Thread(target=lavora) for _ in range(concorrenza)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    durata = time.perf_counter() - inizio
+    latenze = np.array(latenze) * 1000
+    return {
+        "richieste": len(latenze),
+        "errori": len(errori),
+        "richieste_al_secondo": len(latenze) / durata,
+        "p50_ms": float(np.percentile(latenze, 50)) if len(latenze) else float("nan"),
+        "p95_ms": float(np.percentile(latenze, 95)) if len(latenze) else float("nan"),
+    }
+
+
+def _porta_libera():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _attendi_server(base_url, processo, timeout=120):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"gunicorn terminato con codice {processo.returncode}")
+        try:
+            _richiesta(f"{base_url}/_dash-layout", timeout=5)
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"server non raggiungibile su {base_url}")
+
+
+def avvia_gunicorn(worker, thread, cartella_condivisa):
+    # gunicorn avviato dalla cartella che contiene il pacchetto app
+    import app
+
+    cartella_app = app.__path__[0]
+    porta = _porta_libera()
+    comando = [sys.executable, "-m", "gunicorn", "-c", os.path.join(cartella_app, "gunicorn.conf.py"),
+               "--workers", str(worker), "--threads", str(thread),
+               "--bind", f"127.0.0.1:{porta}", "app.wsgi:server"]
+    ambiente = dict(os.environ, DASHBOARD_CARTELLA_CONDIVISA=cartella_condivisa)
+    processo = subprocess.Popen(comando, cwd=os.path.dirname(cartella_app), env=ambiente,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{porta}"
+    try:
+        _attendi_server(base_url, processo)
+    except Exception:
+        processo.terminate()
+        processo.wait()
+        raise
+    return processo, base_url
+
+
+def stampa_risultato(etichetta, risultato):
+    print(f"{etichetta:<14}{risultato['richieste']:>10}{risultato['errori']:>8}"
+          f"{risultato['richieste_al_secondo']:>12.1f}{risultato['p50_ms']:>12.1f}{risultato['p95_ms']:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Test di carico delle callback della dashboard")
+    parser.add_argument("--url", help="server già avviato (es. http://127.0.0.1:8050); "
+                                      "altrimenti gunicorn viene avviato per ogni numero di worker")
+    parser.add_argument("--worker", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--thread", type=int, default=4, help="thread per worker gunicorn")
+    parser.add_argument("--richieste", type=int, default=200)
+    parser.add_argument("--concorrenza", type=int, default=8, help="client simultanei")
+    parser.add_argument("--varia", action="store_true",
+                        help="data finale casuale per ogni richiesta (cache memoizzate fredde)")
+    args = parser.parse_args()
+
+    print(f"{'worker':<14}{'richieste':>10}{'errori':>8}{'req/s':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    if args.url:
+        stampa_risultato("server", esegui_carico(args.url.rstrip("/"), args.richieste, args.concorrenza, args.varia))
+    else:
+        for worker in args.worker:
+            with tempfile.TemporaryDirectory() as cartella_condivisa:
+                processo, base_url = avvia_gunicorn(worker, args.thread, cartella_condivisa)
+                try:
+                    risultato = esegui_carico(base_url, args.richieste, args.concorrenza, args.varia)
+                finally:
+                    processo.terminate()
+                    processo.wait()
+            stampa_risultato(str(worker), risultato)
@@ -1,15 +1,64 @@
+import threading
+from functools import lru_cache
+
 from dash import html, dcc, dash_table
+from dash.dash_table.Format import Format, Scheme
 import dash_bootstrap_components as dbc
-import pandas as pd
-from app.utils import genera_dati_simulati, PALETTE_COLORI, create_kpi_card
+from app.config import (FILE_DATASET_INIZIALE, CARTELLA_INGESTIONE, INTERVALLO_INGESTIONE_S,
+                        ARCHIVIO_STORICO, GIORNI_ARCHIVIO)
+from app.utils import genera_dati_simulati
+from app.dataset import registro, leggi_o_genera, DatasetNonTrovato
+from app.tabella import colonne_tabella, RIGHE_PER_PAGINA
+from app.archivio import apri_archivio, collega_archivio, finestra_iniziale
+from app.campi import campi_dataset, COLONNA_CAMPO
+
+
+# Dati iniziali: dati simulati generati (o letti dal file DASHBOARD_DATASET_INIZIALE) una
+# sola volta, alla prima costruzione del layout, oppure una finestra dell'archivio storico
+# (DASHBOARD_ARCHIVIO_STORICO) che il registro legge in memory-map quando viene richiesta
+@lru_cache(maxsize=1)
+def dataset_iniziale():
+    return leggi_o_genera(FILE_DATASET_INIZIALE, genera_dati_simulati)
+
+
+if ARCHIVIO_STORICO:
+    collega_archivio(ARCHIVIO_STORICO)
+
+
+def limiti_date(df_iniziale):
+    # Date selezionabili: il dataset iniziale e, con l'archivio storico, tutto il suo periodo
+    # (dal footer del file, senza leggere le righe)
+    primo, ultimo = df_iniziale['Data'].min(), df_iniziale['Data'].max()
+    if ARCHIVIO_STORICO:
+        inizio_archivio, fine_archivio = apri_archivio(ARCHIVIO_STORICO).periodo()
+        primo, ultimo = min(primo, inizio_archivio), max(ultimo, fine_archivio)
+    return primo, ultimo
 
-# Dati iniziali simulati
-df_iniziale = genera_dati_simulati()
 
+# Colonne che non sono misure (escluse dai selettori delle variabili)
+COLONNE_NON_MISURE = ['Data', 'Alert', 'Campo']
 
 
-# dcc.Store per mantenere i dati nel browser
-store_data = dcc.Store(id="store-data", data=df_iniziale.to_json(date_format="iso", orient="split"))
+_riferimento_iniziale = None
+_lock_iniziale = threading.Lock()
+
+
+def riferimento_iniziale():
+    # Registrato una volta (ultima versione, se sono stati accodati dati dalla cartella
+    # di ingestione); se il registro lo ha espulso viene registrato di nuovo
+    global _riferimento_iniziale
+    with _lock_iniziale:
+        riferimento = registro.ultima_versione(_riferimento_iniziale) if _riferimento_iniziale else None
+        try:
+            registro.carica(riferimento)
+        except DatasetNonTrovato:
+            if ARCHIVIO_STORICO:
+                riferimento = finestra_iniziale(ARCHIVIO_STORICO, GIORNI_ARCHIVIO)
+            else:
+                riferimento = registro.registra(dataset_iniziale())
+            _riferimento_iniziale = riferimento
+        return riferimento
+
 
 # Navbar con header e sottotitolo
 navbar = dbc.Navbar(
@@ -25,48 +74,64 @@ navbar = dbc.Navbar(
     className="mb-4"
 )
 # Definizione dello scatter options
-scatter_options = dbc.Row([
-    dbc.Col([
-        html.Label("Asse X:"),
-        dcc.Dropdown(
-            id='scatter-x-dropdown',
-            options=[{'label': col, 'value': col} for col in df_iniziale.columns if col not in ['Data', 'Alert']],
-            value='Temperatura (°C)'
-        )
-    ], width=2),
-    dbc.Col([
-        html.Label("Asse Y:"),
-        dcc.Dropdown(
-            id='scatter-y-dropdown',
-            options=[{'label': col, 'value': col} for col in df_iniziale.columns if col not in ['Data', 'Alert']],
-            value='Quantità raccolto (kg)'
-        )
-    ], width=2),
-    dbc.Col([
-        html.Label("Colorazione per:"),
-        dcc.Dropdown(
-            id='scatter-color-dropdown',
-            options=[{'label': col, 'value': col} for col in df_iniziale.columns if col not in ['Data', 'Alert']],
-            value='Temperatura (°C)'
-        )
-    ], width=2)
-])
+def crea_scatter_options(df_iniziale):
+    return dbc.Row([
+        dbc.Col([
+            html.Label("Asse X:"),
+            dcc.Dropdown(
+                id='scatter-x-dropdown',
+                options=[{'label': col, 'value': col} for col in df_iniziale.columns if col not in COLONNE_NON_MISURE],
+                value='Temperatura (°C)'
+            )
+        ], width=2),
+        dbc.Col([
+            html.Label("Asse Y:"),
+            dcc.Dropdown(
+                id='scatter-y-dropdown',
+                options=[{'label': col, 'value': col} for col in df_iniziale.columns if col not in COLONNE_NON_MISURE],
+                value='Quantità raccolto (kg)'
+            )
+        ], width=2),
+        dbc.Col([
+            html.Label("Colorazione per:"),
+            dcc.Dropdown(
+                id='scatter-color-dropdown',
+                options=[{'label': col, 'value': col} for col in df_iniziale.columns if col not in COLONNE_NON_MISURE],
+                value='Temperatura (°C)'
+            )
+        ], width=2),
+        dbc.Col([
+            html.Label("Linea di tendenza:"),
+            dcc.Dropdown(
+                id='scatter-trendline-dropdown',
+                options=[
+                    {'label': 'Regressione lineare (OLS)', 'value': 'ols'},
+                    {'label': 'LOWESS', 'value': 'lowess'},
+                    {'label': 'Nessuna', 'value': ''},
+                ],
+                value='ols',
+                clearable=False
+            )
+        ], width=2)
+    ])
 
 # -----------------------------------------
 # Colonne della prima riga: Periodo, Qualità
 # -----------------------------------------
-date_picker = dbc.Col([
-    html.Label("Periodo analisi:", style={"fontWeight": "bold"}),
-    dcc.DatePickerRange(
-        id='date-range',
-        min_date_allowed=df_iniziale['Data'].min(),
-        max_date_allowed=df_iniziale['Data'].max(),
-        start_date=df_iniziale['Data'].min(),
-        end_date=df_iniziale['Data'].max(),
-        display_format='DD/MM/YYYY',
-        style={"width": "100%"}
-    )
-], width=4)
+def crea_date_picker(df_iniziale):
+    primo, ultimo = limiti_date(df_iniziale)
+    return dbc.Col([
+        html.Label("Periodo analisi:", style={"fontWeight": "bold"}),
+        dcc.DatePickerRange(
+            id='date-range',
+            min_date_allowed=primo,
+            max_date_allowed=ultimo,
+            start_date=df_iniziale['Data'].min(),
+            end_date=df_iniziale['Data'].max(),
+            display_format='DD/MM/YYYY',
+            style={"width": "100%"}
+        )
+    ], width=4)
 
 quality_slider = dbc.Col([
     html.Label("Filtra per Qualità del suolo (%):", style={"fontWeight": "bold"}),
@@ -81,7 +146,22 @@ quality_slider = dbc.Col([
 ], width=3)
 
 # Bottone per scaricare CSV
-button_download_csv = dbc.Button("Scarica dati filtrati", id="btn-download", color="primary", className="shadow-sm")
+# Link alla rotta di download in streaming (href aggiornato con i filtri correnti)
+button_download_csv = dbc.Button("Scarica dati filtrati", id="btn-download", href="", external_link=True,
+                                 color="primary", className="shadow-sm")
+
+# Formato del file scaricato con i dati filtrati
+formato_download = dcc.Dropdown(
+    id="formato-download",
+    options=[
+        {"label": "CSV (;)", "value": "csv"},
+        {"label": "Parquet", "value": "parquet"},
+        {"label": "Arrow IPC", "value": "arrow"},
+    ],
+    value="csv",
+    clearable=False
+)
+compressione_download = dbc.Checkbox(id="compressione-download", label="Compressione gzip", value=False)
 
 # Bottone per scaricare Report PDF
 button_download_pdf = dbc.Button("Scarica Report PDF", id="btn-download-pdf", color="primary", className="shadow-sm")
@@ -102,6 +182,52 @@ pulsante_genera_dati = dbc.Row(
     className="mb-4"
 )
 
+# Selettore del campo e KPI per campo (righe visibili solo con dataset a più campi):
+# un clic su una riga della tabella filtra sul campo i grafici linee, scatter e istogramma
+def colonna_kpi(nome, decimali):
+    return {"name": nome, "id": nome, "type": "numeric", "format": Format(precision=decimali, scheme=Scheme.fixed)}
+
+
+COLONNE_KPI_CAMPI = [
+    {"name": COLONNA_CAMPO, "id": COLONNA_CAMPO, "type": "numeric"},
+    colonna_kpi("Produzione (kg)", 1),
+    colonna_kpi("Profitto (€)", 2),
+    colonna_kpi("Margine netto (%)", 1),
+    colonna_kpi("Costo medio (€/kg)", 2),
+]
+
+
+def stile_kpi_campi(campi):
+    return None if campi else {"display": "none"}
+
+
+def crea_kpi_campi(df_iniziale):
+    campi = campi_dataset(df_iniziale)
+    return dbc.Row([
+        dbc.Col([
+            html.Label("Campo:", style={"fontWeight": "bold"}),
+            dcc.Dropdown(
+                id='selettore-campo',
+                options=[{'label': f"Campo {campo}", 'value': campo} for campo in campi],
+                value=None,
+                placeholder="Tutti i campi"
+            )
+        ], width=3),
+        dbc.Col(
+            dash_table.DataTable(
+                id='tabella-kpi-campi',
+                columns=COLONNE_KPI_CAMPI,
+                data=[],
+                page_size=10,
+                sort_action='native',
+                style_table={'overflowX': 'auto'},
+                style_cell={'textAlign': 'center', 'fontFamily': 'Arial', 'cursor': 'pointer'},
+                style_header={'fontWeight': 'bold'}
+            ), width=9
+        )
+    ], id='riga-kpi-campi', className="mb-4", style=stile_kpi_campi(campi))
+
+
 # Grafici
 graph_line = dcc.Graph(id='grafico-line', style={"backgroundColor": "#fff", "borderRadius": "10px"})
 graph_scatter = dcc.Graph(id='grafico-scatter', style={"backgroundColor": "#fff", "borderRadius": "10px"})
@@ -111,122 +237,173 @@ graph_forecast = dcc.Graph(id='grafico-forecast', style={"backgroundColor": "#ff
 graph_line_cp = dcc.Graph( id='grafico-line-cp', style={"backgroundColor": "#fff", "borderRadius": "10px"})
 
 
-# Container Alert
-alert_list = html.Div(id='lista-alert', style={"maxHeight": "200px", "overflowY": "auto"})
+# Container Alert: conteggi per categoria e lista paginata (solo la pagina visibile)
+conteggi_alert = html.Div(id='conteggi-alert', className="mb-2")
+alert_list = html.Ul(id='lista-alert', style={"maxHeight": "200px", "overflowY": "auto", "color": "#e74c3c"})
+paginazione_alert = dbc.Pagination(id='paginazione-alert', max_value=1, active_page=1,
+                                   fully_expanded=False, size="sm", className="mt-2")
 
 # Tabella dati simulati
-data_table = dash_table.DataTable(
-    id='table-dati',
-    columns=[{"name": i, "id": i} for i in df_iniziale.columns],
-    data=df_iniziale.to_dict('records'),
-    page_size=10,
-    style_table={'overflowX': 'auto'},
-    style_cell={'textAlign': 'center', 'fontFamily': 'Arial'},
-    style_header={'fontWeight': 'bold'},
-    style_data={'whiteSpace': 'normal', 'height': 'auto'}
-)
+def crea_data_table(df_iniziale):
+    return dash_table.DataTable(
+        id='table-dati',
+        columns=colonne_tabella(df_iniziale),
+        # Righe fornite dalla callback: solo la pagina corrente, già filtrata e ordinata
+        data=[],
+        page_current=0,
+        page_size=RIGHE_PER_PAGINA,
+        page_action='custom',
+        sort_action='custom',
+        sort_mode='single',
+        sort_by=[],
+        filter_action='custom',
+        filter_query='',
+        style_table={'overflowX': 'auto'},
+        style_cell={'textAlign': 'center', 'fontFamily': 'Arial'},
+        style_header={'fontWeight': 'bold'},
+        style_data={'whiteSpace': 'normal', 'height': 'auto'}
+    )
 
 # --- Tab per la Comparazione Periodica ---
-comparazione_tab = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            html.Label("Periodo 1:", style={"fontWeight": "bold"}),
-            dcc.DatePickerRange(
-                id='date-range-1',
-                min_date_allowed=df_iniziale['Data'].min(),
-                max_date_allowed=df_iniziale['Data'].max(),
-                start_date=df_iniziale['Data'].min(),
-                end_date=df_iniziale['Data'].iloc[182],
-                display_format='DD/MM/YYYY',
-                style={"width": "100%"}
-            )
-        ], width=6),
-        dbc.Col([
-            html.Label("Periodo 2:", style={"fontWeight": "bold"}),
-            dcc.DatePickerRange(
-                id='date-range-2',
-                min_date_allowed=df_iniziale['Data'].min(),
-                max_date_allowed=df_iniziale['Data'].max(),
-                start_date=df_iniziale['Data'].iloc[183],
-                end_date=df_iniziale['Data'].max(),
-                display_format='DD/MM/YYYY',
-                style={"width": "100%"}
+def date_comparazione(df_iniziale):
+    # Periodo 1 fino al giorno centrale, Periodo 2 dal giorno successivo: la divisione è sui
+    # giorni distinti, così più campi (o più righe) per giorno non la spostano
+    giorni = df_iniziale['Data'].dt.normalize().drop_duplicates().sort_values()
+    meta = (len(giorni) - 1) // 2
+    return giorni.iloc[meta], giorni.iloc[min(meta + 1, len(giorni) - 1)]
+
+
+def crea_comparazione_tab(df_iniziale):
+    fine_periodo_1, inizio_periodo_2 = date_comparazione(df_iniziale)
+    primo, ultimo = limiti_date(df_iniziale)
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                html.Label("Periodo 1:", style={"fontWeight": "bold"}),
+                dcc.DatePickerRange(
+                    id='date-range-1',
+                    min_date_allowed=primo,
+                    max_date_allowed=ultimo,
+                    start_date=df_iniziale['Data'].min(),
+                    end_date=fine_periodo_1,
+                    display_format='DD/MM/YYYY',
+                    style={"width": "100%"}
+                )
+            ], width=6),
+            dbc.Col([
+                html.Label("Periodo 2:", style={"fontWeight": "bold"}),
+                dcc.DatePickerRange(
+                    id='date-range-2',
+                    min_date_allowed=primo,
+                    max_date_allowed=ultimo,
+                    start_date=inizio_periodo_2,
+                    end_date=df_iniziale['Data'].max(),
+                    display_format='DD/MM/YYYY',
+                    style={"width": "100%"}
+                )
+            ], width=6)
+        ], className="mb-3"),
+        dbc.Row([
+            dbc.Col(
+                dcc.Graph(id='grafico-comparazione', style={"backgroundColor": "#fff", "borderRadius": "10px"}),
+                width=12
             )
-        ], width=6)
-    ], className="mb-3"),
-    dbc.Row([
-        dbc.Col(
-            dcc.Graph(id='grafico-comparazione', style={"backgroundColor": "#fff", "borderRadius": "10px"}),
-            width=12
-        )
-    ], className="mb-4"),
-    dbc.Row(id='kpi-comparazione', justify="center")
-], fluid=True)
+        ], className="mb-4"),
+        dbc.Row(id='kpi-comparazione', justify="center")
+    ], fluid=True)
 
 # --- Layout delle varie Tabs ---
 
 # Tab "Dashboard"
-dashboard_tab = dbc.Container([
-    # RIGA 1: Periodo, Variabili, Qualità
-    dbc.Row([date_picker, quality_slider], className="mb-3"),
+def crea_dashboard_tab(df_iniziale):
+    return dbc.Container([
+        # RIGA 1: Periodo, Variabili, Qualità
+            dbc.Row([crea_date_picker(df_iniziale), quality_slider], className="mb-3"),
 
-    # RIGA 2: KPI Cards
-    kpi_cards_container,
+        # RIGA 2: KPI Cards
+        kpi_cards_container,
 
-    # RIGA 3: Pulsante Genera Dati
-    pulsante_genera_dati,
-dbc.Row([
-        dbc.Col([
-            html.Label("Variabili da visualizzare:", style={"fontWeight": "bold"}),
-            dcc.Dropdown(
-                id='variabili-dropdown',
-                options=[
-                    {'label': col, 'value': col}
-                    for col in df_iniziale.columns if col not in ['Data', 'Alert']
-                ],
-                value=['Quantità raccolto (kg)', 'Profitto stimato (€)'],
-                multi=True
-            )
-        ], width=4)
-    ], className="mb-2"),
-    # GRAFICO LINE
-    dbc.Row([graph_line], className="mb-4"),
-    dbc.Row([scatter_options], className="mb-3"),
+        # RIGA 3: Pulsante Genera Dati
+        pulsante_genera_dati,
 
-    # SCATTER E HIST
+        # Selettore del campo e KPI per campo
+        crea_kpi_campi(df_iniziale),
     dbc.Row([
-        dbc.Col(graph_scatter, width=6),
-        dbc.Col(graph_hist, width=6)
-    ], className="mb-4"),
+            dbc.Col([
+                html.Label("Variabili da visualizzare:", style={"fontWeight": "bold"}),
+                dcc.Dropdown(
+                    id='variabili-dropdown',
+                    options=[
+                        {'label': col, 'value': col}
+                        for col in df_iniziale.columns if col not in COLONNE_NON_MISURE
+                    ],
+                    value=['Quantità raccolto (kg)', 'Profitto stimato (€)'],
+                    multi=True
+                )
+            ], width=4)
+        ], className="mb-2"),
+        # GRAFICO LINE
+        dbc.Row([graph_line], className="mb-4"),
+        dbc.Row([crea_scatter_options(df_iniziale)], className="mb-3"),
 
+        # SCATTER E HIST
+        dbc.Row([
+            dbc.Col(graph_scatter, width=6),
+            dbc.Col(graph_hist, width=6)
+        ], className="mb-4"),
 
-    # BOX PLOT + line chart costi/profitto
-    dbc.Row([
-        dbc.Col(graph_box, width=6),
-        dbc.Col(graph_line_cp, width=6)
-    ], className="mb-4"),
 
-    # ALERT
-    dbc.Row([
-        dbc.Col([
-            html.H5("Alert - Giorni con condizioni estreme:", style={"fontWeight": "bold"}),
-            alert_list
-        ], width=12)
-    ], className="mb-4"),
+        # BOX PLOT + line chart costi/profitto
+        dbc.Row([
+            dbc.Col(graph_box, width=6),
+            dbc.Col(graph_line_cp, width=6)
+        ], className="mb-4"),
 
-    # DOWNLOAD BUTTONS
-    dbc.Row([
-        dbc.Col(button_download_csv, width={"size": 2, "offset": 4}),
-        dbc.Col(button_download_pdf, width=2)
-    ], className="mb-4"),
+        # ALERT
+        dbc.Row([
+            dbc.Col([
+                html.H5("Alert - Giorni con condizioni estreme:", style={"fontWeight": "bold"}),
+                conteggi_alert,
+                alert_list,
+                paginazione_alert
+            ], width=12)
+        ], className="mb-4"),
 
-    dcc.Download(id="download-dataframe-csv"),
-    dcc.Download(id="download-pdf")
-], fluid=True)
+        # DOWNLOAD BUTTONS
+        dbc.Row([
+            dbc.Col([formato_download, compressione_download], width={"size": 2, "offset": 3}),
+            dbc.Col(button_download_csv, width=2),
+            dbc.Col(button_download_pdf, width=2)
+        ], className="mb-4"),
+
+        # Stato del job di generazione del report PDF (interrogato dall'intervallo)
+        dbc.Row([
+            dbc.Col(html.Div(id="stato-report"), width={"size": 6, "offset": 3})
+        ], className="mb-4"),
+
+        dcc.Download(id="download-pdf"),
+        dcc.Store(id="store-job-report"),
+        dcc.Interval(id="intervallo-report", interval=1000, disabled=True)
+    ], fluid=True)
 
 # Tab "Forecast"
 forecast_tab = dbc.Container([
     dbc.Row([dbc.Col(html.H4("Previsione Produzione (30 giorni)"), width=12)], className="mb-4"),
+    dbc.Row([
+        dbc.Col([
+            html.Label("Modello di previsione:", style={"fontWeight": "bold"}),
+            dcc.Dropdown(
+                id='modello-forecast',
+                options=[
+                    {'label': 'Regressione lineare', 'value': 'lineare'},
+                    {'label': 'Holt-Winters (trend smorzato + stagionalità annuale)', 'value': 'holt-winters'},
+                    {'label': 'SARIMA (ARIMA + stagionalità annuale)', 'value': 'sarima'},
+                ],
+                value='lineare',
+                clearable=False
+            )
+        ], width=4)
+    ], className="mb-3"),
     dbc.Row([dbc.Col(graph_forecast, width=12)], className="mb-4"),
     dbc.Row([
         dbc.Col(
@@ -238,40 +415,58 @@ forecast_tab = dbc.Container([
 ], fluid=True)
 
 # Tab "Dati Simulati"
-data_tab = dbc.Container([
-    dbc.Row([dbc.Col(html.H4("Tabella Dati Simulati"), width=12)], className="mb-4"),
-    data_table
-], fluid=True)
+def crea_data_tab(df_iniziale):
+    return dbc.Container([
+        dbc.Row([dbc.Col(html.H4("Tabella Dati Simulati"), width=12)], className="mb-4"),
+        crea_data_table(df_iniziale)
+    ], fluid=True)
 
 # Definizione TABS globali
-tabs = dbc.Tabs([
-    dbc.Tab(dashboard_tab, label="Dashboard", tab_id="dashboard"),
-    dbc.Tab(forecast_tab, label="Forecast", tab_id="forecast"),
-    dbc.Tab(data_tab, label="Dati Simulati", tab_id="data"),
-    dbc.Tab(comparazione_tab, label="Confronto di produzione tra i  periodi", tab_id="comparazione"),
-], id="tabs", active_tab="dashboard", className="mb-5")
-
-# Layout generale
-layout = html.Div(
-    style={
-        "minHeight": "100vh",
-        "background": "linear-gradient(135deg, #ECF3F9 0%, #F5FFFA 100%)",
-    },
-    children=[
-        store_data,
-        navbar,
-        dbc.Container([tabs], fluid=True),
-        html.Footer(
-            "Realizzato da Emanuele Noviello Matricola: 0312302207 ",
-            style={
-                'textAlign': 'center',
-                'padding': '15px',
-                'color': '#1c1c1c',
-                'backgroundColor': '#fff',
-                'marginTop': 'auto',
-                'boxShadow': '0 -2px 5px rgba(0,0,0,0.1)',
-                'font-weight': 'bold'
-            }
-        )
-    ]
-)
+def crea_tabs(df_iniziale):
+    return dbc.Tabs([
+        dbc.Tab(crea_dashboard_tab(df_iniziale), label="Dashboard", tab_id="dashboard"),
+        dbc.Tab(forecast_tab, label="Forecast", tab_id="forecast"),
+        dbc.Tab(crea_data_tab(df_iniziale), label="Dati Simulati", tab_id="data"),
+        dbc.Tab(crea_comparazione_tab(df_iniziale), label="Confronto di produzione tra i  periodi", tab_id="comparazione"),
+    ], id="tabs", active_tab="dashboard", className="mb-5")
+
+# Layout generale: costruito una volta per dataset iniziale e riusato a ogni caricamento
+# della pagina (Dash accetta una funzione come layout)
+@lru_cache(maxsize=1)
+def _costruisci_layout(id_dataset, versione):
+    # dcc.Store con il solo riferimento al dataset registrato lato server
+    riferimento = {"id": id_dataset, "versione": versione}
+    df_iniziale = registro.carica(riferimento)
+    return html.Div(
+        style={
+            "minHeight": "100vh",
+            "background": "linear-gradient(135deg, #ECF3F9 0%, #F5FFFA 100%)",
+        },
+        children=[
+            dcc.Store(id="store-data", data=riferimento),
+            # Avviso mostrato se il dataset della pagina non è più disponibile sul server
+            html.Div(id="avviso-dataset"),
+            # Controllo periodico della cartella di ingestione (solo se configurata)
+            dcc.Interval(id="intervallo-ingestione", interval=INTERVALLO_INGESTIONE_S * 1000,
+                         disabled=not CARTELLA_INGESTIONE),
+            navbar,
+            dbc.Container([crea_tabs(df_iniziale)], fluid=True),
+            html.Footer(
+                "Realizzato da Emanuele Noviello Matricola: 0312302207 ",
+                style={
+                    'textAlign': 'center',
+                    'padding': '15px',
+                    'color': '#1c1c1c',
+                    'backgroundColor': '#fff',
+                    'marginTop': 'auto',
+                    'boxShadow': '0 -2px 5px rgba(0,0,0,0.1)',
+                    'font-weight': 'bold'
+                }
+            )
+        ]
+    )
+
+
+def layout():
+    riferimento = riferimento_iniziale()
+    return _costruisci_layout(riferimento["id"], riferimento["versione"])
@@ -0,0 +1,80 @@
+import os
+import tempfile
+
+
+# Configurazione dell'applicazione tramite variabili d'ambiente
+
+# Numero massimo di dataset mantenuti in memoria dal registro (LRU)
+CACHE_DATASET_MAX = int(os.environ.get("DASHBOARD_CACHE_DATASET_MAX", "8"))
+
+# Cartella su disco in cui scaricare i dataset espulsi dalla memoria (stringa vuota = nessuna):
+# un riferimento ancora aperto in una pagina resta leggibile dopo l'espulsione
+CARTELLA_SPILL = os.environ.get("DASHBOARD_CARTELLA_SPILL",
+                                os.path.join(tempfile.gettempdir(), "dashboard-spill")) or None
+# Dimensione massima (MB) dei dataset su disco (cartella di spill o condivisa): oltre il limite
+# si eliminano prima le versioni superate da una più recente, poi i file usati meno di recente
+SPILL_MAX_MB = int(os.environ.get("DASHBOARD_SPILL_MAX_MB", "1024"))
+
+# Schema compatto dei dataset registrati (misure in float32, 'Alert' categorica)
+SCHEMA_COMPATTO = os.environ.get("DASHBOARD_SCHEMA_COMPATTO", "1") == "1"
+
+# Formato (codec) con cui il registro serializza i dataset su disco
+FORMATO_SPILL = os.environ.get("DASHBOARD_FORMATO_SPILL", "arrow")
+
+# Cartella condivisa tra i worker WSGI: dataset (Arrow IPC letti in memory-map),
+# artefatti dei report e stato dei job sono visibili a tutti i processi
+CARTELLA_CONDIVISA = os.environ.get("DASHBOARD_CARTELLA_CONDIVISA") or None
+
+# Processi del pool che genera i report PDF (Kaleido + wkhtmltopdf)
+WORKER_REPORT = int(os.environ.get("DASHBOARD_WORKER_REPORT", "2"))
+
+# Numero massimo di report PDF completati mantenuti in cache (LRU)
+CACHE_REPORT_MAX = int(os.environ.get("DASHBOARD_CACHE_REPORT_MAX", "16"))
+
+# Dimensione massima (MB) della cache degli artefatti generati (immagini dei grafici, PDF)
+CACHE_ARTEFATTI_MB = int(os.environ.get("DASHBOARD_CACHE_ARTEFATTI_MB", "64"))
+
+# File opzionale (.arrow, .parquet o .json) con il dataset iniziale: se esiste viene
+# letto all'avvio, altrimenti il dataset generato viene salvato lì
+FILE_DATASET_INIZIALE = os.environ.get("DASHBOARD_DATASET_INIZIALE") or None
+
+# Backend dei filtri e delle aggregazioni dei grafici: "pandas" (riferimento) o "duckdb"
+# (SQL su file Parquet per versione del dataset, scritti in DASHBOARD_CARTELLA_SQL)
+BACKEND_QUERY = os.environ.get("DASHBOARD_BACKEND_QUERY", "pandas")
+CARTELLA_SQL = (os.environ.get("DASHBOARD_CARTELLA_SQL")
+                or (os.path.join(CARTELLA_CONDIVISA, "sql") if CARTELLA_CONDIVISA else None)
+                or os.path.join(tempfile.gettempdir(), "dashboard-sql"))
+# Dimensione massima (MB) dei file Parquet del backend duckdb (eliminati i meno usati)
+CACHE_SQL_MB = int(os.environ.get("DASHBOARD_CACHE_SQL_MB", "1024"))
+
+# Archivio storico opzionale (file Arrow IPC creato con python -m app.archivio), aperto in
+# memory-map al posto dei dati simulati; la dashboard parte dagli ultimi
+# DASHBOARD_GIORNI_ARCHIVIO giorni (0 = tutto lo storico) e gli altri periodi
+# vengono letti dall'archivio quando sono selezionati
+ARCHIVIO_STORICO = os.environ.get("DASHBOARD_ARCHIVIO_STORICO") or None
+GIORNI_ARCHIVIO = int(os.environ.get("DASHBOARD_GIORNI_ARCHIVIO", "365"))
+# Giorni massimi di una finestra dell'archivio letta in memoria (anche da un URL di download):
+# un periodo più lungo è limitato agli ultimi giorni
+MAX_GIORNI_FINESTRA = int(os.environ.get("DASHBOARD_MAX_GIORNI_FINESTRA", "3660"))
+
+# Server WSGI (gunicorn.conf.py): indirizzo, processi worker, thread per worker e timeout
+BIND_WSGI = os.environ.get("DASHBOARD_BIND", "0.0.0.0:8050")
+WORKER_WSGI = int(os.environ.get("DASHBOARD_WORKER", str(os.cpu_count() or 1)))
+THREAD_WSGI = int(os.environ.get("DASHBOARD_THREAD", "4"))
+TIMEOUT_WSGI = int(os.environ.get("DASHBOARD_TIMEOUT", "120"))
+# Caricamento dell'app nel master prima del fork: dataset iniziale condiviso copy-on-write
+PRELOAD_WSGI = os.environ.get("DASHBOARD_PRELOAD", "1") == "1"
+
+# Metriche delle callback (istogrammi Prometheus su /metrics)
+METRICHE_ABILITATE = os.environ.get("DASHBOARD_METRICHE", "1") == "1"
+# Profilazione opzionale: le callback più lente della soglia (ms) salvano un profilo
+# (flamegraph HTML con pyinstrument, altrimenti file .prof di cProfile)
+_SOGLIA_PROFILO = os.environ.get("DASHBOARD_SOGLIA_PROFILO_MS")
+SOGLIA_PROFILO_MS = float(_SOGLIA_PROFILO) if _SOGLIA_PROFILO else None
+CARTELLA_PROFILI = (os.environ.get("DASHBOARD_CARTELLA_PROFILI")
+                    or os.path.join(tempfile.gettempdir(), "dashboard-profili"))
+
+# Cartella da cui vengono accodati al dataset iniziale i nuovi dati (CSV con ';', Parquet, Arrow)
+# e intervallo in secondi con cui la dashboard la controlla
+CARTELLA_INGESTIONE = os.environ.get("DASHBOARD_CARTELLA_INGESTIONE") or None
+INTERVALLO_INGESTIONE_S = int(os.environ.get("DASHBOARD_INTERVALLO_INGESTIONE_S", "60"))
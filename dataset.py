@@ -0,0 +1,306 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from app.config import (CACHE_DATASET_MAX, CARTELLA_SPILL, FORMATO_SPILL, CARTELLA_CONDIVISA, SCHEMA_COMPATTO,
+                        SPILL_MAX_MB)
+from app.metriche import misura_fase, DESERIALIZZAZIONE
+from app.serializzazione import get_codec, codec_per_file
+from app.query import COLONNA_DATA, indicizza
+from app.schema import compatta, allinea
+
+
+# Registro lato server dei dataset: il dcc.Store contiene solo un riferimento
+# {"id": ..., "versione": ...} e le callback recuperano il DataFrame già pronto.
+class DatasetNonTrovato(KeyError):
+    pass
+
+
+def chiave_dataset(riferimento):
+    return f"{riferimento['id']}-{riferimento['versione']}"
+
+
+def righe_nuove(df, nuove):
+    # Righe di `nuove` (ordinate per data) con data (e campo, nei dataset con più campi) non
+    # ancora presente nel dataset, senza le righe ripetute identiche (file sovrapposti). Il
+    # confronto usa solo la coda del dataset a partire dalla prima data delle nuove righe.
+    if not len(nuove):
+        return nuove
+    chiavi = [colonna for colonna in (COLONNA_DATA, 'Campo') if colonna in df.columns]
+    coda = df.iloc[df.index.searchsorted(nuove.index[0]):]
+    presenti = pd.MultiIndex.from_frame(nuove[chiavi]).isin(pd.MultiIndex.from_frame(coda[chiavi]))
+    presenti |= nuove.duplicated().to_numpy()
+    return nuove[~presenti] if presenti.any() else nuove
+
+
+def versione_file(nome, estensione):
+    # (id, versione) di un file di dataset '{id}-{versione}.{estensione}', None per gli altri file
+    if not nome.endswith(f".{estensione}"):
+        return None
+    id_dataset, _, versione = nome[:-len(estensione) - 1].rpartition("-")
+    if not id_dataset or not versione.isdigit():
+        return None
+    return id_dataset, int(versione)
+
+
+class RegistroDataset:
+    def __init__(self, max_elementi=CACHE_DATASET_MAX, cartella_spill=CARTELLA_SPILL,
+                 formato_spill=FORMATO_SPILL, cartella_condivisa=CARTELLA_CONDIVISA,
+                 schema_compatto=SCHEMA_COMPATTO, max_byte_spill=SPILL_MAX_MB * 1024 * 1024):
+        # Con più worker WSGI ogni dataset è scritto subito nella cartella condivisa
+        # (Arrow IPC): un worker che non lo ha in memoria lo apre in memory-map
+        self.condiviso = bool(cartella_condivisa)
+        if self.condiviso:
+            cartella_spill, formato_spill = cartella_condivisa, "arrow"
+        self.max_elementi = max_elementi
+        self.schema_compatto = schema_compatto
+        self.cartella_spill = cartella_spill
+        self.max_byte_spill = max_byte_spill
+        self.codec = get_codec(formato_spill)
+        self._memoria = OrderedDict()
+        # Strutture derivate (cubi, indici, modelli) per chiave del dataset
+        self._derivati = {}
+        # Ultima versione per id e versione precedente delle versioni ottenute accodando righe
+        self._ultime = {}
+        self._origini = {}
+        # Sorgenti dei dataset ricostruibili dal riferimento (es. finestre dell'archivio storico):
+        # letti alla prima richiesta in ogni worker e mai scritti su disco
+        self._sorgenti = []
+        self._da_sorgente = set()
+        self._lock = threading.Lock()
+        if cartella_spill:
+            os.makedirs(cartella_spill, exist_ok=True)
+            # File lasciati dalle esecuzioni precedenti
+            self._pota()
+
+    def registra(self, df, riferimento=None):
+        # riferimento esplicito per i dataset derivati da un altro (es. viste per campo)
+        riferimento = riferimento or {"id": uuid.uuid4().hex, "versione": 1}
+        df = indicizza(df)
+        self._pubblica(riferimento, compatta(df) if self.schema_compatto else df)
+        return riferimento
+
+    def aggiungi(self, riferimento, nuove):
+        # Nuova versione del dataset con le righe `nuove`. Se sono tutte in giorni successivi
+        # all'ultimo, le strutture derivate che lo prevedono (metodo estendi(df, nuove))
+        # vengono aggiornate con le sole nuove righe invece di essere ricostruite.
+        df = self.carica(riferimento)
+        mancanti = set(df.columns) - set(nuove.columns)
+        if mancanti:
+            raise ValueError(f"colonne mancanti nelle nuove righe: {', '.join(sorted(mancanti))}")
+        df, nuove = allinea(df, nuove[list(df.columns)])
+        nuove = righe_nuove(df, indicizza(nuove))
+        if not len(nuove):
+            return riferimento
+        in_coda = bool(len(df) and len(nuove)) and nuove.index[0].normalize() > df.index[-1].normalize()
+        unito = indicizza(pd.concat([df, nuove]))
+
+        chiave_precedente = chiave_dataset(riferimento)
+        versione_condivisa = self._versione_condivisa(riferimento["id"])
+        with self._lock:
+            versione = max(self._ultime.get(riferimento["id"], 0), riferimento["versione"], versione_condivisa) + 1
+            self._ultime[riferimento["id"]] = versione
+            precedenti = dict(self._derivati.get(chiave_precedente, {})) if in_coda else {}
+        nuovo = {"id": riferimento["id"], "versione": versione}
+        derivati = {}
+        for nome, oggetto in precedenti.items():
+            estendi = getattr(oggetto, "estendi", None)
+            esteso = estendi(unito, nuove) if estendi is not None else None
+            if esteso is not None:
+                derivati[nome] = esteso
+        chiave = chiave_dataset(nuovo)
+        self._pubblica(nuovo, unito)
+        with self._lock:
+            if in_coda:
+                self._origini[chiave] = riferimento
+            if chiave in self._memoria:
+                self._derivati.setdefault(chiave, {}).update(derivati)
+        return nuovo
+
+    def registra_sorgente(self, sorgente):
+        # sorgente(riferimento) -> DataFrame, oppure None se il riferimento non le appartiene
+        if sorgente not in self._sorgenti:
+            self._sorgenti.append(sorgente)
+
+    def ultima_versione(self, riferimento):
+        # Riferimento all'ultima versione nota con lo stesso id (anche da altri worker)
+        versione_condivisa = self._versione_condivisa(riferimento["id"])
+        with self._lock:
+            versione = max(self._ultime.get(riferimento["id"], 0), versione_condivisa)
+        return {"id": riferimento["id"], "versione": versione} if versione > riferimento["versione"] else riferimento
+
+    def _versione_condivisa(self, id_dataset):
+        # Con più worker le versioni sono quelle scritte nella cartella condivisa
+        if not self.condiviso:
+            return 0
+        file_dataset = filter(None, (versione_file(nome, self.codec.estensione)
+                                     for nome in os.listdir(self.cartella_spill)))
+        return max([versione for id_file, versione in file_dataset if id_file == id_dataset], default=0)
+
+    def precedente(self, riferimento):
+        # Versione da cui questa è stata ottenuta accodando giorni successivi, oppure None
+        with self._lock:
+            return self._origini.get(chiave_dataset(riferimento))
+
+    def _pubblica(self, riferimento, df):
+        chiave = chiave_dataset(riferimento)
+        if self.condiviso:
+            self._spill(chiave, df)
+        self._inserisci(chiave, df)
+
+    @misura_fase(DESERIALIZZAZIONE)
+    def carica(self, riferimento):
+        if not riferimento:
+            raise DatasetNonTrovato(riferimento)
+        chiave = chiave_dataset(riferimento)
+        with self._lock:
+            df = self._memoria.get(chiave)
+            if df is not None:
+                self._memoria.move_to_end(chiave)
+                return df
+        # 2° livello: dataset scaricato su disco (o scritto da un altro worker)
+        percorso = self._percorso_spill(chiave)
+        if percorso is None or not os.path.exists(percorso):
+            return self._da_sorgenti(riferimento)
+        # Non tutti i codec conservano l'indice (il JSON lo scrive come colonna 'Data')
+        try:
+            df = indicizza(self.codec.leggi_file(percorso))
+            # Data di modifica aggiornata: il file è tra gli ultimi usati per la pulizia (_pota)
+            os.utime(percorso)
+        except FileNotFoundError:
+            # Eliminato nel frattempo dalla pulizia di un altro worker
+            return self._da_sorgenti(riferimento)
+        self._inserisci(chiave, df)
+        return df
+
+    def _da_sorgenti(self, riferimento):
+        chiave = chiave_dataset(riferimento)
+        for sorgente in self._sorgenti:
+            df = sorgente(riferimento)
+            if df is not None:
+                df = indicizza(df)
+                df = compatta(df) if self.schema_compatto else df
+                with self._lock:
+                    self._da_sorgente.add(chiave)
+                self._inserisci(chiave, df)
+                return df
+        raise DatasetNonTrovato(chiave)
+
+    def derivato(self, riferimento, nome, costruttore):
+        # Struttura calcolata una sola volta per versione del dataset
+        chiave = chiave_dataset(riferimento)
+        with self._lock:
+            oggetto = self._derivati.get(chiave, {}).get(nome)
+        if oggetto is None:
+            oggetto = costruttore(self.carica(riferimento))
+            with self._lock:
+                if chiave in self._memoria:
+                    self._derivati.setdefault(chiave, {})[nome] = oggetto
+        return oggetto
+
+    def _inserisci(self, chiave, df):
+        espulsi = []
+        with self._lock:
+            self._memoria[chiave] = df
+            self._memoria.move_to_end(chiave)
+            while len(self._memoria) > self.max_elementi:
+                chiave_espulsa, df_espulso = self._memoria.popitem(last=False)
+                self._derivati.pop(chiave_espulsa, None)
+                espulsi.append((chiave_espulsa, df_espulso))
+        for chiave_espulsa, df_espulso in espulsi:
+            self._spill(chiave_espulsa, df_espulso)
+
+    def _percorso_spill(self, chiave):
+        if not self.cartella_spill:
+            return None
+        return os.path.join(self.cartella_spill, f"{chiave}.{self.codec.estensione}")
+
+    def _spill(self, chiave, df):
+        percorso = self._percorso_spill(chiave)
+        if percorso is None or chiave in self._da_sorgente or os.path.exists(percorso):
+            return
+        scrivi_atomico(percorso, self.codec.serializza(df))
+        self._pota(percorso)
+
+    def _pota(self, *scritti):
+        # Dataset su disco entro max_byte_spill: si eliminano prima le versioni superate da una
+        # più recente dello stesso id, poi le meno usate; restano i file appena scritti, i dataset
+        # in memoria in questo worker e l'ultima versione nota di ogni id
+        if not self.max_byte_spill:
+            return
+        with self._lock:
+            protetti = set(scritti) | {self._percorso_spill(chiave) for chiave in self._memoria}
+            protetti |= {self._percorso_spill(chiave_dataset({"id": id_dataset, "versione": versione}))
+                         for id_dataset, versione in self._ultime.items()}
+        estensione = self.codec.estensione
+        ultime = {}
+        for nome in os.listdir(self.cartella_spill):
+            chiave = versione_file(nome, estensione)
+            if chiave:
+                ultime[chiave[0]] = max(ultime.get(chiave[0], 0), chiave[1])
+
+        def superata(nome):
+            id_dataset, versione = versione_file(nome, estensione)
+            return versione < ultime.get(id_dataset, versione)
+
+        pota_cartella(self.cartella_spill, self.max_byte_spill,
+                      lambda nome: versione_file(nome, estensione) is not None, protetti,
+                      priorita=lambda nome: not superata(nome))
+
+
+def scrivi_atomico(percorso, payload):
+    # Scrittura atomica: file temporaneo e rename
+    temporaneo = f"{percorso}.{uuid.uuid4().hex}.tmp"
+    with open(temporaneo, "wb") as f:
+        f.write(payload)
+    os.replace(temporaneo, percorso)
+
+
+def pota_cartella(cartella, max_byte, seleziona=None, protetti=(), priorita=None):
+    # Elimina i file di `cartella` (quelli accettati da seleziona(nome)) finché la loro dimensione
+    # totale non scende sotto max_byte: prima i file con priorita(nome) minore, poi i meno recenti.
+    # I percorsi in `protetti` e i file temporanei delle scritture in corso restano.
+    voci = []
+    for voce in os.scandir(cartella):
+        if not voce.is_file() or voce.name.endswith(".tmp") or (seleziona and not seleziona(voce.name)):
+            continue
+        try:
+            info = voce.stat()
+        except FileNotFoundError:
+            continue
+        ordine = priorita(voce.name) if priorita else 0
+        voci.append((ordine, info.st_mtime, info.st_size, voce.path))
+    occupati = sum(dimensione for _, _, dimensione, _ in voci)
+    for _, _, dimensione, percorso in sorted(voci):
+        if occupati <= max_byte:
+            break
+        if percorso in protetti:
+            continue
+        try:
+            os.remove(percorso)
+        except FileNotFoundError:
+            pass
+        occupati -= dimensione
+
+
+def leggi_o_genera(percorso, generatore):
+    # Dataset letto da un artefatto su disco (codec scelto dall'estensione);
+    # se il file non esiste viene generato una volta e salvato per gli avvii successivi
+    if not percorso:
+        return generatore()
+    codec = codec_per_file(percorso)
+    if os.path.exists(percorso):
+        with open(percorso, "rb") as f:
+            return codec.deserializza(f.read())
+    df = generatore()
+    cartella = os.path.dirname(percorso)
+    if cartella:
+        os.makedirs(cartella, exist_ok=True)
+    scrivi_atomico(percorso, codec.serializza(df))
+    return df
+
+
+registro = RegistroDataset()
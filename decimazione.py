@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+
+# Decimazione lato server delle serie temporali lunghe: al browser arrivano al più
+# MAX_PUNTI_TRACCIA punti per traccia, scelti con LTTB (Largest-Triangle-Three-Buckets)
+# dopo una preselezione min/max per bucket che conserva i picchi.
+MAX_PUNTI_TRACCIA = 2000
+# Oltre questo numero di punti disegnati la traccia usa WebGL (Scattergl)
+SOGLIA_WEBGL = 1000
+# La preselezione min/max scatta quando i punti sono più di FATTORE_MINMAX volte il massimo
+FATTORE_MINMAX = 4
+
+
+def _numerico(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def indici_minmax(y, n_bucket):
+    # Posizione del minimo e del massimo di ciascun bucket di uguale ampiezza
+    ampiezza = len(y) // n_bucket
+    corpo = y[:ampiezza * n_bucket].reshape(n_bucket, ampiezza)
+    base = np.arange(n_bucket) * ampiezza
+    indici = [base + corpo.argmin(axis=1), base + corpo.argmax(axis=1)]
+    if len(y) > ampiezza * n_bucket:
+        coda = y[ampiezza * n_bucket:]
+        indici.append(ampiezza * n_bucket + np.array([coda.argmin(), coda.argmax()]))
+    return np.unique(np.concatenate(indici + [[0, len(y) - 1]]))
+
+
+def indici_lttb(x, y, n_punti):
+    # Primo e ultimo punto fissi; per ogni bucket intermedio il punto che forma il
+    # triangolo di area massima con il punto scelto prima e la media del bucket successivo
+    n = len(x)
+    if n_punti >= n or n_punti < 3:
+        return np.arange(n)
+    bordi = np.linspace(1, n - 1, n_punti - 1).astype(np.int64)
+    indici = np.empty(n_punti, dtype=np.int64)
+    indici[0], indici[-1] = 0, n - 1
+    precedente = 0
+    for k in range(n_punti - 2):
+        inizio, fine = bordi[k], bordi[k + 1]
+        if k + 2 < len(bordi):
+            x_medio = x[fine:bordi[k + 2]].mean()
+            y_medio = y[fine:bordi[k + 2]].mean()
+        else:
+            x_medio, y_medio = x[-1], y[-1]
+        aree = np.abs((x[precedente] - x_medio) * (y[inizio:fine] - y[precedente]) -
+                      (x[precedente] - x[inizio:fine]) * (y_medio - y[precedente]))
+        precedente = inizio + int(aree.argmax())
+        indici[k + 1] = precedente
+    return indici
+
+
+def decima(x, y, max_punti=MAX_PUNTI_TRACCIA):
+    # Posizioni dei punti da disegnare; sotto la soglia la serie resta intatta
+    if len(x) <= max_punti:
+        return np.arange(len(x))
+    y = np.asarray(y, dtype=np.float64)
+    posizioni = np.flatnonzero(np.isfinite(y))
+    if len(posizioni) <= max_punti:
+        return posizioni
+    if len(posizioni) > FATTORE_MINMAX * max_punti:
+        posizioni = posizioni[indici_minmax(y[posizioni], max_punti)]
+    return posizioni[indici_lttb(_numerico(x)[posizioni], y[posizioni], max_punti)]
+
+
+def intervallo_x(relayout_data):
+    # (modificato, intervallo) dall'evento relayoutData del grafico:
+    # intervallo è None quando l'asse x torna in autorange (doppio click / reset)
+    if not relayout_data:
+        return False, None
+    if relayout_data.get('xaxis.autorange'):
+        return True, None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return True, (str(relayout_data['xaxis.range[0]']), str(relayout_data['xaxis.range[1]']))
+    if 'xaxis.range' in relayout_data:
+        inizio, fine = relayout_data['xaxis.range']
+        return True, (str(inizio), str(fine))
+    return False, None
+
+
+def posizioni_visibili(df, intervallo):
+    # Righe nel range visibile più un punto per lato, perché le linee arrivino ai bordi
+    if intervallo is None:
+        return 0, len(df)
+    inizio, fine = (pd.Timestamp(limite) for limite in intervallo)
+    i = df.index.searchsorted(inizio, side='left')
+    j = df.index.searchsorted(fine, side='right')
+    return max(i - 1, 0), min(j + 1, len(df))
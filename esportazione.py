@@ -0,0 +1,181 @@
+import itertools
+import re
+import zlib
+from urllib.parse import urlencode
+
+import pandas as pd
+
+from app.archivio import finestra_consentita, giorni_finestra
+from app.dataset import registro, DatasetNonTrovato
+from app.query import filtra_periodo, posizioni_periodo
+from app.schema import DECIMALI, espandi, valori
+
+
+# Esportazione dei dati filtrati in streaming da una rotta Flask (/download/dati):
+# le righe del periodo e della qualità del suolo sono lette dal registro a blocchi e
+# scritte come CSV (';', utf-8-sig, come l'export precedente), Parquet o Arrow IPC,
+# con compressione gzip opzionale. In memoria resta un blocco alla volta e la risposta
+# non passa dal JSON delle callback.
+PERCORSO_DOWNLOAD = "/download/dati"
+RIGHE_PER_BLOCCO = 10_000
+NOME_FILE = "dati_filtrati"
+# Id dei dataset registrati (uuid esadecimale); le finestre dell'archivio hanno id 'archivio-...'
+_ID_DATASET = re.compile(r"[0-9a-f]{32}")
+
+
+def blocchi_filtrati(df, inizio=None, fine=None, qualita=None, righe_per_blocco=RIGHE_PER_BLOCCO):
+    # Blocchi del periodo (posizioni con searchsorted) filtrati per qualità, nello schema
+    # del dataset: viste senza copia se il filtro qualità non esclude righe
+    i, j = posizioni_periodo(df, inizio, fine)
+    for inizio_blocco in range(i, j, righe_per_blocco):
+        blocco = filtra_periodo(df.iloc[inizio_blocco:min(inizio_blocco + righe_per_blocco, j)], qualita=qualita)
+        if len(blocco):
+            yield blocco
+
+
+def _colonna(serie):
+    # Valori esportati di una colonna: float64 esatti per le misure compatte, testo per le categorie
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.to_numpy(dtype=object)
+    if serie.name in DECIMALI:
+        return valori(serie)
+    return serie.to_numpy()
+
+
+class _Sink:
+    # File in sola scrittura per i writer pyarrow: i byte scritti vengono inviati a ogni blocco
+    closed = False
+
+    def __init__(self):
+        self._parti = []
+
+    def write(self, dati):
+        self._parti.append(bytes(dati))
+        return len(dati)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def svuota(self):
+        dati = b"".join(self._parti)
+        self._parti = []
+        return dati
+
+
+def scrivi_csv(df, blocchi):
+    # Le colonne float32 dello schema compatto sono scritte con il decimale più corto che le
+    # identifica, cioè lo stesso testo dei valori float64 originali: nessuna conversione
+    yield df.iloc[:0].to_csv(index=False, sep=';').encode('utf-8-sig')
+    for blocco in blocchi:
+        yield blocco.to_csv(index=False, sep=';', header=False).encode('utf-8')
+
+
+def _scrivi_arrow(apri_writer, df, blocchi):
+    import pyarrow as pa
+
+    def tabella(blocco, schema=None):
+        # Tabella Arrow costruita colonna per colonna, senza DataFrame intermedi (NaN come null)
+        colonne = [pa.array(_colonna(blocco[c]), from_pandas=True) for c in blocco.columns]
+        if schema is None:
+            return pa.Table.from_arrays(colonne, names=list(blocco.columns))
+        return pa.Table.from_arrays(colonne, schema=schema)
+
+    # Schema dal primo blocco (le colonne testuali di un DataFrame vuoto non hanno tipo)
+    primo = next(blocchi, None)
+    if primo is None:
+        schema = pa.Schema.from_pandas(espandi(df.iloc[:0]), preserve_index=False)
+    else:
+        schema = tabella(primo).schema
+    sink = _Sink()
+    with apri_writer(pa.PythonFile(sink, mode='w'), schema) as writer:
+        for blocco in itertools.chain([] if primo is None else [primo], blocchi):
+            writer.write_table(tabella(blocco, schema))
+            yield sink.svuota()
+    yield sink.svuota()
+
+
+def scrivi_parquet(df, blocchi):
+    import pyarrow.parquet as pq
+
+    # Un row group per blocco
+    return _scrivi_arrow(pq.ParquetWriter, df, blocchi)
+
+
+def scrivi_arrow_ipc(df, blocchi):
+    import pyarrow as pa
+
+    return _scrivi_arrow(pa.ipc.new_file, df, blocchi)
+
+
+# formato -> (scrittore, estensione, mimetype)
+FORMATI = {
+    "csv": (scrivi_csv, "csv", "text/csv"),
+    "parquet": (scrivi_parquet, "parquet", "application/vnd.apache.parquet"),
+    "arrow": (scrivi_arrow_ipc, "arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def comprimi_gzip(parti):
+    compressore = zlib.compressobj(wbits=31)   # wbits=31: intestazione e coda gzip
+    for parte in parti:
+        compresso = compressore.compress(parte)
+        if compresso:
+            yield compresso
+    yield compressore.flush()
+
+
+def url_download(riferimento, inizio=None, fine=None, qualita=None, formato="csv", gzip=False,
+                 percorso=PERCORSO_DOWNLOAD):
+    parametri = {"id": riferimento["id"], "versione": riferimento["versione"], "formato": formato}
+    if inizio is not None:
+        parametri["inizio"] = inizio
+    if fine is not None:
+        parametri["fine"] = fine
+    if qualita is not None:
+        parametri["qmin"], parametri["qmax"] = qualita
+    if gzip:
+        parametri["gzip"] = 1
+    return f"{percorso}?{urlencode(parametri)}"
+
+
+def riferimento_richiesta(argomenti):
+    # Riferimento dai parametri della richiesta, solo nei formati emessi dall'app (l'id diventa
+    # il nome di un file su disco); None se non valido o se la finestra supera il limite
+    id_dataset, versione = argomenti.get("id", ""), argomenti.get("versione", type=int)
+    if versione is None or versione < 1:
+        return None
+    riferimento = {"id": id_dataset, "versione": versione}
+    if _ID_DATASET.fullmatch(id_dataset) is None and not finestra_consentita(giorni_finestra(riferimento)):
+        return None
+    return riferimento
+
+
+def installa(app):
+    from flask import Response, abort, request
+
+    @app.server.route(PERCORSO_DOWNLOAD)
+    def _scarica_dati():
+        argomenti = request.args
+        formato = argomenti.get("formato", "csv")
+        if formato not in FORMATI:
+            abort(400)
+        scrittore, estensione, mimetype = FORMATI[formato]
+        riferimento = riferimento_richiesta(argomenti)
+        if riferimento is None:
+            abort(400)
+        try:
+            df = registro.carica(riferimento)
+        except DatasetNonTrovato:
+            abort(404)
+        qualita = None
+        if "qmin" in argomenti and "qmax" in argomenti:
+            qualita = (argomenti.get("qmin", type=float), argomenti.get("qmax", type=float))
+        parti = scrittore(df, blocchi_filtrati(df, argomenti.get("inizio"), argomenti.get("fine"), qualita))
+        nome_file = f"{NOME_FILE}.{estensione}"
+        if argomenti.get("gzip") == "1":
+            parti, nome_file, mimetype = comprimi_gzip(parti), f"{nome_file}.gz", "application/gzip"
+        return Response(parti, mimetype=mimetype,
+                        headers={"Content-Disposition": f'attachment; filename="{nome_file}"'})
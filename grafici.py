@@ -0,0 +1,320 @@
+from functools import lru_cache
+
+import numpy as np
+from dash import html
+import plotly.express as px
+import plotly.graph_objects as go
+import dash_bootstrap_components as dbc
+
+from app.alert import riepilogo_alert, pagina_alert, numero_pagine, contatore_alert, CATEGORIE_ALERT
+from app.aggregati import cubo_aggregati
+from app.backend import backend_query
+from app.campi import kpi_per_campo, media_per_data, COLONNA_CAMPO
+from app.dataset import registro
+from app.decimazione import decima, posizioni_visibili, SOGLIA_WEBGL
+from app.metriche import fase, misura_fase, CALCOLO, FIGURA
+from app.query import posizioni_periodo
+from app.regressione import statistiche_sufficienti, retta_ols, lowess
+from app.schema import espandi, valori
+from app.utils import create_kpi_card, PALETTE_COLORI
+
+
+# Costruttori memoizzati degli elementi della dashboard.
+# La chiave di cache è (id dataset, versione, parametri dei filtri):
+# una nuova versione del dataset invalida automaticamente i risultati.
+DIMENSIONE_CACHE = 32
+
+
+def riferimento(id_dataset, versione):
+    return {"id": id_dataset, "versione": versione}
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+def dati_filtrati(id_dataset, versione, start_date, end_date, quality_range):
+    # Righe del periodo dal backend configurato (pandas o DuckDB), nello schema del dataset:
+    # le figure espandono in float64 solo le colonne che disegnano
+    return backend_query.filtra(id_dataset, versione, start_date, end_date, quality_range)
+
+
+def _cubo(id_dataset, versione, start_date, end_date, quality_range):
+    # Cubo di aggregati se il filtro qualità non esclude righe, altrimenti None
+    cubo = cubo_aggregati(riferimento(id_dataset, versione))
+    return cubo if cubo.supporta(start_date, end_date, quality_range) else None
+
+
+def traccia_serie(x, y, **proprieta):
+    # Serie decimata lato server; WebGL (Scattergl) quando i punti disegnati sono molti
+    posizioni = decima(x, y)
+    classe = go.Scattergl if len(posizioni) > SOGLIA_WEBGL else go.Scatter
+    return classe(x=x.iloc[posizioni], y=y.iloc[posizioni], **proprieta)
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+@misura_fase(FIGURA)
+def figura_linee(id_dataset, versione, start_date, end_date, quality_range, variabili, intervallo=None):
+    # intervallo: range x visibile dopo uno zoom, ridisegnato a risoluzione maggiore
+    df_filtrato = dati_filtrati(id_dataset, versione, start_date, end_date, quality_range)
+    # Con più campi (senza un campo selezionato) una riga per data: media tra i campi
+    df_serie = media_per_data(espandi(df_filtrato, variabili), variabili)
+    i, j = posizioni_visibili(df_serie, intervallo)
+    df_visibile = df_serie.iloc[i:j]
+    fig_line = go.Figure()
+    colori = list(PALETTE_COLORI.values())
+    for idx, var in enumerate(variabili):
+        fig_line.add_trace(traccia_serie(
+            df_visibile['Data'],
+            df_visibile[var],
+            mode='lines+markers',
+            name=var,
+            marker=dict(size=6),
+            line=dict(width=2, color=colori[idx % len(colori)])
+        ))
+    fig_line.update_layout(
+        title='Andamento delle variabili selezionate',
+        template='plotly_white',
+        xaxis=dict(title='Data'),
+        yaxis=dict(title='Valore'),
+        legend=dict(orientation='h', y=-0.2, x=0.5, xanchor='center'),
+        # Lo zoom dell'utente resta invariato finché non cambiano dataset o filtri
+        uirevision=f"{id_dataset}-{versione}-{start_date}-{end_date}-{quality_range}"
+    )
+    return fig_line
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+@misura_fase(CALCOLO)
+def linea_tendenza(id_dataset, versione, start_date, end_date, quality_range, scatter_x, scatter_y, metodo='ols'):
+    # (x, y, hovertemplate) della linea di tendenza sul periodo filtrato, oppure None
+    df_filtrato = dati_filtrati(id_dataset, versione, start_date, end_date, quality_range)
+    x, y = valori(df_filtrato[scatter_x]), valori(df_filtrato[scatter_y])
+    if metodo == 'lowess':
+        stima = lowess(x, y)
+        if stima is None:
+            return None
+        return stima + ("<b>LOWESS trendline</b><br><br>"
+                        f"{scatter_x}=%{{x}}<br>{scatter_y}=%{{y}} <b>(trend)</b><extra></extra>",)
+    statistiche = statistiche_sufficienti(x, y)
+    retta = retta_ols(statistiche)
+    if retta is None:
+        return None
+    # Una retta: bastano gli estremi dell'asse x
+    estremi = np.array([statistiche.minimo_x, statistiche.massimo_x])
+    intestazione = "<b>OLS trendline</b><br>%s = %g * %s + %g<br>R<sup>2</sup>=%f<br><br>" % (
+        scatter_y, retta.pendenza, scatter_x, retta.intercetta, retta.r2)
+    return (estremi, retta.intercetta + retta.pendenza * estremi,
+            intestazione + f"{scatter_x}=%{{x}}<br>{scatter_y}=%{{y}} <b>(trend)</b><extra></extra>")
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+@misura_fase(FIGURA)
+def figura_scatter(id_dataset, versione, start_date, end_date, quality_range, scatter_x, scatter_y, scatter_color,
+                   trendline='ols'):
+    df_filtrato = dati_filtrati(id_dataset, versione, start_date, end_date, quality_range)
+    df_filtrato = espandi(df_filtrato, [c for c in (scatter_x, scatter_y, scatter_color) if c])
+    fig_scatter = px.scatter(
+        df_filtrato,
+        x=scatter_x,
+        y=scatter_y,
+        color=scatter_color,
+        template="plotly_white",
+        title=f"Correlazione tra {scatter_x} e {scatter_y}"
+    )
+    # Linea di tendenza calcolata e memoizzata qui (niente statsmodels nel percorso della callback)
+    linea = linea_tendenza(id_dataset, versione, start_date, end_date, quality_range,
+                           scatter_x, scatter_y, trendline) if trendline else None
+    if linea is not None:
+        x_linea, y_linea, hovertemplate = linea
+        fig_scatter.add_trace(go.Scatter(
+            x=x_linea,
+            y=y_linea,
+            mode='lines',
+            name='',
+            showlegend=False,
+            hovertemplate=hovertemplate
+        ))
+    return fig_scatter
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+@misura_fase(FIGURA)
+def figura_istogramma(id_dataset, versione, start_date, end_date, quality_range):
+    df_filtrato = dati_filtrati(id_dataset, versione, start_date, end_date, quality_range)
+    df_filtrato = espandi(df_filtrato, ['Quantità raccolto (kg)'])
+    df_filtrato = df_filtrato.assign(Mese=df_filtrato['Data'].dt.strftime('%b'))
+    fig_hist = px.histogram(
+        df_filtrato,
+        x='Quantità raccolto (kg)',
+        color='Mese',
+        nbins=15,
+        barmode='group',
+        histnorm='percent',
+        template='plotly_white',
+        title='Distribuzione della Quantità raccolto (kg) per Mese'
+    )
+    fig_hist.update_layout(
+        xaxis_title='Quantità raccolto (kg)',
+        yaxis_title='Frequenza (%)',
+        legend_title_text='Mese'
+    )
+    return fig_hist
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+def kpi_cards(id_dataset, versione, start_date, end_date, quality_range):
+    cubo = _cubo(id_dataset, versione, start_date, end_date, quality_range)
+    if cubo:
+        kpi = cubo.kpi(start_date, end_date)
+    else:
+        kpi = backend_query.kpi(id_dataset, versione, start_date, end_date, quality_range)
+    produzione_totale = kpi['produzione_totale']
+    profitto_totale = kpi['profitto_totale']
+    temperatura_media = kpi['temperatura_media']
+    precipitazioni_medie = kpi['precipitazioni_medie']
+    qualita_media = kpi['qualita_media']
+
+    kpi_cards_base = dbc.Row([
+        dbc.Col(create_kpi_card("Produzione Totale", "fas fa-tractor", f"{produzione_totale:,.1f} kg",
+                                PALETTE_COLORI["raccolto"],
+                                tooltip_text="Somma totale della produzione nel periodo."), md=2),
+        dbc.Col(create_kpi_card("Profitto Totale", "fas fa-euro-sign", f"{profitto_totale:,.2f} €",
+                                PALETTE_COLORI["profitto"],
+                                tooltip_text="Profitto totale stimato nel periodo."), md=2),
+        dbc.Col(create_kpi_card("Temp. Media", "fas fa-thermometer-half", f"{temperatura_media:.1f} °C",
+                                PALETTE_COLORI["temperatura"],
+                                tooltip_text="Temperatura media nel periodo."), md=2),
+        dbc.Col(create_kpi_card("Prec. Media", "fas fa-cloud-rain", f"{precipitazioni_medie:.1f} mm",
+                                PALETTE_COLORI["precipitazioni"],
+                                tooltip_text="Precipitazioni medie nel periodo."), md=2),
+        dbc.Col(create_kpi_card("Qualità suolo Media", "fas fa-seedling", f"{qualita_media:.1f} %",
+                                PALETTE_COLORI["qualita_suolo"],
+                                tooltip_text="Qualità media del suolo nel periodo."), md=2)
+    ], justify="center")
+
+    # Margine netto e costo medio per kg (costi, ricavi = profitto + costi)
+    costo_medio_kg = kpi['costo_medio_kg']
+    margine_netto = kpi['margine_netto']
+
+    # Crea un secondo blocco di card
+    kpi_cards_extra = dbc.Row([
+        dbc.Col(
+            create_kpi_card(
+                "Margine Netto",
+                "fas fa-percentage",
+                f"{margine_netto:.1f} %",
+                PALETTE_COLORI["margine_netto"],
+                tooltip_text="Percentuale di profitto sui ricavi totali."
+            ), md=2
+        ),
+        dbc.Col(
+            create_kpi_card(
+                "Costo Medio/kg",
+                "fas fa-coins",
+                f"{costo_medio_kg:.2f} €/kg",
+                PALETTE_COLORI["costo_medio"],
+                tooltip_text="Costo totale diviso per la quantità prodotta."
+            ), md=2
+        ),
+    ], justify="center")
+
+    # Unisci i due blocchi di card
+    return html.Div([
+        kpi_cards_base,
+        html.Br(),
+        kpi_cards_extra
+    ])
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+def kpi_campi(id_dataset, versione, start_date, end_date, quality_range):
+    # Righe della tabella dei KPI per campo; l'id di riga è il campo (drill-down da active_cell)
+    df_kpi = kpi_per_campo(dati_filtrati(id_dataset, versione, start_date, end_date, quality_range))
+    return [dict(riga, id=riga[COLONNA_CAMPO]) for riga in df_kpi.to_dict('records')]
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+def alert_periodo(id_dataset, versione, start_date, end_date, quality_range):
+    # Testi formattati (vettoriale) e conteggi per categoria degli alert del periodo
+    return riepilogo_alert(dati_filtrati(id_dataset, versione, start_date, end_date, quality_range))
+
+
+def lista_alert(id_dataset, versione, start_date, end_date, quality_range, pagina=1):
+    # Solo la pagina visibile della lista, con il numero totale di pagine
+    testi = alert_periodo(id_dataset, versione, start_date, end_date, quality_range).testi
+    return [html.Li(testo) for testo in pagina_alert(testi, pagina)], numero_pagine(testi)
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+def conteggi_alert(id_dataset, versione, start_date, end_date, quality_range):
+    # Prefissi per riga (estesi in modo incrementale) se il filtro qualità non esclude righe
+    contatore = contatore_alert(riferimento(id_dataset, versione))
+    if contatore.supporta(quality_range):
+        df = registro.carica(riferimento(id_dataset, versione))
+        conteggi = contatore.conteggi(*posizioni_periodo(df, start_date, end_date))
+    else:
+        conteggi = alert_periodo(id_dataset, versione, start_date, end_date, quality_range).conteggi
+    return [
+        dbc.Badge(f"{CATEGORIE_ALERT[categoria]}: {numero}",
+                  color="danger" if numero else "secondary", className="me-2")
+        for categoria, numero in conteggi.items()
+    ]
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+@misura_fase(FIGURA)
+def figura_media_mensile(id_dataset, versione, start_date, end_date, quality_range):
+    #  Distribuzione mensile con deviazione standard
+    with fase(CALCOLO):
+        cubo = _cubo(id_dataset, versione, start_date, end_date, quality_range)
+        if cubo:
+            df_monthly = cubo.statistiche_mensili('Quantità raccolto (kg)', start_date, end_date)
+        else:
+            df_monthly = backend_query.statistiche_mensili(id_dataset, versione, 'Quantità raccolto (kg)',
+                                                           start_date, end_date, quality_range)
+
+    fig_box = px.bar(
+        df_monthly,
+        x='MeseNum',
+        y='mean',
+        error_y='std',
+        template='plotly_white',
+        title='Media Mensile della Produzione con Barre di Errore (dev. standard)'
+    )
+    fig_box.update_layout(
+        xaxis_title='Mese',
+        yaxis_title='Produzione Media (kg)'
+    )
+    return fig_box
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+@misura_fase(FIGURA)
+def figura_costi_profitto(id_dataset, versione, start_date, end_date, quality_range):
+    colonne_cp = ['Costo produzione (€)', 'Profitto stimato (€)']
+    with fase(CALCOLO):
+        cubo = _cubo(id_dataset, versione, start_date, end_date, quality_range)
+        if cubo:
+            df_monthly_cp = cubo.medie_mensili(colonne_cp, start_date, end_date)
+        else:
+            df_monthly_cp = backend_query.medie_mensili(id_dataset, versione, colonne_cp,
+                                                        start_date, end_date, quality_range)
+    df_melted = df_monthly_cp.melt(
+        id_vars='MeseNum',
+        value_vars=colonne_cp,
+        var_name='Variabile',
+        value_name='Valore'
+    )
+    fig_line_cp = px.line(
+        df_melted,
+        x='MeseNum',
+        y='Valore',
+        color='Variabile',
+        markers=True,
+        template='plotly_white',
+        title='Andamento Mensile di Costi e Profitto (media mensile)'
+    )
+    fig_line_cp.update_layout(
+        xaxis_title='Mese',
+        yaxis_title='Valore (€)',
+        legend_title_text='Variabile'
+    )
+    return fig_line_cp
@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+# Configurazione di gunicorn per app.wsgi:server (valori da app.config / variabili d'ambiente).
+# Con più worker i dataset devono essere visibili a tutti i processi: se non è indicata
+# una cartella condivisa se ne usa una nella directory temporanea.
+os.environ.setdefault("DASHBOARD_CARTELLA_CONDIVISA",
+                      os.path.join(tempfile.gettempdir(), "dashboard-condivisa"))
+
+from app.config import BIND_WSGI, WORKER_WSGI, THREAD_WSGI, TIMEOUT_WSGI, PRELOAD_WSGI
+
+bind = BIND_WSGI
+workers = WORKER_WSGI
+threads = THREAD_WSGI
+# Le callback rilasciano il GIL in numpy/pandas/Arrow: più thread per processo
+worker_class = "gthread" if THREAD_WSGI > 1 else "sync"
+timeout = TIMEOUT_WSGI
+# App (e dataset iniziale) caricati nel master prima del fork: pagine condivise copy-on-write
+# e stesso riferimento iniziale in tutti i worker
+preload_app = PRELOAD_WSGI
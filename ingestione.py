@@ -0,0 +1,97 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from app.config import CARTELLA_INGESTIONE
+from app.dataset import registro
+from app.serializzazione import codec_per_file
+
+
+# Ingestione incrementale da una cartella di drop: i file depositati (CSV con separatore ';'
+# come l'export della dashboard, Parquet o Arrow IPC) vengono accodati all'ultima versione
+# del dataset con registro.aggiungi e poi spostati in 'importati' (o 'scartati' se illeggibili).
+# Con più worker WSGI ogni file è preso da un solo processo (rename atomico in 'in_corso')
+# e le ingestioni sono serializzate da un lock sul file .lock della cartella.
+ESTENSIONI = (".csv", ".parquet", ".arrow")
+CARTELLA_IN_CORSO = "in_corso"
+CARTELLA_IMPORTATI = "importati"
+CARTELLA_SCARTATI = "scartati"
+FILE_LOCK = ".lock"
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def lock_cartella(cartella):
+    # Lock tra processi (flock); su Windows gira un solo processo e basta il lock tra thread
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(os.path.join(cartella, FILE_LOCK), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def file_in_attesa(cartella):
+    if not cartella or not os.path.isdir(cartella):
+        return []
+    # Ordine per data di modifica: i file più vecchi vengono accodati per primi
+    voci = [voce for voce in os.scandir(cartella) if voce.is_file() and voce.name.lower().endswith(ESTENSIONI)]
+    return [voce.path for voce in sorted(voci, key=lambda voce: (voce.stat().st_mtime, voce.name))]
+
+
+def leggi_righe(percorso):
+    if percorso.lower().endswith(".csv"):
+        return pd.read_csv(percorso, sep=';', encoding='utf-8-sig', parse_dates=['Data'])
+    return codec_per_file(percorso).leggi_file(percorso).reset_index(drop=True)
+
+
+def _sposta(percorso, cartella, sottocartella):
+    # Rename atomico in una sottocartella della cartella di ingestione; None se il file
+    # non c'è più (preso da un altro worker)
+    destinazione = os.path.join(cartella, sottocartella)
+    os.makedirs(destinazione, exist_ok=True)
+    destinazione = os.path.join(destinazione, os.path.basename(percorso))
+    try:
+        os.replace(percorso, destinazione)
+    except FileNotFoundError:
+        return None
+    return destinazione
+
+
+def ingerisci(riferimento, cartella=CARTELLA_INGESTIONE):
+    # Accoda i file in attesa e restituisce il riferimento all'ultima versione del dataset
+    if not file_in_attesa(cartella):
+        return registro.ultima_versione(riferimento)
+    with _lock, lock_cartella(cartella):
+        riferimento = registro.ultima_versione(riferimento)
+        blocchi, letti = [], []
+        for percorso in file_in_attesa(cartella):
+            percorso = _sposta(percorso, cartella, CARTELLA_IN_CORSO)
+            if percorso is None:
+                continue
+            try:
+                blocchi.append(leggi_righe(percorso))
+            except Exception:
+                _sposta(percorso, cartella, CARTELLA_SCARTATI)
+                continue
+            letti.append(percorso)
+        if not blocchi:
+            return riferimento
+        try:
+            riferimento = registro.aggiungi(riferimento, pd.concat(blocchi, ignore_index=True))
+        except (ValueError, TypeError):
+            # Colonne mancanti o tipi non convertibili: nessun file viene accodato
+            for percorso in letti:
+                _sposta(percorso, cartella, CARTELLA_SCARTATI)
+            return riferimento
+        for percorso in letti:
+            _sposta(percorso, cartella, CARTELLA_IMPORTATI)
+        return riferimento
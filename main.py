@@ -1,13 +1,24 @@
 import dash
 import dash_bootstrap_components as dbc
 from app.components import layout
+from app.config import METRICHE_ABILITATE
+from app.metriche import installa as installa_metriche
+from app.esportazione import installa as installa_esportazione
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.LUX, dbc.icons.FONT_AWESOME])
 app.title = "Dashboard Azienda Ortofrutticola"
 
 app.layout = layout
+# Applicazione Flask sottostante, servita dai worker WSGI (vedi wsgi.py)
+server = app.server
+
+# Strumentazione delle callback e rotta /metrics: va installata prima di registrarle
+if METRICHE_ABILITATE:
+    installa_metriche(app)
+# Rotta di download in streaming dei dati filtrati
+installa_esportazione(app)
 
 # Importa i callbacks (che a loro volta importano app)
 from  .callbacks import *
 
 if __name__ == '__main__':
-    app.run_server(debug=False)
+    app.run(debug=False)
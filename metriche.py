@@ -0,0 +1,249 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from app.config import SOGLIA_PROFILO_MS, CARTELLA_PROFILI
+
+
+# Strumentazione delle callback: ogni funzione registrata con @app.callback misura
+# la durata totale della richiesta, la ripartizione per fase e la dimensione della
+# risposta. Le fasi interne sono marcate con fase()/misura_fase() e contate in modo
+# esclusivo (il tempo di una fase annidata non è attribuito alla fase esterna);
+# il tempo non marcato della callback si somma a "calcolo". Gli istogrammi sono esposti in
+# formato testo Prometheus su /metrics (per processo: ogni worker WSGI ha i propri).
+
+DESERIALIZZAZIONE = "deserializzazione"
+FILTRO = "filtro"
+CALCOLO = "calcolo"
+FIGURA = "figura"
+SERIALIZZAZIONE = "serializzazione"
+FASI = (DESERIALIZZAZIONE, FILTRO, CALCOLO, FIGURA, SERIALIZZAZIONE)
+
+BUCKET_SECONDI = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKET_BYTE = tuple(1024 * 4 ** k for k in range(9))   # da 1 KB a 64 MB
+
+FAMIGLIE = {
+    "dashboard_callback_durata_secondi": ("Durata delle richieste di callback", BUCKET_SECONDI),
+    "dashboard_callback_fase_secondi": ("Durata delle fasi delle callback", BUCKET_SECONDI),
+    "dashboard_callback_risposta_byte": ("Dimensione della risposta delle callback", BUCKET_BYTE),
+}
+
+PERCORSO_CALLBACK = "_dash-update-component"
+
+
+class Istogramma:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.conteggi = [0] * len(bucket)
+        self.somma = 0.0
+        self.conteggio = 0
+
+    def osserva(self, valore):
+        for i, limite in enumerate(self.bucket):
+            if valore <= limite:
+                self.conteggi[i] += 1
+        self.somma += valore
+        self.conteggio += 1
+
+
+class Metriche:
+    def __init__(self):
+        self._istogrammi = {}    # (famiglia, etichette) -> Istogramma
+        self._lock = threading.Lock()
+
+    def osserva(self, famiglia, etichette, valore):
+        chiave = (famiglia, tuple(etichette.items()))
+        with self._lock:
+            istogramma = self._istogrammi.get(chiave)
+            if istogramma is None:
+                istogramma = self._istogrammi[chiave] = Istogramma(FAMIGLIE[famiglia][1])
+            istogramma.osserva(valore)
+
+    def testo_prometheus(self):
+        righe = []
+        with self._lock:
+            voci = sorted(self._istogrammi.items())
+            for famiglia, (descrizione, _) in FAMIGLIE.items():
+                righe += [f"# HELP {famiglia} {descrizione}", f"# TYPE {famiglia} histogram"]
+                for (nome, etichette), istogramma in voci:
+                    if nome != famiglia:
+                        continue
+                    testo = ",".join(f'{k}="{v}"' for k, v in etichette)
+                    for limite, conteggio in zip(istogramma.bucket, istogramma.conteggi):
+                        righe.append(f'{famiglia}_bucket{{{testo},le="{limite:g}"}} {conteggio}')
+                    righe.append(f'{famiglia}_bucket{{{testo},le="+Inf"}} {istogramma.conteggio}')
+                    righe.append(f"{famiglia}_sum{{{testo}}} {istogramma.somma!r}")
+                    righe.append(f"{famiglia}_count{{{testo}}} {istogramma.conteggio}")
+        return "\n".join(righe) + "\n"
+
+
+metriche = Metriche()
+
+
+class MisuraCallback:
+    def __init__(self, nome):
+        self.nome = nome
+        self.fasi = dict.fromkeys(FASI, 0.0)
+        self._annidate = []
+        self.inizio = self.fine = None
+
+    def registra(self, durata, byte_risposta=None):
+        metriche.osserva("dashboard_callback_durata_secondi", {"callback": self.nome}, durata)
+        for nome_fase, tempo in self.fasi.items():
+            metriche.osserva("dashboard_callback_fase_secondi", {"callback": self.nome, "fase": nome_fase}, tempo)
+        if byte_risposta is not None:
+            metriche.osserva("dashboard_callback_risposta_byte", {"callback": self.nome}, byte_risposta)
+
+
+_misura_corrente = contextvars.ContextVar("misura_callback", default=None)
+
+
+@contextmanager
+def fase(nome):
+    misura = _misura_corrente.get()
+    if misura is None:
+        yield
+        return
+    inizio = time.perf_counter()
+    misura._annidate.append(0.0)
+    try:
+        yield
+    finally:
+        durata = time.perf_counter() - inizio
+        misura.fasi[nome] += durata - misura._annidate.pop()
+        if misura._annidate:
+            misura._annidate[-1] += durata
+
+
+def misura_fase(nome):
+    def decoratore(funzione):
+        @functools.wraps(funzione)
+        def misurata(*args, **kwargs):
+            with fase(nome):
+                return funzione(*args, **kwargs)
+        return misurata
+    return decoratore
+
+
+# Profilazione opzionale: un solo profilo alla volta (i profiler di Python
+# sono per thread e non possono essere attivi in più richieste contemporaneamente)
+_lock_profilo = threading.Lock()
+
+
+class _Profilo:
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            import cProfile
+
+            self._profiler, self.estensione = cProfile.Profile(), "prof"
+        else:
+            self._profiler, self.estensione = Profiler(), "html"
+
+    def avvia(self):
+        if self.estensione == "prof":
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def ferma(self):
+        if self.estensione == "prof":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    def salva(self, percorso):
+        if self.estensione == "prof":
+            self._profiler.dump_stats(percorso)
+        else:
+            with open(percorso, "w", encoding="utf-8") as f:
+                f.write(self._profiler.output_html())
+
+
+def _avvia_profilo(soglia_ms):
+    if soglia_ms is None or not _lock_profilo.acquire(blocking=False):
+        return None
+    profilo = _Profilo()
+    profilo.avvia()
+    return profilo
+
+
+def _chiudi_profilo(profilo, nome, durata, soglia_ms, cartella):
+    try:
+        profilo.ferma()
+        if durata * 1000 >= soglia_ms:
+            os.makedirs(cartella, exist_ok=True)
+            nome_file = f"{nome}-{time.strftime('%Y%m%d-%H%M%S')}-{durata * 1000:.0f}ms.{profilo.estensione}"
+            profilo.salva(os.path.join(cartella, nome_file))
+    finally:
+        _lock_profilo.release()
+
+
+def strumenta_callback(funzione, soglia_ms=SOGLIA_PROFILO_MS, cartella_profili=CARTELLA_PROFILI):
+    from flask import g, has_request_context
+
+    nome = funzione.__name__
+
+    @functools.wraps(funzione)
+    def strumentata(*args, **kwargs):
+        misura = MisuraCallback(nome)
+        token = _misura_corrente.set(misura)
+        profilo = _avvia_profilo(soglia_ms)
+        misura.inizio = time.perf_counter()
+        try:
+            return funzione(*args, **kwargs)
+        finally:
+            misura.fine = time.perf_counter()
+            durata = misura.fine - misura.inizio
+            _misura_corrente.reset(token)
+            if profilo is not None:
+                _chiudi_profilo(profilo, nome, durata, soglia_ms, cartella_profili)
+            marcate = sum(tempo for nome_fase, tempo in misura.fasi.items() if nome_fase != CALCOLO)
+            misura.fasi[CALCOLO] = max(durata - marcate, 0.0)
+            if has_request_context() and "inizio_richiesta" in g:
+                # Deserializzazione, serializzazione e dimensione completate in after_request
+                g.misura_callback = misura
+            else:
+                misura.registra(durata)
+
+    return strumentata
+
+
+def installa(app):
+    # Da chiamare prima di registrare le callback: avvolge app.callback e aggiunge
+    # gli hook della richiesta Flask e la rotta /metrics
+    from flask import Response, g, request
+
+    callback_originale = app.callback
+
+    def callback(*args, **kwargs):
+        registra = callback_originale(*args, **kwargs)
+        return lambda funzione: registra(strumenta_callback(funzione))
+
+    app.callback = callback
+    server = app.server
+
+    @server.before_request
+    def _inizio_richiesta():
+        if request.path.endswith(PERCORSO_CALLBACK):
+            g.inizio_richiesta = time.perf_counter()
+
+    @server.after_request
+    def _fine_richiesta(risposta):
+        misura = g.pop("misura_callback", None)
+        if misura is not None:
+            adesso = time.perf_counter()
+            # Prima della callback: parsing del JSON della richiesta e preparazione degli input;
+            # dopo: serializzazione dell'output in JSON
+            misura.fasi[DESERIALIZZAZIONE] += misura.inizio - g.inizio_richiesta
+            misura.fasi[SERIALIZZAZIONE] += adesso - misura.fine
+            misura.registra(adesso - g.inizio_richiesta, risposta.calculate_content_length() or 0)
+        return risposta
+
+    @server.route("/metrics")
+    def _metriche():
+        return Response(metriche.testo_prometheus(), mimetype="text/plain; version=0.0.4")
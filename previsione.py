@@ -0,0 +1,255 @@
+import threading
+import warnings
+from abc import ABC, abstractmethod
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from app.campi import media_per_data
+from app.dataset import registro
+from app.query import filtra_periodo
+from app.schema import espandi
+
+
+# Servizio di previsione condiviso dal grafico e dall'export CSV del Forecast:
+# la previsione è calcolata una sola volta per (id dataset, versione, data finale, modello).
+GIORNI_PREVISIONE = 30
+COLONNA_PREVISTA = 'Quantità raccolto (kg)'
+COLONNA_INFERIORE = 'Limite inferiore'
+COLONNA_SUPERIORE = 'Limite superiore'
+LIVELLO_CONFIDENZA = 0.95
+# Ordinale proleptico gregoriano del 1970-01-01 (datetime.date.toordinal)
+ORDINALE_EPOCA = 719163
+# Stagionalità annuale come termini di Fourier (il periodo di 365 giorni è troppo
+# lungo per una componente stagionale esplicita nei modelli a spazio degli stati)
+ARMONICHE_ANNUALI = 3
+# I parametri dei modelli a spazio degli stati sono stimati sui dati fino all'ultimo giorno
+# del mese precedente la data finale (ancora), purché siano almeno MIN_GIORNI_STIMA giorni;
+# altrimenti fino alla data finale
+MIN_GIORNI_STIMA = 60
+# Con meno giorni osservati la stagionalità annuale (termini di Fourier) non è stimabile e i modelli
+# a spazio degli stati estrapolano valori senza senso: si usa il modello lineare
+MIN_GIORNI_STAGIONALI = 270
+
+Previsione = namedtuple('Previsione', ['storico', 'previsione'])
+StatoModello = namedtuple('StatoModello', ['risultati', 'beta', 'inizio', 'ancora', 'ultimo_giorno'])
+
+
+def ordinali(date):
+    # Equivalente vettoriale di Data.map(datetime.toordinal)
+    giorni = pd.DatetimeIndex(date).to_numpy().astype('datetime64[D]').astype(np.int64)
+    return giorni + ORDINALE_EPOCA
+
+
+def date_future(end_date, giorni=GIORNI_PREVISIONE):
+    return pd.date_range(pd.to_datetime(end_date) + pd.Timedelta(days=1), periods=giorni, freq='D')
+
+
+def termini_fourier(date, armoniche=ARMONICHE_ANNUALI):
+    t = 2 * np.pi * ordinali(date) / 365.25
+    return np.column_stack([f(k * t) for k in range(1, armoniche + 1) for f in (np.sin, np.cos)])
+
+
+def serie_giornaliera(storico):
+    # Una osservazione per giorno (media tra campi/ore), con NaN per i giorni mancanti
+    return storico[COLONNA_PREVISTA].resample('D').mean()
+
+
+def giorno_ancora(serie):
+    # Ultimo giorno dei dati usati per stimare i parametri: dipende solo dalla serie fino
+    # alla data finale, mai da osservazioni successive
+    ultimo = serie.index[-1]
+    ancora = ultimo.to_period('M').start_time - pd.Timedelta(days=1)
+    if (ancora - serie.index[0]).days + 1 < MIN_GIORNI_STIMA:
+        return ultimo
+    return ancora
+
+
+def _quantile_normale():
+    return NormalDist().inv_cdf(0.5 + LIVELLO_CONFIDENZA / 2)
+
+
+class ModelloLineare:
+    # Retta ai minimi quadrati su (ordinale, produzione); intervallo di previsione OLS
+    min_giorni = 2
+
+    def adatta(self, storico):
+        x = ordinali(storico['Data'])
+        y = storico[COLONNA_PREVISTA].to_numpy()
+        coeffs = np.polyfit(x, y, 1)
+        residui = y - np.poly1d(coeffs)(x)
+        gradi_liberta = max(len(x) - 2, 1)
+        return {
+            'coeffs': coeffs,
+            'sigma': np.sqrt(residui @ residui / gradi_liberta),
+            'n': len(x),
+            'x_medio': x.mean(),
+            'sxx': ((x - x.mean()) ** 2).sum(),
+        }
+
+    def aggiorna(self, stato, storico):
+        return None
+
+    def prevedi(self, stato, future):
+        x = ordinali(future)
+        media = np.poly1d(stato['coeffs'])(x)
+        leva = 1 + 1 / stato['n'] + (x - stato['x_medio']) ** 2 / stato['sxx'] if stato['sxx'] else 1
+        ampiezza = _quantile_normale() * stato['sigma'] * np.sqrt(leva)
+        return media, media - ampiezza, media + ampiezza
+
+
+class _ModelloStatoSpazio(ABC):
+    # Base per i modelli statsmodels a spazio degli stati: parametri (e stagionalità) stimati
+    # fino al giorno di ancora, poi il filtro è esteso fino alla data finale senza ristimarli.
+    # Finché l'ancora non cambia, spostare la data finale aggiorna solo il filtro (append o
+    # apply) e la previsione per una data finale non dipende dalle richieste precedenti.
+    min_giorni = MIN_GIORNI_STAGIONALI
+
+    @abstractmethod
+    def _stima(self, endog, exog):
+        pass
+
+    def _endog(self, serie, beta):
+        return serie.to_numpy()
+
+    def _exog(self, date):
+        return None
+
+    def _stagionale_futura(self, future, beta):
+        return 0
+
+    def _beta(self, serie):
+        return None
+
+    def _estendi(self, stato, serie):
+        # Filtro esteso da stato.ultimo_giorno all'ultimo giorno della serie
+        nuove = serie.loc[stato.ultimo_giorno + pd.Timedelta(days=1):]
+        if not len(nuove):
+            return stato
+        risultati = stato.risultati.append(self._endog(nuove, stato.beta), exog=self._exog(nuove.index))
+        return stato._replace(risultati=risultati, ultimo_giorno=serie.index[-1])
+
+    def adatta(self, storico):
+        serie = serie_giornaliera(storico)
+        ancora = giorno_ancora(serie)
+        stima = serie.loc[:ancora]
+        beta = self._beta(stima)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            risultati = self._stima(self._endog(stima, beta), self._exog(stima.index))
+        return self._estendi(StatoModello(risultati, beta, serie.index[0], ancora, ancora), serie)
+
+    def aggiorna(self, stato, storico):
+        serie = serie_giornaliera(storico)
+        if serie.index[0] != stato.inizio or giorno_ancora(serie) != stato.ancora:
+            return None
+        if serie.index[-1] >= stato.ultimo_giorno:
+            return self._estendi(stato, serie)
+        # Data finale arretrata (non prima dell'ancora): stessi parametri filtrati sullo storico più corto
+        risultati = stato.risultati.apply(self._endog(serie, stato.beta), exog=self._exog(serie.index))
+        return stato._replace(risultati=risultati, ultimo_giorno=serie.index[-1])
+
+    def prevedi(self, stato, future):
+        # La previsione parte dal giorno successivo all'ultima osservazione
+        passi = (future[-1] - stato.ultimo_giorno).days
+        date = pd.date_range(stato.ultimo_giorno + pd.Timedelta(days=1), periods=passi, freq='D')
+        forecast = stato.risultati.get_forecast(passi, exog=self._exog(date))
+        intervallo = np.asarray(forecast.conf_int(alpha=1 - LIVELLO_CONFIDENZA))[-len(future):]
+        media = np.asarray(forecast.predicted_mean)[-len(future):]
+        stagionale = self._stagionale_futura(future, stato.beta)
+        return media + stagionale, intervallo[:, 0] + stagionale, intervallo[:, 1] + stagionale
+
+
+class ModelloHoltWinters(_ModelloStatoSpazio):
+    # Holt con trend smorzato (spazio degli stati) sulla serie destagionalizzata;
+    # la stagionalità annuale è stimata una volta con una regressione di Fourier
+    def _beta(self, serie):
+        validi = serie.notna().to_numpy()
+        X = np.column_stack([np.ones(validi.sum()), termini_fourier(serie.index[validi])])
+        beta, *_ = np.linalg.lstsq(X, serie.to_numpy()[validi], rcond=None)
+        return beta[1:]
+
+    def _endog(self, serie, beta):
+        return serie.to_numpy() - termini_fourier(serie.index) @ beta
+
+    def _stagionale_futura(self, future, beta):
+        return termini_fourier(future) @ beta
+
+    def _stima(self, endog, exog):
+        from statsmodels.tsa.statespace.exponential_smoothing import ExponentialSmoothing
+
+        return ExponentialSmoothing(endog, trend=True, damped_trend=True).fit(disp=False, maxiter=200)
+
+
+class ModelloSARIMA(_ModelloStatoSpazio):
+    # ARIMA(1,0,1) con costante e stagionalità annuale come regressori di Fourier
+    def _exog(self, date):
+        return termini_fourier(date)
+
+    def _stima(self, endog, exog):
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+        return SARIMAX(endog, exog=exog, order=(1, 0, 1), trend='c').fit(disp=False, maxiter=200)
+
+
+MODELLI = {
+    'lineare': ModelloLineare(),
+    'holt-winters': ModelloHoltWinters(),
+    'sarima': ModelloSARIMA(),
+}
+
+# Ultimo stato stimato per (id dataset, versione, modello), riusato per gli aggiornamenti incrementali;
+# una versione ottenuta accodando giorni (registro.aggiungi) parte dallo stato della versione precedente
+MAX_STATI = 16
+_stati = OrderedDict()
+_lock_stati = threading.Lock()
+
+
+def _stato_modello(id_dataset, versione, nome_modello, storico):
+    modello = MODELLI[nome_modello]
+    chiave = (id_dataset, versione, nome_modello)
+    with _lock_stati:
+        precedente = _stati.get(chiave)
+    origine = {"id": id_dataset, "versione": versione}
+    while precedente is None:
+        origine = registro.precedente(origine)
+        if origine is None:
+            break
+        with _lock_stati:
+            precedente = _stati.get((origine["id"], origine["versione"], nome_modello))
+    stato = modello.aggiorna(precedente, storico) if precedente is not None else None
+    if stato is None:
+        stato = modello.adatta(storico)
+    with _lock_stati:
+        _stati[chiave] = stato
+        _stati.move_to_end(chiave)
+        while len(_stati) > MAX_STATI:
+            _stati.popitem(last=False)
+    return stato
+
+
+@lru_cache(maxsize=32)
+def calcola_previsione(id_dataset, versione, end_date, modello='lineare'):
+    # Restituisce None se lo storico fino a end_date ha meno di due osservazioni
+    df = registro.carica({"id": id_dataset, "versione": versione})
+    # Con più campi lo storico ha una riga per data (media tra i campi), come serie_giornaliera
+    storico = media_per_data(espandi(filtra_periodo(df, fine=end_date), [COLONNA_PREVISTA]), [COLONNA_PREVISTA])
+    if len(storico) < 2:
+        return None
+    if len(storico) < MODELLI[modello].min_giorni:
+        modello = 'lineare'
+    future = date_future(end_date)
+    stato = _stato_modello(id_dataset, versione, modello, storico)
+    media, inferiore, superiore = MODELLI[modello].prevedi(stato, future)
+    # La produzione non è negativa: previsione e intervallo limitati a 0
+    media, inferiore, superiore = (np.maximum(valori, 0) for valori in (media, inferiore, superiore))
+    df_previsione = pd.DataFrame({
+        'Data': future,
+        COLONNA_PREVISTA: media,
+        COLONNA_INFERIORE: inferiore,
+        COLONNA_SUPERIORE: superiore,
+    })
+    return Previsione(storico, df_previsione)
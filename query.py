@@ -0,0 +1,57 @@
+import pandas as pd
+
+from app.metriche import misura_fase, FILTRO
+from app.schema import valori
+
+
+# Helper condiviso per i filtri di periodo e qualità del suolo.
+# Il dataset è indicizzato da un DatetimeIndex ordinato: i range di date
+# si risolvono con searchsorted (O(log n)) e uno slice posizionale,
+# senza costruire maschere booleane sull'intero DataFrame.
+# Il risultato resta nello schema del dataset: con il solo periodo è una vista senza
+# copia; i valori float64 esatti si leggono con schema.valori/espandi dove servono.
+
+COLONNA_DATA = 'Data'
+COLONNA_QUALITA = 'Qualità suolo (%)'
+
+
+def indicizza(df):
+    # Ordina per data (ordinamento stabile) e usa la colonna 'Data' come indice
+    if isinstance(df.index, pd.DatetimeIndex) and df.index.is_monotonic_increasing:
+        return df
+    df = df.sort_values(COLONNA_DATA, kind='mergesort')
+    df.index = pd.DatetimeIndex(df[COLONNA_DATA])
+    df.index.name = None
+    return df
+
+
+def _limite_fine(fine):
+    # Una data senza orario include l'intera giornata (rilevante per dati orari)
+    fine = pd.Timestamp(fine)
+    if fine == fine.normalize():
+        fine = fine + pd.Timedelta(days=1) - pd.Timedelta(1, unit='ns')
+    return fine
+
+
+def posizioni_indice(indice, inizio=None, fine=None):
+    i = 0 if inizio is None else indice.searchsorted(pd.Timestamp(inizio), side='left')
+    j = len(indice) if fine is None else indice.searchsorted(_limite_fine(fine), side='right')
+    return i, max(i, j)
+
+
+def posizioni_periodo(df, inizio=None, fine=None):
+    return posizioni_indice(df.index, inizio, fine)
+
+
+@misura_fase(FILTRO)
+def filtra_periodo(df, inizio=None, fine=None, qualita=None):
+    i, j = posizioni_periodo(df, inizio, fine)
+    df_periodo = df.iloc[i:j]
+    if qualita is None:
+        return df_periodo
+    q_min, q_max = qualita
+    qualita_suolo = valori(df_periodo[COLONNA_QUALITA])
+    mask = (qualita_suolo >= q_min) & (qualita_suolo <= q_max)
+    if mask.all():
+        return df_periodo
+    return df_periodo[mask]
@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# Linee di tendenza per lo scatter della dashboard, senza statsmodels:
+# retta OLS in forma chiusa dalle statistiche sufficienti (medie e somme dei
+# prodotti centrati) e LOWESS opzionale valutata su una griglia di punti.
+FRAZIONE_LOWESS = 2 / 3
+PUNTI_LOWESS = 100
+# Oltre questo numero di osservazioni la LOWESS usa un sottocampione a passo costante
+MAX_CAMPIONI_LOWESS = 20000
+
+Statistiche = namedtuple('Statistiche', ['n', 'media_x', 'media_y', 'sxx', 'sxy', 'syy', 'minimo_x', 'massimo_x'])
+Retta = namedtuple('Retta', ['pendenza', 'intercetta', 'r2'])
+
+
+def coppie_valide(x, y):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    validi = np.isfinite(x) & np.isfinite(y)
+    return x[validi], y[validi]
+
+
+def statistiche_sufficienti(x, y):
+    x, y = coppie_valide(x, y)
+    if len(x) == 0:
+        return Statistiche(0, np.nan, np.nan, 0.0, 0.0, 0.0, np.nan, np.nan)
+    media_x, media_y = x.mean(), y.mean()
+    dx, dy = x - media_x, y - media_y
+    return Statistiche(len(x), media_x, media_y, dx @ dx, dx @ dy, dy @ dy, x.min(), x.max())
+
+
+def retta_ols(statistiche):
+    # None se la retta non è identificabile (meno di due x distinte)
+    if statistiche.n < 2 or statistiche.sxx == 0:
+        return None
+    pendenza = statistiche.sxy / statistiche.sxx
+    intercetta = statistiche.media_y - pendenza * statistiche.media_x
+    r2 = statistiche.sxy ** 2 / (statistiche.sxx * statistiche.syy) if statistiche.syy else 1.0
+    return Retta(pendenza, intercetta, r2)
+
+
+def lowess(x, y, frazione=FRAZIONE_LOWESS, punti=PUNTI_LOWESS):
+    # Regressione lineare locale con pesi tricubici; restituisce (griglia x, valori stimati)
+    x, y = coppie_valide(x, y)
+    if len(x) < 3 or x.min() == x.max():
+        return None
+    if len(x) > MAX_CAMPIONI_LOWESS:
+        ordine = np.argsort(x, kind='stable')[::len(x) // MAX_CAMPIONI_LOWESS + 1]
+        x, y = x[ordine], y[ordine]
+    griglia = np.linspace(x.min(), x.max(), punti)
+    vicini = max(int(np.ceil(frazione * len(x))), 3)
+    distanze = np.abs(x[None, :] - griglia[:, None])
+    # Raggio di ciascun punto della griglia: distanza del k-esimo vicino
+    raggio = np.partition(distanze, vicini - 1, axis=1)[:, vicini - 1:vicini]
+    raggio = np.where(raggio > 0, raggio, 1.0)
+    pesi = np.clip(1 - (distanze / raggio) ** 3, 0, None) ** 3
+    somma_pesi = pesi.sum(axis=1)
+    media_x = pesi @ x / somma_pesi
+    media_y = pesi @ y / somma_pesi
+    dx = x[None, :] - media_x[:, None]
+    sxx = (pesi * dx * dx).sum(axis=1)
+    sxy = (pesi * dx * (y[None, :] - media_y[:, None])).sum(axis=1)
+    pendenza = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+    return griglia, media_y + pendenza * (griglia - media_x)
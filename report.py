@@ -0,0 +1,274 @@
+import base64
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.artefatti import artefatti, impronta
+from app.config import WORKER_REPORT, CACHE_REPORT_MAX, CARTELLA_CONDIVISA
+from app.dataset import scrivi_atomico
+
+
+# Coda di job per la generazione dei report PDF.
+# Kaleido (Chromium) e wkhtmltopdf girano in un pool di processi locale:
+# la callback accoda il job e ritorna subito, il client interroga lo stato
+# e scarica il PDF dalla cache dei risultati. Richieste con la stessa chiave
+# (id dataset, versione, periodo) condividono lo stesso job; immagini e PDF
+# sono conservati nella cache degli artefatti indirizzata per contenuto.
+# Con più worker WSGI lo stato dei job è pubblicato nella cartella condivisa,
+# perché il polling del client può arrivare a un processo diverso.
+
+COLONNA_PRODUZIONE = 'Quantità raccolto (kg)'
+NOME_FILE_REPORT = "report_dashboard.pdf"
+TITOLO_GRAFICO = "Andamento della Produzione nel Tempo"
+
+IN_CODA = 'in_coda'
+IN_CORSO = 'in_corso'
+COMPLETATO = 'completato'
+ERRORE = 'errore'
+
+
+def costruisci_html_report(start_date, end_date, kpi, img_base64, anteprima):
+    produzione_totale = kpi['produzione_totale']
+    profitto_totale = kpi['profitto_totale']
+    temperatura_media = kpi['temperatura_media']
+    prec_media = kpi['precipitazioni_medie']
+
+    # Costruzione del report HTML con sezioni e grafico incluso
+    html_report = f"""
+    <html>
+    <head>
+      <meta charset="utf-8">
+      <title>Report Dashboard</title>
+      <style>
+        body {{ font-family: Arial, sans-serif; margin: 20px; }}
+        h1, h2, h3 {{ color: #2c3e50; }}
+        table {{ width: 100%; border-collapse: collapse; margin-bottom: 20px; }}
+        th, td {{ padding: 8px 12px; border: 1px solid #ccc; }}
+        th {{ background-color: #ecf0f1; }}
+        .section {{ margin-bottom: 40px; }}
+        ul {{ list-style-type: none; padding: 0; }}
+        li {{ margin-bottom: 5px; }}
+        .grafico {{ text-align: center; margin-top: 20px; }}
+      </style>
+    </head>
+    <body>
+      <h1>Report Dashboard</h1>
+      <div class="section">
+        <h2>Periodo di Analisi</h2>
+        <p><strong>Inizio:</strong> {start_date}</p>
+        <p><strong>Fine:</strong> {end_date}</p>
+      </div>
+      <div class="section">
+        <h2>Riepilogo KPI</h2>
+        <ul>
+          <li><strong>Produzione Totale:</strong> {produzione_totale:,.1f} kg</li>
+          <li><strong>Profitto Totale:</strong> {profitto_totale:,.2f} €</li>
+          <li><strong>Temperatura Media:</strong> {temperatura_media:.1f} °C</li>
+          <li><strong>Precipitazioni Medie:</strong> {prec_media:.1f} mm</li>
+        </ul>
+      </div>
+      <div class="section">
+        <h2>Grafico: Andamento della Produzione</h2>
+        <div class="grafico">
+          <img src="data:image/png;base64,{img_base64}" alt="Grafico Produzione" style="max-width:100%; height:auto;">
+        </div>
+      </div>
+      <div class="section">
+        <h2>Anteprima Dati</h2>
+        {anteprima.to_html(index=False)}
+      </div>
+      <div class="section">
+        <h2>Analisi e Commenti</h2>
+        <p>
+          Il report evidenzia un andamento stagionale coerente con le attese per il settore primario.
+          Si osservano variazioni significative nei KPI che potrebbero suggerire opportunità di miglioramento
+          nella gestione delle risorse e nella pianificazione della produzione.
+        </p>
+      </div>
+      <div class="section">
+        <h2>Metodologia</h2>
+        <p>
+          I dati sono stati simulati considerando variabili ambientali e produttive quali temperatura, umidità, 
+          precipitazioni, ore di sole, qualità del suolo, pH, velocità del vento e irrigazione. Il modello applica 
+          fattori correttivi basati su condizioni ideali, introducendo variabilità tramite un fattore casuale, 
+          per stimare la quantità di raccolto e il profitto. Questo approccio consente di analizzare scenari e supportare 
+          le decisioni strategiche.
+        </p>
+      </div>
+    </body>
+    </html>
+    """
+    return html_report
+
+
+def avvia_renderer():
+    # Inizializzazione dei worker: Kaleido (>= 1.0) tiene aperto un Chromium
+    # persistente, riusato da tutti i to_image del processo
+    try:
+        import kaleido
+    except ImportError:
+        return
+    if hasattr(kaleido, "start_sync_server"):
+        kaleido.start_sync_server(silence_warnings=True)
+
+
+def genera_pdf(serie, anteprima, start_date, end_date, kpi, img_bytes=None):
+    # Eseguita in un processo del pool: import pesanti caricati solo nei worker.
+    # Restituisce (PNG del grafico, PDF); il PNG già in cache non viene rigenerato.
+    import pdfkit
+
+    if img_bytes is None:
+        import plotly.express as px
+
+        # Generazione di un grafico esempio: Andamento della produzione nel tempo
+        fig = px.line(serie, x='Data', y=COLONNA_PRODUZIONE,
+                      title=TITOLO_GRAFICO,
+                      template="plotly_white")
+        # Converti il grafico in immagine PNG usando Kaleido
+        img_bytes = fig.to_image(format="png")
+    img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+    html_report = costruisci_html_report(start_date, end_date, kpi, img_base64, anteprima)
+    return img_bytes, pdfkit.from_string(html_report, False)
+
+
+def _cartella_job(cartella_condivisa):
+    return os.path.join(cartella_condivisa, "job") if cartella_condivisa else None
+
+
+class CodaReport:
+    def __init__(self, max_worker=WORKER_REPORT, max_risultati=CACHE_REPORT_MAX, cache=artefatti,
+                 cartella_job=_cartella_job(CARTELLA_CONDIVISA)):
+        self.max_worker = max_worker
+        self.max_risultati = max_risultati
+        self.cache = cache
+        self.cartella_job = cartella_job
+        if cartella_job:
+            os.makedirs(cartella_job, exist_ok=True)
+        self._lock = threading.RLock()
+        self._pool = None
+        self._in_esecuzione = {}          # job_id -> (chiave, future)
+        self._risultati = OrderedDict()   # job_id -> (chiave, impronta del PDF, errore), LRU
+        self._job_per_chiave = {}         # chiave -> job_id
+
+    def _executor(self):
+        # Pool creato al primo job e mantenuto attivo (renderer già avviato nei worker);
+        # "spawn" evita di duplicare con fork i thread del server
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_worker,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=avvia_renderer)
+        return self._pool
+
+    def accoda(self, chiave, serie, anteprima, start_date, end_date, kpi):
+        # Restituisce il job esistente per la chiave (in corso o completato) oppure ne crea uno nuovo
+        with self._lock:
+            job_id = self._job_per_chiave.get(chiave)
+            if job_id in self._in_esecuzione:
+                return job_id
+            if self.stato(job_id) == COMPLETATO:
+                self._risultati.move_to_end(job_id)
+                return job_id
+
+            job_id = uuid.uuid4().hex
+            self._job_per_chiave[chiave] = job_id
+            impronta_grafico = impronta(TITOLO_GRAFICO, serie)
+            impronta_pdf = impronta(impronta_grafico, anteprima, start_date, end_date, kpi)
+            if impronta_pdf in self.cache:
+                # Stesso contenuto già esportato: job completato senza passare dal pool
+                self._registra_risultato(job_id, chiave, impronta_pdf, None)
+                return job_id
+            future = self._executor().submit(genera_pdf, serie, anteprima, start_date, end_date, kpi,
+                                             self.cache.get(impronta_grafico))
+            self._in_esecuzione[job_id] = (chiave, future)
+            self._pubblica(job_id, IN_CODA)
+        future.add_done_callback(lambda f: self._completa(job_id, impronta_grafico, impronta_pdf, f))
+        return job_id
+
+    def _completa(self, job_id, impronta_grafico, impronta_pdf, future):
+        errore = future.exception()
+        if errore is None:
+            img_bytes, pdf = future.result()
+            self.cache.put(impronta_grafico, img_bytes)
+            self.cache.put(impronta_pdf, pdf)
+        with self._lock:
+            chiave, _ = self._in_esecuzione.pop(job_id)
+            if isinstance(errore, BrokenProcessPool):
+                self._pool = None
+            self._registra_risultato(job_id, chiave, impronta_pdf, errore)
+
+    def _registra_risultato(self, job_id, chiave, impronta_pdf, errore):
+        self._risultati[job_id] = (chiave, impronta_pdf, errore)
+        self._pubblica(job_id, ERRORE if errore is not None else COMPLETATO, impronta_pdf, errore)
+        while len(self._risultati) > self.max_risultati:
+            id_espulso, (chiave_espulsa, _, _) = self._risultati.popitem(last=False)
+            if self._job_per_chiave.get(chiave_espulsa) == id_espulso:
+                del self._job_per_chiave[chiave_espulsa]
+            self._rimuovi_pubblicato(id_espulso)
+
+    def _percorso_job(self, job_id):
+        return os.path.join(self.cartella_job, f"{job_id}.json")
+
+    def _pubblica(self, job_id, stato, impronta_pdf=None, errore=None):
+        if not self.cartella_job:
+            return
+        record = {"stato": stato, "impronta": impronta_pdf,
+                  "errore": None if errore is None else str(errore)}
+        scrivi_atomico(self._percorso_job(job_id), json.dumps(record).encode("utf-8"))
+
+    def _rimuovi_pubblicato(self, job_id):
+        if not self.cartella_job:
+            return
+        try:
+            os.remove(self._percorso_job(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _pubblicato(self, job_id):
+        # Job accodato da un altro worker: stato letto dalla cartella condivisa
+        if not self.cartella_job or not job_id:
+            return None
+        try:
+            with open(self._percorso_job(job_id), "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def stato(self, job_id):
+        # None se il job non esiste o il PDF è stato espulso dalla cache degli artefatti
+        with self._lock:
+            if job_id in self._in_esecuzione:
+                return IN_CORSO if self._in_esecuzione[job_id][1].running() else IN_CODA
+            if job_id in self._risultati:
+                _, impronta_pdf, errore = self._risultati[job_id]
+                stato = ERRORE if errore is not None else COMPLETATO
+            else:
+                record = self._pubblicato(job_id)
+                if record is None:
+                    return None
+                stato, impronta_pdf = record["stato"], record["impronta"]
+        if stato == COMPLETATO:
+            return COMPLETATO if impronta_pdf in self.cache else None
+        return stato
+
+    def risultato(self, job_id):
+        with self._lock:
+            if job_id in self._risultati:
+                _, impronta_pdf, _ = self._risultati[job_id]
+                self._risultati.move_to_end(job_id)
+            else:
+                impronta_pdf = self._pubblicato(job_id)["impronta"]
+        return self.cache.get(impronta_pdf)
+
+    def errore(self, job_id):
+        with self._lock:
+            if job_id in self._risultati:
+                return self._risultati[job_id][2]
+            return self._pubblicato(job_id)["errore"]
+
+
+coda_report = CodaReport()
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+
+# Schema compatto del dataset in memoria: le misure (già arrotondate a 1-2 decimali
+# dal generatore) sono conservate in float32 e 'Alert' come categoria, con circa metà
+# della memoria. I valori float64 originali si ricostruiscono esattamente
+# arrotondando ai decimali dello schema: lettura, filtri, KPI ed export passano
+# da valori()/espandi(), quindi i risultati restano identici a quelli in float64.
+
+DECIMALI = {
+    'Temperatura (°C)': 1,
+    'Umidità suolo (%)': 1,
+    'Precipitazioni (mm)': 1,
+    'Ore sole (h)': 1,
+    'Qualità suolo (%)': 1,
+    'pH suolo': 1,
+    'Velocità vento (m/s)': 1,
+    'Irrigazione (mm)': 1,
+    'Quantità raccolto (kg)': 1,
+    'Costo produzione (€)': 2,
+    'Costo irrigazione (€)': 2,
+    'Profitto stimato (€)': 2,
+}
+COLONNA_ALERT = 'Alert'
+
+
+def _dtype_alert():
+    from app.alert import ATTENZIONE, OK  # alert dipende dal registro dei dataset
+
+    return pd.CategoricalDtype([ATTENZIONE, OK])
+
+
+def compatta(df):
+    # Colonne dello schema in float32 solo se il ritorno a float64 è esatto; 'Alert'
+    # categorica se contiene solo i valori previsti. Le altre colonne restano invariate.
+    conversioni = {}
+    for colonna, decimali in DECIMALI.items():
+        if colonna not in df.columns or df[colonna].dtype != np.float64:
+            continue
+        originali = df[colonna].to_numpy()
+        ridotti = originali.astype(np.float32)
+        if np.array_equal(np.round(ridotti.astype(np.float64), decimali), originali, equal_nan=True):
+            conversioni[colonna] = ridotti
+    if COLONNA_ALERT in df.columns and df[COLONNA_ALERT].dtype == object:
+        alert = df[COLONNA_ALERT].astype(_dtype_alert())
+        if not alert.isna().any() or df[COLONNA_ALERT].isna().all():
+            conversioni[COLONNA_ALERT] = alert
+    if not conversioni:
+        return df
+    return df.assign(**conversioni)
+
+
+def allinea(df, nuove):
+    # Dataset e righe aggiunte con gli stessi dtype: le colonne compatte del dataset
+    # tornano in float64 se le nuove righe non sono rappresentabili in float32
+    nuove = compatta(espandi(nuove).astype(espandi(df.iloc[:0]).dtypes.to_dict()))
+    da_espandere = [colonna for colonna in df.columns if df[colonna].dtype != nuove[colonna].dtype]
+    return espandi(df, da_espandere), espandi(nuove, da_espandere)
+
+
+def valori(serie):
+    # Valori float64 esatti di una colonna (dtype-aware)
+    if serie.dtype == np.float32 and serie.name in DECIMALI:
+        return np.round(serie.to_numpy(dtype=np.float64), DECIMALI[serie.name])
+    return serie.to_numpy(dtype=np.float64)
+
+
+def espandi(df, colonne=None):
+    # DataFrame con i dtype originali (float64, 'Alert' testuale); senza copia se non serve
+    colonne = df.columns if colonne is None else colonne
+    conversioni = {}
+    for colonna in colonne:
+        serie = df[colonna]
+        if serie.dtype == np.float32 and colonna in DECIMALI:
+            conversioni[colonna] = valori(serie)
+        elif colonna == COLONNA_ALERT and isinstance(serie.dtype, pd.CategoricalDtype):
+            conversioni[colonna] = serie.to_numpy(dtype=object)
+    if not conversioni:
+        return df
+    # Nuovo DataFrame dalle colonne (senza copiare quelle invariate): più rapido di assign
+    colonne = {colonna: conversioni.get(colonna, df[colonna]) for colonna in df.columns}
+    return pd.DataFrame(colonne, index=df.index, copy=False)
+
+
+def report_memoria(df):
+    # Byte per colonna (deep) con lo schema attuale e con quello originale (float64/testo)
+    attuale = df.memory_usage(index=False, deep=True)
+    originale = espandi(df).memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'byte': attuale,
+        'byte originali': originale,
+    })
+    report['rapporto'] = (report['byte'] / report['byte originali']).round(3)
+    report.loc['Totale'] = ['', report['byte'].sum(), report['byte originali'].sum(),
+                            round(report['byte'].sum() / report['byte originali'].sum(), 3)]
+    return report
@@ -0,0 +1,97 @@
+import io
+
+import pandas as pd
+
+
+# Layer di serializzazione a codec intercambiabili per i DataFrame.
+# Arrow IPC e Parquet conservano i dtype (datetime64, float32, category),
+# il JSON resta disponibile come formato di riferimento.
+class CodecJSON:
+    nome = "json"
+    estensione = "json"
+    mimetype = "application/json"
+
+    # orient="table" include lo schema, così le date tornano datetime64
+    def serializza(self, df):
+        return df.to_json(date_format="iso", orient="table", index=False, double_precision=15).encode("utf-8")
+
+    def deserializza(self, payload):
+        return pd.read_json(io.StringIO(payload.decode("utf-8")), orient="table")
+
+    def leggi_file(self, percorso):
+        with open(percorso, "rb") as f:
+            return self.deserializza(f.read())
+
+
+class CodecArrow:
+    nome = "arrow"
+    estensione = "arrow"
+    mimetype = "application/vnd.apache.arrow.file"
+
+    def serializza(self, df):
+        import pyarrow as pa
+
+        tabella = pa.Table.from_pandas(df)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, tabella.schema) as writer:
+            writer.write_table(tabella)
+        return sink.getvalue().to_pybytes()
+
+    def deserializza(self, payload):
+        import pyarrow as pa
+
+        return pa.ipc.open_file(pa.py_buffer(payload)).read_pandas()
+
+    def leggi_file(self, percorso):
+        import pyarrow as pa
+
+        # Memory-map: le colonne numeriche senza valori mancanti restano viste (a sola
+        # lettura) sulle pagine del file, condivise tra i processi che lo leggono
+        return pa.ipc.open_file(pa.memory_map(percorso)).read_pandas(split_blocks=True)
+
+
+class CodecParquet:
+    nome = "parquet"
+    estensione = "parquet"
+    mimetype = "application/vnd.apache.parquet"
+
+    def __init__(self, compressione="snappy"):
+        self.compressione = compressione
+
+    def serializza(self, df):
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, engine="pyarrow", compression=self.compressione)
+        return buffer.getvalue()
+
+    def deserializza(self, payload):
+        return pd.read_parquet(io.BytesIO(payload), engine="pyarrow")
+
+    def leggi_file(self, percorso):
+        return pd.read_parquet(percorso, engine="pyarrow", memory_map=True)
+
+
+CODEC = {}
+
+
+def registra_codec(codec):
+    CODEC[codec.nome] = codec
+    return codec
+
+
+def get_codec(nome):
+    try:
+        return CODEC[nome]
+    except KeyError:
+        raise ValueError(f"Formato di serializzazione non supportato: {nome}")
+
+
+def codec_per_file(percorso):
+    for codec in CODEC.values():
+        if percorso.endswith(f".{codec.estensione}"):
+            return codec
+    raise ValueError(f"Formato di serializzazione non riconosciuto per il file: {percorso}")
+
+
+registra_codec(CodecJSON())
+registra_codec(CodecArrow())
+registra_codec(CodecParquet())
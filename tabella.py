@@ -0,0 +1,129 @@
+import operator
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from app.dataset import registro
+from app.metriche import misura_fase, FILTRO
+from app.schema import espandi, valori
+
+
+# Interrogazioni lato server per la tabella "Dati Simulati" (page/sort/filter custom):
+# filtro e ordinamento producono le posizioni delle righe, memoizzate per versione
+# del dataset; al client viene inviata solo la pagina corrente.
+RIGHE_PER_PAGINA = 10
+DIMENSIONE_CACHE = 32
+
+# Una condizione della sintassi filter_query della DataTable: {colonna} operatore valore
+# (prefisso opzionale "i"/"s" per il confronto senza/con distinzione maiuscole)
+_CONDIZIONE = re.compile(
+    r"^\s*\{(?P<colonna>[^}]*)\}\s*(?P<caso>[is]?)"
+    r"(?P<operatore>>=|<=|!=|<|>|=|ge|le|lt|gt|ne|eq|contains|datestartswith)\s+(?P<valore>.*?)\s*$"
+)
+_OPERATORI = {'ge': '>=', 'le': '<=', 'lt': '<', 'gt': '>', 'ne': '!=', 'eq': '='}
+_CONFRONTI = {
+    '>=': operator.ge, '<=': operator.le, '<': operator.lt,
+    '>': operator.gt, '!=': operator.ne, '=': operator.eq,
+}
+
+
+def colonne_tabella(df):
+    # Tipi delle colonne per la DataTable (determinano la sintassi dei filtri generati)
+    def tipo(colonna):
+        if pd.api.types.is_datetime64_any_dtype(df[colonna]):
+            return "datetime"
+        if pd.api.types.is_numeric_dtype(df[colonna]):
+            return "numeric"
+        return "text"
+    return [{"name": colonna, "id": colonna, "type": tipo(colonna)} for colonna in df.columns]
+
+
+def _valore(testo):
+    if len(testo) >= 2 and testo[0] == testo[-1] and testo[0] in "'\"`":
+        return testo[1:-1].replace("\\" + testo[0], testo[0])
+    return testo
+
+
+def analizza_filtro(filter_query):
+    # Lista di (colonna, caso, operatore, valore); le condizioni non riconosciute sono ignorate
+    condizioni = []
+    for parte in (filter_query or "").split(" && "):
+        corrispondenza = _CONDIZIONE.match(parte)
+        if corrispondenza:
+            operatore = _OPERATORI.get(corrispondenza['operatore'], corrispondenza['operatore'])
+            condizioni.append((corrispondenza['colonna'], corrispondenza['caso'], operatore,
+                               _valore(corrispondenza['valore'])))
+    return condizioni
+
+
+def _maschera_condizione(serie, caso, operatore, valore):
+    if operatore == 'contains':
+        return serie.astype(str).str.contains(valore, case=caso != 'i', regex=False).to_numpy()
+    if operatore == 'datestartswith':
+        return serie.astype(str).str.startswith(valore).to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        valore = pd.Timestamp(valore)
+    elif pd.api.types.is_numeric_dtype(serie):
+        serie, valore = pd.Series(valori(serie)), float(valore)
+    else:
+        serie = serie.astype(str)
+        if caso == 'i':
+            serie, valore = serie.str.lower(), valore.lower()
+    return _CONFRONTI[operatore](serie, valore).to_numpy(dtype=bool)
+
+
+def maschera_filtro(df, filter_query):
+    maschera = np.ones(len(df), dtype=bool)
+    for colonna, caso, operatore, valore in analizza_filtro(filter_query):
+        if colonna not in df.columns:
+            continue
+        try:
+            maschera &= _maschera_condizione(df[colonna], caso, operatore, valore)
+        except (TypeError, ValueError):
+            # Valore non confrontabile con il tipo della colonna: condizione ignorata
+            continue
+    return maschera
+
+
+def _indice_ordinato(colonna):
+    # Posizioni delle righe in ordine crescente (stabile), valori mancanti in coda
+    def costruisci(df):
+        serie = df[colonna]
+        chiavi = valori(serie) if pd.api.types.is_float_dtype(serie) else serie.to_numpy()
+        return np.argsort(chiavi, kind='stable')
+    return costruisci
+
+
+def indice_ordinato(riferimento, colonna):
+    # Un indice ordinato per colonna e versione del dataset, conservato dal registro
+    return registro.derivato(riferimento, f"ordinamento:{colonna}", _indice_ordinato(colonna))
+
+
+@lru_cache(maxsize=DIMENSIONE_CACHE)
+@misura_fase(FILTRO)
+def posizioni_righe(id_dataset, versione, filter_query, colonna=None, direzione='asc'):
+    riferimento = {"id": id_dataset, "versione": versione}
+    df = registro.carica(riferimento)
+    maschera = maschera_filtro(df, filter_query)
+    if colonna not in df.columns:
+        return np.flatnonzero(maschera)
+    ordine = indice_ordinato(riferimento, colonna)
+    if direzione == 'desc':
+        # Ordine decrescente mantenendo i valori mancanti in coda, come pandas
+        validi = int(df[colonna].notna().sum())
+        ordine = np.concatenate([ordine[:validi][::-1], ordine[validi:]])
+    return ordine[maschera[ordine]]
+
+
+def pagina_tabella(riferimento, pagina, righe_per_pagina, sort_by=None, filter_query=""):
+    # Restituisce (record della pagina, numero di pagine, pagina effettiva)
+    ordinamento = sort_by[0] if sort_by else {}
+    posizioni = posizioni_righe(riferimento["id"], riferimento["versione"], filter_query or "",
+                                ordinamento.get("column_id"), ordinamento.get("direction", "asc"))
+    pagine = max(1, -(-len(posizioni) // righe_per_pagina))
+    pagina = min(max(pagina, 0), pagine - 1)
+    inizio = pagina * righe_per_pagina
+    df = registro.carica(riferimento)
+    return espandi(df.iloc[posizioni[inizio:inizio + righe_per_pagina]]).to_dict("records"), pagine, pagina
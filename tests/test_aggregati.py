@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.aggregati import CuboAggregati, kpi_dataframe, medie_mensili_dataframe, statistiche_mensili_dataframe
+from app.query import filtra_periodo, indicizza
+from app.schema import compatta
+from app.utils import genera_dati
+
+PERIODI = [(None, None), ('2024-02-01', '2024-11-30'), ('2024-03-05', '2024-03-05'), ('2024-06-15', '2024-09-10'),
+           ('2030-01-01', None)]
+COLONNE_MENSILI = ['Quantità raccolto (kg)', 'Costo produzione (€)', 'Temperatura (°C)']
+
+
+@pytest.fixture(params=range(5), ids=lambda seed: f"seed{seed}")
+def dati(request):
+    return compatta(indicizza(genera_dati(periodi=365, n_campi=2, seed=request.param)))
+
+
+@pytest.mark.parametrize("inizio,fine", PERIODI)
+def test_kpi_cubo_come_pandas(dati, inizio, fine):
+    # Stessi valori bit per bit (NaN per le medie di un periodo vuoto)
+    cubo = CuboAggregati(dati)
+    atteso = kpi_dataframe(filtra_periodo(dati, inizio, fine))
+    assert cubo.kpi(inizio, fine).keys() == atteso.keys()
+    for chiave, valore in cubo.kpi(inizio, fine).items():
+        assert valore == atteso[chiave] or (np.isnan(valore) and np.isnan(atteso[chiave])), chiave
+
+
+@pytest.mark.parametrize("inizio,fine", PERIODI)
+def test_aggregati_mensili_cubo_come_pandas(dati, inizio, fine):
+    cubo = CuboAggregati(dati)
+    filtrati = filtra_periodo(dati, inizio, fine)
+    pd.testing.assert_frame_equal(cubo.medie_mensili(COLONNE_MENSILI, inizio, fine),
+                                  medie_mensili_dataframe(filtrati, COLONNE_MENSILI), check_exact=True)
+    for colonna in COLONNE_MENSILI:
+        statistiche = cubo.statistiche_mensili(colonna, inizio, fine)
+        attese = statistiche_mensili_dataframe(filtrati, colonna)
+        pd.testing.assert_series_equal(statistiche['mean'], attese['mean'], check_exact=True)
+        # Deviazione standard: stesso valore a meno dell'ordine delle operazioni
+        pd.testing.assert_series_equal(statistiche['std'], attese['std'], check_exact=False, rtol=1e-12)
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from app.archivio import (apri_archivio, collega_archivio, finestra_iniziale, giorni_finestra, riferimento_storico,
+                          scrivi_archivio)
+from app.previsione import calcola_previsione
+from app.utils import genera_dati
+
+
+def crea_archivio(tmp_path):
+    percorso = str(tmp_path / "archivio.arrow")
+    scrivi_archivio(percorso, [genera_dati(inizio='2020-01-01', fine='2024-12-31', seed=0)])
+    collega_archivio(percorso)
+    return percorso
+
+
+def test_storico_previsione_fuori_dalla_finestra(tmp_path):
+    percorso = crea_archivio(tmp_path)
+    iniziale = finestra_iniziale(percorso, 365)
+    riferimento = riferimento_storico(iniziale, percorso, '2021-06-30', 365)
+    assert giorni_finestra(riferimento) == (pd.Timestamp('2020-07-01'), pd.Timestamp('2021-06-30'))
+    previsione = calcola_previsione(riferimento["id"], riferimento["versione"], '2021-06-30')
+    assert len(previsione.storico) == 365
+    assert previsione.previsione['Data'].iloc[0] == pd.Timestamp('2021-07-01')
+
+
+def test_storico_previsione_nella_finestra(tmp_path):
+    percorso = crea_archivio(tmp_path)
+    iniziale = finestra_iniziale(percorso, 365)
+    assert riferimento_storico(iniziale, percorso, '2024-12-31', 365) == iniziale
+    # Senza limite di giorni lo storico parte dall'inizio dell'archivio
+    primo, _ = apri_archivio(percorso).periodo()
+    assert giorni_finestra(riferimento_storico(iniziale, percorso, '2022-03-31'))[0] == primo
+
+
+def test_finestra_limitata(tmp_path, monkeypatch):
+    from app import archivio
+
+    percorso = crea_archivio(tmp_path)
+    monkeypatch.setattr(archivio, "MAX_GIORNI_FINESTRA", 100)
+    iniziale = finestra_iniziale(percorso, 365)
+    assert giorni_finestra(iniziale) == (pd.Timestamp('2024-09-23'), pd.Timestamp('2024-12-31'))
+    # Un periodo più lungo del limite è letto solo negli ultimi giorni
+    riferimento = archivio.riferimento_periodo(iniziale, percorso, '2021-01-01', '2022-12-31')
+    assert giorni_finestra(riferimento) == (pd.Timestamp('2022-09-23'), pd.Timestamp('2022-12-31'))
+    assert archivio.FinestreArchivio(percorso)(archivio.riferimento_finestra('2021-01-01', '2022-12-31')) is None
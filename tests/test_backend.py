@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.backend import BackendDuckDB, BackendPandas
+from app.dataset import registro
+from app.schema import espandi
+from app.utils import genera_dati
+
+pytest.importorskip("duckdb")
+
+FILTRI = [
+    ('2024-01-10', '2024-01-20', (75, 95)),
+    (None, None, None),
+    # Data finale senza orario: inclusa l'intera giornata
+    ('2024-01-05', '2024-01-05', None),
+    ('2024-01-05', '2024-01-06 12:00', None),
+    ('2030-01-01', None, (0, 100)),
+]
+
+
+@pytest.fixture(params=['D', 'h'], ids=['giornaliero', 'orario'])
+def riferimento(request):
+    df = genera_dati(inizio='2024-01-01', periodi=60 if request.param == 'D' else 24 * 30,
+                     frequenza=request.param, n_campi=3, seed=0)
+    return registro.registra(df)
+
+
+@pytest.mark.parametrize("filtro", FILTRI)
+def test_filtra_come_pandas(tmp_path, riferimento, filtro):
+    argomenti = (riferimento["id"], riferimento["versione"]) + filtro
+    atteso = espandi(BackendPandas().filtra(*argomenti))
+    duckdb_ = BackendDuckDB(cartella=str(tmp_path))
+    pd.testing.assert_frame_equal(duckdb_.filtra(*argomenti), atteso)
+    kpi_pandas, kpi_duckdb = BackendPandas().kpi(*argomenti), duckdb_.kpi(*argomenti)
+    assert all(np.isclose(kpi_pandas[k], kpi_duckdb[k], rtol=1e-9, equal_nan=True) for k in kpi_pandas)
+
+
+def test_fine_inclusa_con_dati_orari(tmp_path, riferimento):
+    filtrati = BackendDuckDB(cartella=str(tmp_path)).filtra(riferimento["id"], riferimento["versione"],
+                                                           '2024-01-05', '2024-01-05')
+    assert filtrati.index.min() == pd.Timestamp('2024-01-05')
+    assert filtrati.index.max().normalize() == pd.Timestamp('2024-01-05')
+
+
+def test_pulizia_file_parquet(tmp_path):
+    duckdb_ = BackendDuckDB(cartella=str(tmp_path), max_byte=1)
+    riferimenti = [registro.registra(genera_dati(inizio='2024-01-01', periodi=30, seed=seed)) for seed in range(3)]
+    for r in riferimenti:
+        duckdb_.filtra(r["id"], r["versione"])
+    # Resta solo l'ultimo file scritto; una versione eliminata viene riscritta alla richiesta
+    assert len(list(tmp_path.glob("*.parquet"))) == 1
+    pd.testing.assert_frame_equal(duckdb_.filtra(riferimenti[0]["id"], riferimenti[0]["versione"]),
+                                  espandi(registro.carica(riferimenti[0])))
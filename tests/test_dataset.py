@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+from dash.exceptions import PreventUpdate
+
+from app.dataset import RegistroDataset, DatasetNonTrovato, registro
+from app.schema import espandi
+from app.utils import genera_dati
+
+
+def dati(seed=0):
+    return genera_dati(inizio='2024-01-01', periodi=60, seed=seed)
+
+
+@pytest.fixture
+def contesto_callback():
+    # Contesto di una richiesta Dash senza input scatenanti; set_props scrive in updated_props
+    contesto = AttributeDict(triggered_inputs=[], args_grouping=[], outputs_list=[], updated_props={})
+    context_value.set(contesto)
+    return contesto
+
+
+def test_dataset_espulso_letto_dal_disco(tmp_path):
+    registro_prova = RegistroDataset(max_elementi=1, cartella_spill=str(tmp_path))
+    primo = registro_prova.registra(dati(0))
+    registro_prova.registra(dati(1))
+    assert list(tmp_path.iterdir())
+    pd.testing.assert_frame_equal(espandi(registro_prova.carica(primo)).reset_index(drop=True), dati(0))
+
+
+def test_dataset_espulso_senza_disco():
+    registro_prova = RegistroDataset(max_elementi=1, cartella_spill=None)
+    primo = registro_prova.registra(dati(0))
+    registro_prova.registra(dati(1))
+    with pytest.raises(DatasetNonTrovato):
+        registro_prova.carica(primo)
+
+
+def test_callback_con_riferimento_espulso(monkeypatch, contesto_callback):
+    from app import callbacks
+    from app.components import riferimento_iniziale
+
+    # Registro senza livello su disco: il riferimento della pagina non è più recuperabile
+    monkeypatch.setattr(registro, "cartella_spill", None)
+    monkeypatch.setattr(registro, "max_elementi", 1)
+    riferimento = registro.registra(dati(0))
+    registro.registra(dati(1))
+    with pytest.raises(PreventUpdate):
+        callbacks.aggiorna_kpi(riferimento, '2024-01-01', '2024-02-29', [70, 100])
+    aggiornati = contesto_callback.updated_props
+    assert aggiornati["store-data"]["data"] == riferimento_iniziale()
+    assert aggiornati["avviso-dataset"]["children"].color == "warning"
+
+
+def test_callback_con_riferimento_espulso_su_disco(tmp_path, monkeypatch, contesto_callback):
+    from app import callbacks
+
+    monkeypatch.setattr(registro, "cartella_spill", str(tmp_path))
+    monkeypatch.setattr(registro, "max_elementi", 1)
+    riferimento = registro.registra(dati(0))
+    registro.registra(dati(1))
+    schede = callbacks.aggiorna_kpi(riferimento, '2024-01-01', '2024-02-29', [70, 100])
+    assert schede and not contesto_callback.updated_props
+
+
+def test_pulizia_versioni_superate(tmp_path):
+    registro_prova = RegistroDataset(max_elementi=1, cartella_condivisa=str(tmp_path))
+    altro = registro_prova.registra(dati(5))
+    versioni = [registro_prova.registra(dati(0))]
+    for seed, inizio in ((1, '2024-03-01'), (2, '2024-03-02')):
+        versioni.append(registro_prova.aggiungi(versioni[-1], genera_dati(inizio=inizio, periodi=1, seed=seed)))
+    assert len(list(tmp_path.iterdir())) == 4
+    # Spazio per due file: si eliminano le versioni superate, non il dataset meno recente
+    registro_prova.max_byte_spill = 2 * max(p.stat().st_size for p in tmp_path.iterdir())
+    registro_prova._pota()
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        f"{riferimento['id']}-{riferimento['versione']}.arrow" for riferimento in (altro, versioni[-1]))
+    with pytest.raises(DatasetNonTrovato):
+        registro_prova.carica(versioni[0])
+    registro_prova.carica(altro)
+    assert registro_prova.ultima_versione(versioni[0]) == versioni[-1]
+
+
+def test_pulizia_entro_il_limite(tmp_path):
+    registro_prova = RegistroDataset(max_elementi=1, cartella_spill=str(tmp_path))
+    riferimenti = [registro_prova.registra(dati(seed)) for seed in range(4)]
+    dimensione = max(p.stat().st_size for p in tmp_path.iterdir())
+    # Limite di due file: i dataset espulsi meno recenti vengono eliminati
+    registro_prova.max_byte_spill = 2 * dimensione
+    for seed in range(4, 7):
+        riferimenti.append(registro_prova.registra(dati(seed)))
+    assert sum(p.stat().st_size for p in tmp_path.iterdir()) <= 2 * dimensione
+    registro_prova.carica(riferimenti[-2])
+    with pytest.raises(DatasetNonTrovato):
+        registro_prova.carica(riferimenti[0])
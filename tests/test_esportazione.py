@@ -0,0 +1,36 @@
+import pytest
+
+from app.dataset import registro
+from app.esportazione import PERCORSO_DOWNLOAD, url_download
+from app.utils import genera_dati
+
+
+@pytest.fixture(scope="module")
+def client():
+    import app.main
+
+    return app.main.app.server.test_client()
+
+
+def test_download_dati(client):
+    riferimento = registro.registra(genera_dati(periodi=30, seed=0))
+    risposta = client.get(url_download(riferimento, '2024-01-05', '2024-01-10'))
+    assert risposta.status_code == 200
+    assert len(risposta.get_data().decode('utf-8-sig').splitlines()) == 7
+
+
+@pytest.mark.parametrize("parametri", [
+    "id=../../etc/passwd&versione=1",
+    "id=0123456789abcdef0123456789abcdef",
+    "id=0123456789abcdef0123456789abcdef&versione=x",
+    "id=0123456789abcdef0123456789abcdef&versione=0",
+    "id=archivio-20240101-20241399&versione=1",
+    "id=archivio-20241231-20240101&versione=1",
+    "id=archivio-19000101-21001231&versione=1",
+])
+def test_download_parametri_non_validi(client, parametri):
+    assert client.get(f"{PERCORSO_DOWNLOAD}?{parametri}").status_code == 400
+
+
+def test_download_dataset_assente(client):
+    assert client.get(f"{PERCORSO_DOWNLOAD}?id=0123456789abcdef0123456789abcdef&versione=1").status_code == 404
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from app.dataset import registro
+from app.previsione import COLONNA_PREVISTA, MIN_GIORNI_STAGIONALI, calcola_previsione
+from app.utils import genera_dati
+
+
+@pytest.fixture(scope="module")
+def riferimento():
+    return registro.registra(genera_dati(inizio='2024-01-01', periodi=365, seed=0))
+
+
+@pytest.mark.parametrize("modello", ["sarima", "holt-winters"])
+@pytest.mark.parametrize("fine", ["2024-01-02", "2024-01-03", "2024-06-30"])
+def test_storico_breve_usa_il_modello_lineare(riferimento, modello, fine):
+    lineare = calcola_previsione(riferimento["id"], riferimento["versione"], fine, 'lineare')
+    stagionale = calcola_previsione(riferimento["id"], riferimento["versione"], fine, modello)
+    assert len(stagionale.storico) < MIN_GIORNI_STAGIONALI
+    assert stagionale.previsione.equals(lineare.previsione)
+
+
+def test_storico_lungo_usa_il_modello_scelto(riferimento):
+    lineare = calcola_previsione(riferimento["id"], riferimento["versione"], '2024-11-30', 'lineare')
+    sarima = calcola_previsione(riferimento["id"], riferimento["versione"], '2024-11-30', 'sarima')
+    assert len(sarima.storico) >= MIN_GIORNI_STAGIONALI
+    assert not np.allclose(sarima.previsione[COLONNA_PREVISTA], lineare.previsione[COLONNA_PREVISTA])
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from app.utils import genera_dati, genera_dati_a_blocchi
+
+
+def test_genera_dati_parametri_predefiniti():
+    df = genera_dati(seed=0)
+    assert len(df) == 365
+    assert df['Data'].iloc[0] == pd.Timestamp('2024-01-01')
+    assert len(genera_dati(frequenza='h', seed=0)) == 365 * 24
+
+
+def test_irrigazione_da_precipitazioni_arrotondate():
+    # La soglia di 3 mm si applica al valore arrotondato delle precipitazioni (come nel generatore originale)
+    df = genera_dati(inizio='2020-01-01', fine='2024-12-31', n_campi=4, seed=1)
+    estate = df['Data'].dt.month.between(6, 9)
+    assert (df.loc[estate & (df['Precipitazioni (mm)'] >= 3), 'Irrigazione (mm)'] == 0).all()
+    assert (df.loc[estate & (df['Precipitazioni (mm)'] < 3), 'Irrigazione (mm)'] >= 5).all()
+
+
+def test_blocchi_come_genera_dati():
+    atteso = genera_dati(inizio='2024-01-01', periodi=700, n_campi=3, seed=2)
+    blocchi = pd.concat(genera_dati_a_blocchi(inizio='2024-01-01', periodi=700, n_campi=3, seed=2,
+                                              periodi_per_chunk=128, campi_per_chunk=2))
+    blocchi = blocchi.sort_values(['Data', 'Campo'], kind='mergesort').reset_index(drop=True)
+    pd.testing.assert_frame_equal(blocchi, atteso)
+    assert np.isfinite(atteso['Quantità raccolto (kg)']).all()
@@ -2,8 +2,11 @@ import dash_bootstrap_components as dbc
 from dash import html
 import numpy as np
 import pandas as pd
+import os
 import time
 
+from app.alert import maschere_alert, alert_da_maschere
+
 
 # Palette colori centralizzata
 PALETTE_COLORI = {
@@ -19,58 +22,95 @@ PALETTE_COLORI = {
 
 
 
-def genera_dati_simulati(seed=None):
-    if seed is None:
-        seed = int(time.time())
-    np.random.seed(seed)
-    # 1) Range di date per un anno
-    date_range = pd.date_range(start='2024-01-01', periods=365, freq='D')
-    day_of_year = date_range.dayofyear.to_numpy()
-    month_of_year = date_range.month
+# Raccolta estiva-autunnale (giugno-ottobre), ridotta in altri mesi.
+# Indicizzato per numero di mese (l'elemento 0 non è usato).
+FATTORE_RACCOLTA_MENSILE = np.array([0.0, 0.2, 0.2, 0.2, 0.2, 0.4, 0.8, 1.0, 1.0, 0.8, 0.6, 0.2, 0.0])
+
+# Durata di un periodo in giorni per le frequenze supportate
+DURATA_PERIODO = {"D": 1.0, "h": 1 / 24}
+
+# Ogni (campo, blocco di periodi) ha il proprio generatore casuale: lo stesso seed
+# produce gli stessi valori indipendentemente da come il dataset è suddiviso in chunk.
+PERIODI_PER_BLOCCO_SEED = 512
+N_NORMALI = 5
+N_UNIFORMI = 7
+
+
+def _estrai_casuali(seed, campi, inizio_periodo, n_periodi):
+    # Riempimento per campo (righe contigue), restituito come (…, periodi, campi)
+    normali = np.empty((N_NORMALI, len(campi), n_periodi))
+    esponenziali = np.empty((len(campi), n_periodi))
+    uniformi = np.empty((N_UNIFORMI, len(campi), n_periodi))
+    fine_periodo = inizio_periodo + n_periodi
+    primo_blocco = inizio_periodo // PERIODI_PER_BLOCCO_SEED
+    ultimo_blocco = (fine_periodo - 1) // PERIODI_PER_BLOCCO_SEED
+    for j, campo in enumerate(campi):
+        for blocco in range(primo_blocco, ultimo_blocco + 1):
+            rng = np.random.default_rng([seed, int(campo), blocco])
+            n = rng.standard_normal((N_NORMALI, PERIODI_PER_BLOCCO_SEED))
+            e = rng.standard_exponential(PERIODI_PER_BLOCCO_SEED)
+            u = rng.random((N_UNIFORMI, PERIODI_PER_BLOCCO_SEED))
+            # Intersezione tra il blocco e l'intervallo richiesto
+            origine = blocco * PERIODI_PER_BLOCCO_SEED
+            a = max(origine, inizio_periodo)
+            b = min(origine + PERIODI_PER_BLOCCO_SEED, fine_periodo)
+            normali[:, j, a - inizio_periodo:b - inizio_periodo] = n[:, a - origine:b - origine]
+            esponenziali[j, a - inizio_periodo:b - inizio_periodo] = e[a - origine:b - origine]
+            uniformi[:, j, a - inizio_periodo:b - inizio_periodo] = u[:, a - origine:b - origine]
+    return normali.swapaxes(1, 2), esponenziali.T, uniformi.swapaxes(1, 2)
+
+
+def _fattore_campo(seed, campi):
+    # Produttività del campo/appezzamento; il campo 1 è il frutteto di riferimento
+    return np.array([
+        1.0 if campo == 1 else np.random.default_rng([seed, int(campo)]).uniform(0.8, 1.2)
+        for campo in campi
+    ])
+
+
+def _simula(date_range, campi, seed, inizio_periodo, frequenza):
+    durata = DURATA_PERIODO[frequenza]
+    n_periodi = len(date_range)
+    normali, esponenziali, uniformi = _estrai_casuali(seed, campi, inizio_periodo, n_periodi)
+
+    def uniforme(i, basso, alto):
+        return basso + (alto - basso) * uniformi[i]
+
+    # Giorno dell'anno (frazionario per i dati orari) come colonna per il broadcasting
+    day_of_year = (date_range.dayofyear.to_numpy() + date_range.hour.to_numpy() / 24)[:, None]
+    month_of_year = date_range.month.to_numpy()[:, None]
+    fattore_campo = _fattore_campo(seed, campi)
     # 2) Temperature con effetto stagionale (inCampania)
     temperature_base = 16 + 8 * np.sin(2 * np.pi * (day_of_year - 80) / 365)
-    temperature_noise = np.random.normal(0, 2, len(date_range))
-    temperatura = np.round(temperature_base + temperature_noise, 1)
+    if frequenza == 'h':
+        # escursione termica giornaliera, massimo nel primo pomeriggio
+        temperature_base = temperature_base + 4 * np.sin(2 * np.pi * (day_of_year % 1 - 0.375))
+    temperatura = np.round(temperature_base + 2 * normali[0], 1)
     # Umidità
     umidita_base = 60 + 10 * np.sin(2 * np.pi * (day_of_year - 150) / 365)
-    umidita_noise = np.random.normal(0, 5, len(date_range))
-    umidita = np.round(np.clip(umidita_base + umidita_noise, 40, 80), 1)
-    # Precipitazioni stagionalita
-    precipitazioni_base = np.random.exponential(2, len(date_range))  # media ~2 mm
+    umidita = np.round(np.clip(umidita_base + 5 * normali[1], 40, 80), 1)
+    # Precipitazioni stagionalita (mm/giorno)
+    # (tassi giornalieri arrotondati prima di decidere irrigazione e resa, come nel generatore originale)
+    precipitazioni_base = 2 * esponenziali  # media ~2 mm
     seasonal_factor = 1 + 0.6 * np.sin(2 * np.pi * (day_of_year - 110) / 365)
     precipitazioni = np.round(precipitazioni_base * seasonal_factor, 1)
-    #  Ore di sole (5–12 ore)
+    #  Ore di sole (5–12 ore al giorno)
     sole_base = 7 + 5 * np.sin(2 * np.pi * (day_of_year - 80) / 365)
-    ore_sole = np.round(sole_base + np.random.normal(0, 1, len(date_range)), 1)
-    ore_sole = np.clip(ore_sole, 5, 12)
+    ore_sole = np.clip(np.round(sole_base + normali[2], 1), 5, 12)
     # Qualità del suolo
-    qualita_suolo = np.round(np.random.uniform(70, 100, len(date_range)), 1)
+    qualita_suolo = np.round(uniforme(0, 70, 100), 1)
     # pH del suolo
-    ph_suolo = np.round(np.random.normal(loc=6.5, scale=0.3, size=len(date_range)), 1)
+    ph_suolo = np.round(6.5 + 0.3 * normali[3], 1)
     #  Velocità  vento
-    velocita_vento = np.round(np.random.normal(loc=3, scale=1, size=len(date_range)), 1)
-    velocita_vento = np.clip(velocita_vento, 0, None)
+    velocita_vento = np.clip(np.round(3 + normali[4], 1), 0, None)
     #giugno-settembre si ricorre a irrigazione se precipitazion < 3 mm
-    irrigazione = np.where(
+    irrigazione = np.round(np.where(
         (precipitazioni < 3) & ((month_of_year >= 6) & (month_of_year <= 9)),
-        np.random.uniform(5, 15, len(date_range)),
+        uniforme(1, 5, 15),
         0
-    )
-    irrigazione = np.round(irrigazione, 1)
-    # evento estremo < 2°C o > 35°C, pH fuori range, vento > 8 m/s
-    evento_estremo = np.where(
-        (temperatura < 2) | (temperatura > 35) |
-        (ph_suolo < 5.8) | (ph_suolo > 7.8) |
-        (velocita_vento > 8),
-        1, 0
-    )
-    # Raccolta estiva-autunnale (giugno-ottobre), ridotta in altri mesi.
-    fattore_raccolta_mensile = {
-        1: 0.2, 2: 0.2, 3: 0.2, 4: 0.2, 5: 0.4,
-        6: 0.8, 7: 1.0, 8: 1.0, 9: 0.8, 10: 0.6,
-        11: 0.2, 12: 0.0
-    }
-    raccolta_factor = np.array([fattore_raccolta_mensile[m] for m in month_of_year])
+    ), 1)
+    # Stagionalità di raccolta tramite lookup vettoriale per mese
+    raccolta_factor = FATTORE_RACCOLTA_MENSILE[month_of_year]
     # Fattore temperatura
     temperatura_ottimale = 20
     temp_factor = 1 - np.abs(temperatura - temperatura_ottimale) / 20
@@ -81,53 +121,106 @@ def genera_dati_simulati(seed=None):
     #  se non piove e non si irriga abbastanza, resa ridotta
     irrigazione_factor = np.where((precipitazioni < 3) & (irrigazione < 5), 0.7, 1)
     # Fattore casuale
-    random_factor = np.random.uniform(0.9, 1.1, len(date_range))
+    random_factor = uniforme(2, 0.9, 1.1)
     # kg al giorno
     produzione_base = 15  # fattore di scala per un frutteto medio
     produzione = (ore_sole * temp_factor * (qualita_suolo / 100) * random_factor * produzione_base -
-                  precipitazioni * np.random.uniform(0.2, 0.7, len(date_range)))
-    # Applica i fattori aggiuntivi e la stagionalità di raccolta
-    produzione *= ph_factor * vento_factor * irrigazione_factor * raccolta_factor
-    quantita_raccolto = np.round(np.clip(produzione, 0, None), 1)
+                  precipitazioni * uniforme(3, 0.2, 0.7))
+    # Applica i fattori aggiuntivi, la stagionalità di raccolta e la produttività del campo
+    produzione *= ph_factor * vento_factor * irrigazione_factor * raccolta_factor * fattore_campo
+    # Le grandezze cumulate sono tassi giornalieri: si riportano alla durata del periodo
+    precipitazioni = np.round(precipitazioni * durata, 1)
+    ore_sole = np.round(ore_sole * durata, 1)
+    irrigazione = np.round(irrigazione * durata, 1)
+    quantita_raccolto = np.round(np.clip(produzione * durata, 0, None), 1)
     # Costo di produzione base: 0.40–1.20 €/kg (manodopera, fertilizzanti, trattamenti)
-    costo_produzione = np.round(np.random.uniform(0.40, 1.20, len(date_range)) * quantita_raccolto, 2)
+    costo_produzione = np.round(uniforme(4, 0.40, 1.20) * quantita_raccolto, 2)
     # Costo irrigazione aggiuntivo in base ai mm d'acqua
-    costo_irrigazione = np.round(irrigazione * np.random.uniform(0.1, 0.3, len(date_range)), 2)
+    costo_irrigazione = np.round(irrigazione * uniforme(5, 0.1, 0.3), 2)
     costo_totale = costo_produzione + costo_irrigazione
     # Prezzo di vendita medio
-    prezzo_vendita = np.random.uniform(1.5, 3.0, len(date_range))
+    prezzo_vendita = uniforme(6, 1.5, 3.0)
     ricavi = quantita_raccolto * prezzo_vendita
     profitto_stimato = np.round(ricavi - costo_totale, 2)
-    alert = np.where(
-        (evento_estremo == 1) |
-        (qualita_suolo < 70) |
-        (temperatura < 10) |
-        (temperatura > 35) |
-        (umidita < 45),
-        'Attenzione',
-        'OK'
-    )
-    # ---- DataFrame Finale ----
+    # Alert se almeno una categoria (temperatura, pH, vento, umidità, suolo) è fuori soglia;
+    # le stesse maschere (alert.py) forniscono i conteggi per categoria nella dashboard
+    alert = alert_da_maschere(maschere_alert(temperatura, umidita, qualita_suolo, ph_suolo, velocita_vento))
+    # ---- DataFrame Finale (long format) ----
     data = pd.DataFrame({
-        'Data': date_range,
-        'Temperatura (°C)': temperatura,
-        'Umidità suolo (%)': umidita,
-        'Precipitazioni (mm)': precipitazioni,
-        'Ore sole (h)': ore_sole,
-        'Qualità suolo (%)': qualita_suolo,
-        'pH suolo': ph_suolo,
-        'Velocità vento (m/s)': velocita_vento,
-        'Irrigazione (mm)': irrigazione,
-        'Quantità raccolto (kg)': quantita_raccolto,
-        'Costo produzione (€)': costo_produzione,
-        'Costo irrigazione (€)': costo_irrigazione,
-        'Profitto stimato (€)': profitto_stimato,
-        'Alert': alert
+        'Data': np.repeat(date_range.to_numpy(), len(campi)),
+        'Campo': np.tile(campi, n_periodi),
+        'Temperatura (°C)': temperatura.ravel(),
+        'Umidità suolo (%)': umidita.ravel(),
+        'Precipitazioni (mm)': precipitazioni.ravel(),
+        'Ore sole (h)': ore_sole.ravel(),
+        'Qualità suolo (%)': qualita_suolo.ravel(),
+        'pH suolo': ph_suolo.ravel(),
+        'Velocità vento (m/s)': velocita_vento.ravel(),
+        'Irrigazione (mm)': irrigazione.ravel(),
+        'Quantità raccolto (kg)': quantita_raccolto.ravel(),
+        'Costo produzione (€)': costo_produzione.ravel(),
+        'Costo irrigazione (€)': costo_irrigazione.ravel(),
+        'Profitto stimato (€)': profitto_stimato.ravel(),
+        'Alert': alert.ravel()
     })
 
     return data
 
 
+def _prepara_simulazione(inizio, fine, periodi, frequenza, seed):
+    if frequenza not in DURATA_PERIODO:
+        raise ValueError(f"Frequenza non supportata: {frequenza} (usa 'D' o 'h')")
+    if seed is None:
+        seed = int(time.time())
+    if fine is None and periodi is None:
+        # Senza data finale né numero di periodi: un anno di dati, come genera_dati_simulati
+        periodi = round(365 / DURATA_PERIODO[frequenza])
+    date_range = pd.date_range(start=inizio, end=fine, periods=periodi, freq=frequenza)
+    return date_range, seed
+
+
+def genera_dati(inizio='2024-01-01', fine=None, periodi=None, frequenza='D', n_campi=1, seed=None):
+    # Dataset in formato long: una riga per (Data, Campo), ordinato per data.
+    # Le grandezze sono calcolate su matrici (periodi x campi), senza cicli Python per riga.
+    date_range, seed = _prepara_simulazione(inizio, fine, periodi, frequenza, seed)
+    return _simula(date_range, np.arange(1, n_campi + 1), seed, 0, frequenza)
+
+
+def genera_dati_a_blocchi(inizio='2024-01-01', fine=None, periodi=None, frequenza='D', n_campi=1, seed=None,
+                          periodi_per_chunk=4 * PERIODI_PER_BLOCCO_SEED, campi_per_chunk=32):
+    # Versione in streaming di genera_dati: produce chunk (periodi x campi) di dimensione fissa.
+    # Concatenando i chunk e ordinando per (Data, Campo) si ottiene lo stesso risultato.
+    date_range, seed = _prepara_simulazione(inizio, fine, periodi, frequenza, seed)
+    for inizio_periodo in range(0, len(date_range), periodi_per_chunk):
+        chunk_date = date_range[inizio_periodo:inizio_periodo + periodi_per_chunk]
+        for primo_campo in range(1, n_campi + 1, campi_per_chunk):
+            campi = np.arange(primo_campo, min(primo_campo + campi_per_chunk, n_campi + 1))
+            yield _simula(chunk_date, campi, seed, inizio_periodo, frequenza)
+
+
+def scrivi_dati_parquet(cartella, **parametri):
+    # Scrive la simulazione chunk per chunk in Parquet partizionato per anno
+    # (cartella/anno=AAAA/parte-NNNNN.parquet): la memoria resta limitata a un chunk.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    righe = 0
+    for numero, chunk in enumerate(genera_dati_a_blocchi(**parametri)):
+        for anno, parte in chunk.groupby(chunk['Data'].dt.year, sort=True):
+            destinazione = os.path.join(cartella, f"anno={anno}")
+            os.makedirs(destinazione, exist_ok=True)
+            pq.write_table(pa.Table.from_pandas(parte, preserve_index=False),
+                           os.path.join(destinazione, f"parte-{numero:05d}.parquet"))
+        righe += len(chunk)
+    return righe
+
+
+def genera_dati_simulati(seed=None):
+    # Un anno di dati giornalieri per un singolo frutteto (colonne storiche, senza 'Campo')
+    data = genera_dati(inizio='2024-01-01', periodi=365, frequenza='D', n_campi=1, seed=seed)
+    return data.drop(columns='Campo')
+
+
 import dash_bootstrap_components as dbc
 from dash import html
 
@@ -0,0 +1,5 @@
+# Punto di ingresso per un server WSGI multi-processo, ad esempio (dalla cartella
+# che contiene il pacchetto app):  python -m gunicorn -c app/gunicorn.conf.py app.wsgi:server
+from app.main import app
+
+server = app.server